@@ -116,10 +116,116 @@ def binning(x, y,  dy=None, binwidth=None, r=None,newx= None, log = False, nan=F
 
 
 
-def uniform_tophat_mean(newx,x, y, dy=None,nan=False):
+def bin_index(newx, x):
+	"""Assigns each point of the old axis to a bin of the new axis 
+
+	Bins are centered on newx and extend halfway to the neighbouring points. The last 
+	bin has the same width as the one before it. A point is placed with np.searchsorted 
+	on the lower bin edges, so this is O(N log M) for N points and M bins. The 
+	zeroth bin is open on both ends, as in the original tophat rebinning. 
+
+	Parameters
+	----------
+	newx : list of float or numpy array of float
+	    New wavelength grid to rebin to, in ascending order
+	x : list of float or numpy array of float 
+	    Old wavelength grid to get rid of 
+
+	Returns
+	-------
+	index : array of int 
+	    bin of each point in x
+	valid : array of bool 
+	    False for points that do not fall in any bin 
+	"""
+	newx = np.asarray(newx, dtype=float)
+	x = np.asarray(x, dtype=float)
+	szmod = newx.shape[0]
+	delta = np.zeros(szmod)
+	delta[0:-1] = newx[1:]-newx[:-1]
+	if szmod > 1:
+		delta[szmod-1] = delta[szmod-2]
+	lo = np.zeros(szmod)
+	lo[1:] = newx[1:]-0.5*delta[:-1]
+	lo[0] = newx[0]-0.5*delta[0]
+	hi = newx+0.5*delta
+
+	index = np.searchsorted(lo, x, side='right')-1
+	valid = index >= 0
+	index[~valid] = 0
+	valid &= x < hi[index]
+	valid &= (index > 0) | (x > lo[0])
+	return index, valid
+
+def rebin(newx, x, y, how='sum', ignore_nan=False, index=None): 
+	"""Rebins y onto a new axis with np.bincount 
+
+	Parameters
+	----------
+	newx : list of float or numpy array of float
+	    New wavelength grid to rebin to, in ascending order
+	x : list of float or numpy array of float 
+	    Old wavelength grid to get rid of 
+	y : array of float 
+	    Ordinates to rebin. Can be 2d, in which case each row is rebinned 
+	how : str 
+	    (Optional) 'sum' of the points in each bin, 'mean' of the points in each bin 
+	    or 'quadrature' sum, sqrt(sum(y^2)), for errors. Default = 'sum'
+	ignore_nan : bool 
+	    (Optional) skip nan ordinates instead of returning nan for their bin. Default = False
+	index : tuple 
+	    (Optional) output of bin_index(newx, x), to reuse when rebinning several arrays 
+
+	Returns
+	-------
+	array of float 
+	    rebinned y, with the last axis the length of newx. Empty bins are 0 for 
+	    'sum' and 'quadrature' and nan for 'mean'
+
+	Examples
+	--------
+
+	>>> oldgrid = np.linspace(1,3,100)
+	>>> y = np.zeros(100)+10.0
+	>>> newy = rebin(np.linspace(2,3,3), oldgrid, y, how='mean')
+	>>> newy
+	array([ 10.,  10.,  10.])
+	"""
+	if how not in ['sum', 'mean', 'quadrature']:
+		raise Exception("Rebinning method must be 'sum', 'mean' or 'quadrature'")
+	nbin = len(newx)
+	if index is None:
+		index = bin_index(newx, x)
+	index, valid = index
+	y = np.asarray(y, dtype=float)
+	y2 = y.reshape(-1, y.shape[-1])
+	nrow = y2.shape[0]
+
+	#one bincount for all rows by offsetting each row's bins
+	rows = np.zeros(y2.shape, dtype=int) + np.arange(nrow)[:, None]*nbin
+	bins = rows + index[None, :]
+	keep = np.zeros(y2.shape, dtype=bool) + valid[None, :]
+	if ignore_nan:
+		keep &= ~np.isnan(y2)
+	bins = bins[keep]
+	vals = y2[keep]
+	if how == 'quadrature':
+		vals = vals**2.0
+
+	ynew = np.bincount(bins, weights=vals, minlength=nrow*nbin)
+	if how == 'quadrature':
+		ynew = np.sqrt(ynew)
+	elif how == 'mean':
+		count = np.bincount(bins, minlength=nrow*nbin)
+		with np.errstate(divide='ignore', invalid='ignore'):
+			ynew = ynew/count
+		ynew[count == 0] = np.nan
+	return ynew.reshape(y.shape[:-1] + (nbin,))
+
+def uniform_tophat_sum(newx,x, y):
 	"""Adapted from Mike R. Line to rebin spectra
 
-	Takes mean of groups of points in certain wave bin 
+	Sums groups of points in certain wave bin 
 
 	Parameters
 	----------
@@ -133,59 +239,77 @@ def uniform_tophat_mean(newx,x, y, dy=None,nan=False):
 	Returns
 	-------
 	array of floats 
-	    new wavelength grid 
-	    
+	    new y axis 
+
 	Examples 
 	--------
-	    
-	>>> from pandexo.engine.jwst import uniform_tophat_sum
+
+	>>> from pandexo.engine.bintools import uniform_tophat_sum
 	>>> oldgrid = np.linspace(1,3,100)
 	>>> y = np.zeros(100)+10.0
 	>>> newy = uniform_tophat_sum(np.linspace(2,3,3), oldgrid, y)
 	>>> newy
 	array([ 240.,  250.,  130.])
 	"""
+	return rebin(newx, x, y, how='sum')
+
+def uniform_tophat_mean(newx,x, y, dy=None,nan=False):
+	"""Adapted from Mike R. Line to rebin spectra
+
+	Takes mean of groups of points in certain wave bin 
+
+	Parameters
+	----------
+	newx : list of float or numpy array of float
+	    New wavelength grid to rebin to 
+	x : list of float or numpy array of float 
+	    Old wavelength grid to get rid of 
+	y : list of float or numpy array of float 
+	    New rebinned y axis 
+	dy : array,float
+	    (Optional) errors on ordinates, can be float or array
+	nan : bool
+	    (Optional) if true, this returns nan values where no points exist in a given bin
+	    Otherwise, all nans are dropped 
+
+	Returns
+	-------
+	bin_x, bin_y, bin_dy, bin_n 
+	    new wavelength grid, binned y, error on binned y (sqrt(sum(dy^2))/n), number of 
+	    points in each bin 
+
+	Examples 
+	--------
+
+	>>> oldgrid = np.linspace(1,3,100)
+	>>> y = np.zeros(100)+10.0
+	>>> bin_x, bin_y, bin_dy, bin_n = uniform_tophat_mean(np.linspace(2,3,3), oldgrid, y)
+	>>> bin_y
+	array([ 10.,  10.,  10.])
+	"""
 	newx = np.array(newx)
-	szmod=newx.shape[0]
-	delta=np.zeros(szmod)
-	ynew=np.zeros(szmod)
-	bin_dy =np.zeros(szmod)
-	bin_n =np.zeros(szmod)
-
-	delta[0:-1]=newx[1:]-newx[:-1]  
-	delta[szmod-1]=delta[szmod-2] 
-    
-	for i in range(szmod-1):
-		i=i+1
-		loc=np.where((x >= newx[i]-0.5*delta[i-1]) & (x < newx[i]+0.5*delta[i]))
-		#make sure there are values within the slice 
-		if len(loc[0]) > 0:
-			ynew[i]=np.mean(y[loc])
-			if dy is not None: 
-				bin_dy[i] = np.sqrt(np.sum(dy[loc]**2.0))/len(y[loc])
-			bin_n[i] = len(y[loc])
-		#if not give empty slice a nan
-		elif len(loc[0]) is 0 : 
-			warn.warn(UserWarning("Empty slice exists within specified new x, replacing value with nan"))
-			ynew[i]=np.nan
-			bin_n[i] = np.nan 
-
-	#fill in zeroth entry
-	loc=np.where((x > newx[0]-0.5*delta[0]) & (x < newx[0]+0.5*delta[0]))
-	if len(loc[0]) > 0: 
-		ynew[0]=np.mean(y[loc])
-		bin_n[0] = len(y[loc])
-		if dy is not None: 
-			bin_dy[0] = np.sqrt(np.sum(dy[loc]**2.0))/len(y[loc])
-	elif len(loc[0]) is 0 : 
-		ynew[0]=np.nan
-		bin_n[0] = np.nan
-		if dy is not None:
-			bin_dy[0] = np.nan 
-	
+	index = bin_index(newx, x)
+
+	ynew = rebin(newx, x, y, how='mean', index=index)
+	bin_n = rebin(newx, x, np.ones(len(x)), how='sum', index=index)
+	if dy is not None: 
+		dy = np.zeros(len(x)) + dy
+		bin_dy = rebin(newx, x, dy, how='quadrature', index=index)/bin_n
+	else: 
+		bin_dy = np.zeros(len(newx))
+
+	empty = bin_n == 0 
+	if empty[1:].any():
+		warn.warn(UserWarning("Empty slice exists within specified new x, replacing value with nan"))
+	bin_n[empty] = np.nan 
+	#errors on empty bins are only flagged for the zeroth bin
+	bin_dy[1:][empty[1:]] = 0.0
+	if empty[0] and (dy is not None): 
+		bin_dy[0] = np.nan
+
 	#remove nans if requested
 	out = pd.DataFrame({'bin_y':ynew, 'bin_x':newx, 'bin_dy':bin_dy, 'bin_n':bin_n})
-	if ~nan:
+	if not nan:
 		out = out.dropna()
 
 	return out['bin_x'].values,out['bin_y'].values, out['bin_dy'].values, out['bin_n'].values
@@ -193,6 +317,12 @@ def uniform_tophat_mean(newx,x, y, dy=None,nan=False):
 def bin_wave_to_R(w, R):
 	"""Creates new wavelength axis at specified resolution
 
+	Steps through the wavelength axis. Where the native resolution is coarser than R 
+	the native points are kept, otherwise the new point is placed halfway to the first 
+	point that reaches resolution R. Each step is found with np.searchsorted on the 
+	constant R threshold w*R/(R-1), so this is fast on high resolution model grids. 
+	w should be sorted in ascending order. 
+
 	Parameters
 	----------
 	w : list of float or numpy array of float
@@ -202,7 +332,7 @@ def bin_wave_to_R(w, R):
 
 	Returns
 	-------
-	list of float
+	array of float
 	    New wavelength axis at specified resolution
 
 	Examples
@@ -212,32 +342,55 @@ def bin_wave_to_R(w, R):
 	>>> print((len(newwave)))
 	11
 	"""
-	wave = []
-	tracker = min(w)
-	i = 1 
-	ind= 0
-	firsttime = True
-	while(tracker<max(w)):
-	    if i <len(w)-1:
-	        dlambda = w[i]-w[ind]
-	        newR = w[i]/dlambda
-	        if (newR < R) & (firsttime):
-	            tracker = w[ind]
-	            wave += [tracker]
-	            ind += 1
-	            i += 1 
-	            firsttime = True
-	        elif newR < R:
-	            tracker = w[ind]+dlambda/2.0
-	            wave +=[tracker]
-	            ind = (np.abs(w-tracker)).argmin()
-	            i = ind+1
-	            firsttime = True
-	        else:
-	            firsttime = False            
-	            i+=1    
-	    else:
-	        tracker = max(w)
-	        wave += [tracker]
-	return wave
+	w = np.asarray(w, dtype=float)
+	n = len(w)
+	wmax = w.max()
+	if not w.min() < wmax:
+		return np.array([])
+	last = n - 1
+	with np.errstate(divide='ignore', invalid='ignore'):
+		#resolution of each native step is coarser than R
+		coarse = w[1:]/(w[1:]-w[:-1]) < R
+		if R > 1:
+			thresh = w*R/(R-1.0)
+		else: 
+			thresh = np.zeros(n) + np.inf 
+
+	def reaches_R(i, ind):
+		with np.errstate(divide='ignore', invalid='ignore'):
+			return w[i]/(w[i]-w[ind]) < R
 
+	wave = []
+	ind = 0 
+	while True: 
+		if ind + 1 >= last:
+			wave += [wmax]
+			break
+		if coarse[ind]:
+			#keep all native points until the grid is finer than R
+			steps = coarse[ind:last-1]
+			run = len(steps) if steps.all() else np.argmin(steps)
+			wave += list(w[ind:ind+run])
+			ind += run
+			continue
+		#first point past ind+1 that reaches resolution R 
+		i = max(np.searchsorted(w, thresh[ind], side='right'), ind+2)
+		while (i > ind+2) and reaches_R(i-1, ind):
+			i -= 1
+		while (i < last) and not reaches_R(i, ind):
+			i += 1
+		if i >= last:
+			wave += [wmax]
+			break
+		tracker = w[ind] + (w[i]-w[ind])/2.0
+		wave += [tracker]
+		#nearest native point to the new one (lowest index on ties)
+		j = np.searchsorted(w, tracker, side='left')
+		lo = np.searchsorted(w, w[j-1], side='left')
+		if (j < n) and (w[j]-tracker < tracker-w[j-1]):
+			newind = j
+		else: 
+			newind = lo
+		#always move forward (e.g. repeated wavelengths)
+		ind = max(newind, ind+1)
+	return np.array(wave)
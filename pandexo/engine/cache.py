@@ -0,0 +1,388 @@
+import os
+import json
+import time
+import pickle
+import hashlib
+import logging
+import numpy as np
+from copy import deepcopy
+from collections import OrderedDict
+
+#bump this whenever the format of the output dictionary changes so that
+#stale results are never served from an old cache
+cache_version = 1
+
+#default maximum size of the on disk cache in MB
+default_cache_size = 1024.0
+
+#eviction frees space down to this fraction of the maximum size, so that the
+#next results stored don't trigger another walk of the cache right away
+evict_to = 0.9
+
+#files counted against the size of the cache: results, ArrayStore entries and
+#Fortney grid tables
+cache_files = ('.p', '.npz', '.npy')
+
+#keys in the input dictionaries which point to files on disk. the contents of
+#these files are part of the simulation so their size and mtime go in the key
+file_keys = ['starpath', 'exopath', 'noise_floor']
+
+#observation keys which only change how a run is done, not its result. share_probe
+#is not one of them, the probe run leaves out Pandeia's out of transit SNR products
+run_keys = ['profile']
+
+log = logging.getLogger(__name__)
+
+#estimated size in bytes of the files under each cache root, so that the cache
+#is only walked when it may be over its limit (see ResultCache.evict)
+_root_sizes = {}
+
+def cache_dir(sub=''):
+    """Location of the PandExo cache
+
+    The cache is turned on by setting the environment variable PANDEXO_CACHE
+    to a directory. If it is not set, this returns None and no caching is done.
+
+    Parameters
+    ----------
+    sub : str
+        (Optional) subdirectory within the cache (e.g. 'results')
+
+    Returns
+    -------
+    str or None
+        path to the (created) cache directory
+    """
+    root = os.environ.get('PANDEXO_CACHE')
+    if root is None:
+        return None
+    path = os.path.join(root, sub)
+    if not os.path.exists(path):
+        try:
+            os.makedirs(path)
+        except OSError:
+            #another worker beat us to it
+            if not os.path.isdir(path):
+                raise
+    return path
+
+def _to_json(obj):
+    """Converts the objects that show up in PandExo inputs into something json can hash
+    """
+    if isinstance(obj, np.ndarray):
+        return obj.tolist()
+    if isinstance(obj, np.generic):
+        return obj.item()
+    return str(obj)
+
+def normalize_input(dictinput):
+    """Normalizes input dictionary for hashing
+
+    Makes a copy of the {"pandeia_input":dict1, "pandexo_input":dict1} input with
+    the SED removed from the pandeia scene (this is always overwritten by
+    **compute_full_sim**), without the observation flags in `run_keys` (e.g. 
+    profile, which the web server turns on with --profiling) and with the size and 
+    modification time added for any input files, so that editing a planet file 
+    invalidates the cached result.
+
+    Parameters
+    ----------
+    dictinput : dict
+        dictionary containing instrument parameters and exoplanet specific
+        parameters. {"pandeia_input":dict1, "pandexo_input":dict1}
+
+    Returns
+    -------
+    dict
+        normalized copy of the input
+    """
+    norm = {'pandeia_input': deepcopy(dictinput['pandeia_input']),
+            'pandexo_input': deepcopy(dictinput['pandexo_input'])}
+
+    for scene in norm['pandeia_input'].get('scene', []):
+        try:
+            scene['spectrum']['sed'].pop('spectrum', None)
+        except (KeyError, AttributeError):
+            pass
+
+    observation = norm['pandexo_input'].get('observation')
+    if isinstance(observation, dict):
+        for key in run_keys:
+            observation.pop(key, None)
+
+    files = {}
+    for level in norm['pandexo_input'].values():
+        if not isinstance(level, dict):
+            continue
+        for key in file_keys:
+            path = level.get(key)
+            if isinstance(path, str) and os.path.isfile(path):
+                stat = os.stat(path)
+                files[os.path.abspath(path)] = [stat.st_size, stat.st_mtime]
+    norm['files'] = files
+    norm['cache_version'] = cache_version
+    #stellar normalization method, see create_input.norm_method
+    norm['norm_method'] = os.environ.get('PANDEXO_NORM', 'pysynphot')
+    return norm
+
+def input_hash(dictinput):
+    """Stable hash of a PandExo input dictionary
+
+    Parameters
+    ----------
+    dictinput : dict
+        dictionary containing instrument parameters and exoplanet specific
+        parameters. {"pandeia_input":dict1, "pandexo_input":dict1}
+
+    Returns
+    -------
+    str
+        sha256 hex digest of the normalized input
+
+    Examples
+    --------
+
+    >>> key = input_hash({"pandeia_input": pandeiadict, "pandexo_input":exodict})
+    """
+    norm = json.dumps(normalize_input(dictinput), sort_keys=True, default=_to_json)
+    return hashlib.sha256(norm.encode()).hexdigest()
+
+class ResultCache():
+    """On disk, content addressed cache of PandExo results
+
+    Results are pickled to one file per input hash. Hits bump the modification
+    time of the file, so that when the cache grows beyond its size limit the
+    least recently used results are removed first. The size limit covers every
+    file under root, so the .npz files of `ArrayStore` and the Fortney .npy tables
+    are counted and evicted along with the results. Files are written to a temporary
+    name and then moved into place, so several workers can share the same cache.
+    The size of the cache is walked once per process and then estimated by adding
+    the size of every stored result. Only when the estimate goes over max_size is
+    the cache walked again to evict files (and to count what other workers added).
+
+    Note that the random noise in `spectrum_w_rand` is part of the stored result,
+    so a cache hit returns the same noise realization as the original run.
+
+    Parameters
+    ----------
+    path : str
+        directory to store the results in
+    max_size : float
+        (Optional) maximum size of the cache in MB. Default is 1024 MB
+    root : str
+        (Optional) directory whose files count against max_size. Default is path
+
+    Methods
+    -------
+    get
+        returns cached result or None
+    put
+        stores a result
+    evict
+        removes least recently used results until cache is below max_size
+    run
+        returns cached result or runs function and caches it
+    """
+    def __init__(self, path, max_size=default_cache_size, root=None):
+        self.path = path
+        self.root = path if root is None else root
+        self.max_size = float(max_size)*1024.0**2
+
+    @classmethod
+    def from_env(cls):
+        """Builds cache from PANDEXO_CACHE and PANDEXO_CACHE_SIZE (MB) environment variables
+
+        Returns
+        -------
+        ResultCache or None
+            None if PANDEXO_CACHE is not set
+        """
+        path = cache_dir('results')
+        if path is None:
+            return None
+        return cls(path, max_size=os.environ.get('PANDEXO_CACHE_SIZE', default_cache_size),
+                   root=cache_dir())
+
+    def _file(self, key):
+        return os.path.join(self.path, key + '.p')
+
+    def get(self, key):
+        """Returns cached result for a given key or None if there is no result
+        """
+        fname = self._file(key)
+        try:
+            with open(fname, 'rb') as f:
+                result = pickle.load(f)
+        except (IOError, OSError, EOFError, pickle.UnpicklingError):
+            return None
+        except (AttributeError, ImportError, ValueError, IndexError):
+            #pickled by a version of pandexo whose classes have moved
+            log.info("Ignoring stale cached result %s", key[0:8])
+            return None
+        try:
+            os.utime(fname, None)
+        except OSError:
+            pass
+        return result
+
+    def put(self, key, result):
+        """Stores result under key and evicts old results if the cache may be too big
+        """
+        fname = self._file(key)
+        tmp = fname + '.' + str(os.getpid()) + '.tmp'
+        with open(tmp, 'wb') as f:
+            pickle.dump(result, f, protocol=pickle.HIGHEST_PROTOCOL)
+            size = f.tell()
+        os.rename(tmp, fname)
+        if self.root not in _root_sizes:
+            self.evict()
+        else:
+            _root_sizes[self.root] += size
+            if _root_sizes[self.root] > self.max_size:
+                self.evict()
+
+    def evict(self):
+        """Removes least recently used files once the cache is bigger than max_size,
+        down to evict_to*max_size, and resets the size estimate of the cache
+        """
+        entries = []
+        for dirpath, dirnames, fnames in os.walk(self.root):
+            for fname in fnames:
+                #skip files other workers are still writing
+                if (not fname.endswith(cache_files)) or ('.tmp' in fname):
+                    continue
+                full = os.path.join(dirpath, fname)
+                try:
+                    stat = os.stat(full)
+                except OSError:
+                    continue
+                entries += [(stat.st_mtime, stat.st_size, full)]
+
+        total = sum(e[1] for e in entries)
+        if total <= self.max_size:
+            _root_sizes[self.root] = total
+            return
+        for mtime, size, full in sorted(entries):
+            if total <= evict_to*self.max_size:
+                break
+            try:
+                os.remove(full)
+            except OSError:
+                pass
+            total -= size
+        _root_sizes[self.root] = total
+
+    def run(self, func, dictinput):
+        """Returns cached result or calls func(dictinput) and caches the output
+
+        Parameters
+        ----------
+        func : function
+            simulation function, e.g. **pandexo.engine.jwst.compute_full_sim**
+        dictinput : dict
+            {"pandeia_input":dict1, "pandexo_input":dict1}
+
+        Returns
+        -------
+        dict
+            output of func
+        """
+        #hash before running, func edits dictinput in place
+        key = input_hash(dictinput)
+        result = self.get(key)
+        if result is not None:
+            log.info("Returning cached result %s", key[0:8])
+            #stage timers describe the original run, not this one
+            if not dictinput['pandexo_input'].get('observation', {}).get('profile', False):
+                result.pop('Profiling', None)
+            else:
+                result['Profiling'] = dict(result.get('Profiling', {}), cache_hit=True)
+            return result
+        start = time.time()
+        result = func(dictinput)
+        self.put(key, result)
+        log.info("Cached result %s (%.1f secs)", key[0:8], time.time()-start)
+        return result
+
+class ArrayStore():
+    """Least recently used store of small dictionaries of numpy arrays
+
+    Used for intermediate products that are reused across runs (e.g. stellar
+    spectra). Entries are kept in memory up to max_items. If PANDEXO_CACHE is 
+    set, they are also saved as .npz files in the subdirectory name, so that 
+    other workers and later sessions can load them. 
+
+    Parameters
+    ----------
+    name : str
+        name of the store, also the subdirectory of PANDEXO_CACHE
+    max_items : int
+        (Optional) maximum number of entries kept in memory. Default is 64
+
+    Methods
+    -------
+    get
+        returns copy of stored arrays or None
+    put
+        stores arrays under a key
+    clear
+        empties the in memory store
+
+    Examples
+    --------
+
+    >>> store = ArrayStore('stars')
+    >>> store.put((5500.0, 0.0, 4.5), {'wave':wave, 'flux':flux})
+    >>> store.get((5500.0, 0.0, 4.5))['flux']
+    """
+    def __init__(self, name, max_items=64):
+        self.name = name
+        self.max_items = max_items
+        self.items = OrderedDict()
+
+    def _file(self, key):
+        path = cache_dir(self.name)
+        if path is None:
+            return None
+        key = json.dumps([cache_version, key], default=_to_json)
+        return os.path.join(path, hashlib.sha256(key.encode()).hexdigest() + '.npz')
+
+    def _remember(self, key, arrays):
+        self.items[key] = arrays
+        self.items.move_to_end(key)
+        while len(self.items) > self.max_items:
+            self.items.popitem(last=False)
+
+    def get(self, key):
+        """Returns a copy of the arrays stored under key, or None
+        """
+        arrays = self.items.get(key)
+        if arrays is None:
+            fname = self._file(key)
+            if fname is None or not os.path.isfile(fname):
+                return None
+            try:
+                with np.load(fname) as f:
+                    arrays = {k: f[k] for k in f.files}
+                #most recently used for the eviction of ResultCache
+                os.utime(fname, None)
+            except (IOError, OSError, ValueError):
+                return None
+        self._remember(key, arrays)
+        return {k: v.copy() for k, v in arrays.items()}
+
+    def put(self, key, arrays):
+        """Stores dictionary of arrays under key (a tuple of floats and strings)
+        """
+        arrays = {k: np.array(v) for k, v in arrays.items()}
+        self._remember(key, arrays)
+        fname = self._file(key)
+        if fname is not None:
+            tmp = fname + '.' + str(os.getpid()) + '.tmp.npz'
+            np.savez(tmp, **arrays)
+            os.rename(tmp, fname)
+
+    def clear(self):
+        """Empties the in memory store. Files on disk are kept
+        """
+        self.items.clear()
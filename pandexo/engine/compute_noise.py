@@ -36,6 +36,10 @@ class ExtractSpec():
         extracts pixels from center to bottom
     loopingU
         extracts pixels from center to top
+    vectorL
+        extracts pixels from center to bottom for all columns at once
+    vectorU
+        extracts pixels from center to top for all columns at once
     sum_spatial
         sums pixels in optimal extraction region
     extract_region
@@ -135,17 +139,80 @@ class ExtractSpec():
                 sn_old = sn_new
         return len(signal_col)+1 
 
+    def vectorL(self, cen, signal, noise):
+        """Finds bottom of the optimal extraction region for every column.
+    
+        Same as `loopingL` but for the full 2d image at once. Cumulative sums from 
+        the center row downward give the signal and noise of every candidate 
+        extraction box, and the bound is the first box where the SNR stops increasing. 
+    
+        Parameters
+        ----------
+        cen : int 
+            Pixel where SNR is the highest 
+        signal : array of float 
+            2d array of fluxes to be extracted (spatial, wavelength)
+        noise : array of float 
+            2d array of noise to be extracted (spatial, wavelength)
+    
+        Return 
+        ------
+        array of int
+            Bottom most pixel to be extracted in each column
+        """
+        #row ii is sum(col[cen-ii:cen+1])
+        sig_sum = np.cumsum(signal[cen::-1,:], axis=0)
+        noi_sum = np.sqrt(np.cumsum(noise[cen::-1,:], axis=0))
+        with np.errstate(divide='ignore', invalid='ignore'):
+            sn_new = sig_sum/noi_sum
+        sn_old = np.vstack([np.zeros((1,sn_new.shape[1])), sn_new[:-1,:]])
+        stop = sn_old >= sn_new
+        ii = np.argmax(stop, axis=0)
+        return np.where(stop.any(axis=0), cen-ii+1, 0)
 
-    def sum_spatial(self, extract_info):    
+    def vectorU(self, cen, signal, noise):
+        """Finds top of the optimal extraction region for every column.
+    
+        Same as `loopingU` but for the full 2d image at once. 
+    
+        Parameters
+        ----------
+        cen : int 
+            Pixel where SNR is the highest 
+        signal : array of float 
+            2d array of fluxes to be extracted (spatial, wavelength)
+        noise : array of float 
+            2d array of noise to be extracted (spatial, wavelength)
+    
+        Return 
+        ------
+        array of int
+            Top most pixel to be extracted in each column
+        """
+        #row ii-1 is sum(col[cen:cen+ii])
+        sig_sum = np.cumsum(signal[cen:,:], axis=0)
+        noi_sum = np.sqrt(np.cumsum(noise[cen:,:], axis=0))
+        with np.errstate(divide='ignore', invalid='ignore'):
+            sn_new = sig_sum/noi_sum
+        sn_old = np.vstack([np.zeros((1,sn_new.shape[1])), sn_new[:-1,:]])
+        stop = sn_old >= sn_new
+        ii = np.argmax(stop, axis=0)
+        return np.where(stop.any(axis=0), cen+ii, signal.shape[0]+1)
+
+    def sum_spatial(self, extract_info, dtype=np.float64):    
         """Sum pixel in the spatial direction 
         
         Takes extraction info from `extract_region` and sums pixels in that region 
-        taking into account integrations and number of transits 
+        taking into account integrations and number of transits. All columns are 
+        summed at once by masking the pixels outside of the extraction box. 
         
         Parameters 
         ----------
         extract_info : dict 
             Dictionary with information on extraction box, flux and noise products
+        dtype : numpy dtype
+            (Optional) precision of the 1d products. np.float32 halves the memory 
+            used for large postage stamps. Default = np.float64
             
         Return
         ------
@@ -154,10 +221,8 @@ class ExtractSpec():
         """
         nint_in = self.nint_in
         nint_out = self.nint_out
-        LBout = extract_info['bounds']['LBout']
-        LBin = extract_info['bounds']['LBin']
-        UBin = extract_info['bounds']['UBin']
-        UBout = extract_info['bounds']['UBout']
+        LBout = np.asarray(extract_info['bounds']['LBout'])
+        UBout = np.asarray(extract_info['bounds']['UBout'])
         photon_sig_in = extract_info['photons']['photon_sig_in']    
         photon_sig_out = extract_info['photons']['photon_sig_out']
         var_pix_in = extract_info['photons']['var_pix_in']
@@ -167,40 +232,29 @@ class ExtractSpec():
         rn_var_in = extract_info['noise']['rn_var_in']
         rn_var_out = extract_info['noise']['rn_var_out']
 
-
         rr, lenw = photon_sig_in.shape
 
-        # sum spectrum in the spatial direction to create 1d spectrum 
-        photon_out_1d = range(0,lenw)
-        photon_in_1d = range(0,lenw)
-        var_out_1d = range(0,lenw)
-        var_in_1d = range(0,lenw)
-        sky_in_1d = range(0,lenw)
-        sky_out_1d = range(0,lenw)
-        rn_in_1d = range(0,lenw)
-        rn_out_1d = range(0,lenw)
+        #pixels inside the extraction region of each column, same as 
+        #slicing [LBout[i]:UBout[i],i] (bounds past the edge are clipped)
+        rows = np.arange(rr)[:,None]
+        mask = (rows >= LBout[None,:]) & (rows < UBout[None,:])
+
+        dtype = np.dtype(dtype).type
 
+        def colsum(image, nint):
+            #cast first so that the masked 2d copy is in dtype too 
+            image = np.asarray(image, dtype=dtype)
+            return np.where(mask, image, dtype(0)).sum(axis=0, dtype=dtype)*dtype(nint)
 
         #sum 2d spectrum in extraction region in spatial direciton to create 1d spec
-        for i in range(0,lenw):
-            photon_out_1d[i] = sum(photon_sig_out[LBout[i]:UBout[i],i])*nint_out
-            photon_in_1d[i] = sum(photon_sig_in[LBout[i]:UBout[i],i])*nint_in
-            var_out_1d[i] = sum(var_pix_out[LBout[i]:UBout[i],i])*nint_out
-            var_in_1d[i] = sum(var_pix_in[LBout[i]:UBout[i],i])*nint_in
-            sky_out_1d[i] = sum(photon_sky_out[LBout[i]:UBout[i],i])*nint_out
-            sky_in_1d[i] = sum(photon_sky_in[LBout[i]:UBout[i],i])*nint_in
-            rn_out_1d[i] = sum(rn_var_out[LBout[i]:UBout[i],i])*nint_out
-            rn_in_1d[i] = sum(rn_var_in[LBout[i]:UBout[i],i])*nint_in
-
-
-        photon_out_1d = np.array(photon_out_1d)
-        photon_in_1d = np.array(photon_in_1d)
-        var_out_1d = np.array(var_out_1d)
-        var_in_1d = np.array(var_in_1d)
-        sky_in_1d = np.array(sky_in_1d)
-        sky_out_1d = np.array(sky_out_1d)
-        rn_out_1d = np.array(rn_out_1d)
-        rn_in_1d = np.array(rn_in_1d)
+        photon_out_1d = colsum(photon_sig_out, nint_out)
+        photon_in_1d = colsum(photon_sig_in, nint_in)
+        var_out_1d = colsum(var_pix_out, nint_out)
+        var_in_1d = colsum(var_pix_in, nint_in)
+        sky_out_1d = colsum(photon_sky_out, nint_out)
+        sky_in_1d = colsum(photon_sky_in, nint_in)
+        rn_out_1d = colsum(rn_var_out, nint_out)
+        rn_in_1d = colsum(rn_var_in, nint_in)
 
         return {'photon_out_1d':photon_out_1d, 'photon_in_1d':photon_in_1d, 
                 'var_in_1d':var_in_1d, 'var_out_1d':var_out_1d,
@@ -208,11 +262,18 @@ class ExtractSpec():
                 'extract_info':extract_info,'on_source_in':self.on_source_in, 
                 'on_source_out':self.on_source_out}
 
-    def extract_region(self): #second to last 
+    def extract_region(self, method='vector'): #second to last 
         """Determine extraction Region
         
         Contains functionality to determine extraction region from Pandeia 2d noise 
-        simulations. Calls `self.loopingL` and `self.loopingU`. 
+        simulations. Calls `self.vectorL` and `self.vectorU`, or `self.loopingL` and 
+        `self.loopingU` column by column. 
+        
+        Parameters
+        ----------
+        method : str
+            (Optional) 'vector' (default) finds all column bounds at once, 'loop' 
+            uses the original column by column loop. Kept for regression comparison.
         
         Return
         ------
@@ -264,11 +325,44 @@ class ExtractSpec():
         rn_var_in= inn.noise.var_rn_pix*exptime_per_int*factor_rn #variance stricly due to detector readnoise
         var_pix_in = photon_sig_in + photon_sky_in + rn_var_in # variance of noise per pixel 
 
-        UBout = range(0,lenw)
-        LBout = range(0,lenw)
-        UBin = range(0,lenw)
-        LBin = range(0,lenw)
+        if method == 'vector':
+            LBout = self.vectorL(cenRo, photon_sig_out, var_pix_out)
+            UBout = self.vectorU(cenRo, photon_sig_out, var_pix_out)
+            LBin = self.vectorL(cenRi, photon_sig_in, var_pix_in)
+            UBin = self.vectorU(cenRi, photon_sig_in, var_pix_in)
+        elif method == 'loop':
+            LBout, UBout, LBin, UBin = self.loop_region(cenRo, cenRi, photon_sig_out, var_pix_out,
+                                        photon_sky_out, photon_sig_in, var_pix_in, photon_sky_in)
+        else: 
+            raise Exception("Extraction method must be 'vector' or 'loop'")
 
+        #this could be made more elegant later... not very efficient 
+        noise = {'rn_var_out':rn_var_out, 'rn_var_in':rn_var_in, 
+                 'photon_sky_in':photon_sky_in, 'photon_sky_out': photon_sky_out }
+        bounds = {'LBout':LBout, 'UBout':UBout, 'LBin':LBin, 'UBin':UBin}
+        photons = {'photon_sig_out': photon_sig_out, 'photon_sig_in':photon_sig_in, 
+                   'var_pix_in':var_pix_in,'var_pix_out': var_pix_out}
+        extract_info ={'bounds':bounds, 'photons':photons, 'noise':noise}
+
+        return extract_info
+
+    def loop_region(self, cenRo, cenRi, photon_sig_out, var_pix_out, photon_sky_out,
+                    photon_sig_in, var_pix_in, photon_sky_in):
+        """Column by column extraction region
+        
+        Reference implementation of the extraction bounds which calls `self.loopingL` 
+        and `self.loopingU` for every column. 
+        
+        Return
+        ------
+        tuple 
+            LBout, UBout, LBin, UBin lists of bounds for each column 
+        """
+        rr, lenw = photon_sig_out.shape
+        UBout = [0]*lenw
+        LBout = [0]*lenw
+        UBin = [0]*lenw
+        LBin = [0]*lenw
 
         #start new loop over column
         for j in range(0,lenw):
@@ -277,7 +371,6 @@ class ExtractSpec():
             noise_col_out = var_pix_out[:, j]
             signal_col_out = photon_sig_out[:,j]
             bkg_col_out = photon_sky_out[:,j]
-            rn_col_out = rn_var_out[:,j]
 
             noise_col_in =  var_pix_in[:, j]
             signal_col_in = photon_sig_in[:,j]
@@ -290,20 +383,19 @@ class ExtractSpec():
             LBin[j] = self.loopingL(cenRi, signal_col_in, noise_col_in, bkg_col_in    )
             UBin[j] = self.loopingU(cenRi, signal_col_in, noise_col_in, bkg_col_in)
 
-        #this could be made more elegant later... not very efficient 
-        noise = {'rn_var_out':rn_var_out, 'rn_var_in':rn_var_in, 
-                 'photon_sky_in':photon_sky_in, 'photon_sky_out': photon_sky_out }
-        bounds = {'LBout':LBout, 'UBout':UBout, 'LBin':LBin, 'UBin':UBin}
-        photons = {'photon_sig_out': photon_sig_out, 'photon_sig_in':photon_sig_in, 
-                   'var_pix_in':var_pix_in,'var_pix_out': var_pix_out}
-        extract_info ={'bounds':bounds, 'photons':photons, 'noise':noise}
-
-        return extract_info
+        return LBout, UBout, LBin, UBin
 
-    def run_2d_extract(self):
+    def run_2d_extract(self, method='vector', dtype=np.float64):
         """Extract noise from 2d detector image
             
         Contains functionality to extract noise from 2d detector image
+        
+        Parameters
+        ----------
+        method : str
+            (Optional) 'vector' (default) or 'loop', see `extract_region`
+        dtype : numpy dtype
+            (Optional) precision of the 1d products, see `sum_spatial`
             
         Returns
         -------
@@ -311,9 +403,9 @@ class ExtractSpec():
             all optimally extracted 1d products  
         """
         #optimize SNR and extract region 
-        extract = self.extract_region()
+        extract = self.extract_region(method=method)
         #return summed up pixels 
-        return self.sum_spatial(extract)
+        return self.sum_spatial(extract, dtype=dtype)
         
         
     def run_slope_method(self): 
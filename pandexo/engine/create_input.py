@@ -5,11 +5,238 @@ from sqlalchemy import *
 import astropy.units as u 
 import astropy.constants as c
 import os 
+from copy import deepcopy
 from  astropy.modeling import blackbody as bb
 import warnings
 with warnings.catch_warnings():
     warnings.filterwarnings("ignore")
     import pysynphot as psyn
+from .cache import ArrayStore
+from . import fortgrid
+from . import spec_units
+
+#stellar spectra reused across runs. icat_store holds the interpolated phoenix 
+#spectrum for (temp, metal, logg), star_store the normalized spectrum for 
+#(temp, metal, logg, mag, filter, norm_method) 
+icat_store = ArrayStore('icat')
+star_store = ArrayStore('stars')
+#user star and planet files, keyed by (path, size, mtime) 
+file_store = ArrayStore('files', max_items=16)
+
+#bessell bandpasses used for normalization (in pandeia_refdata/normalization/bandpass)
+all_bps = {"H": 'bessell_h_004_syn.fits',
+           "J": 'bessell_j_003_syn.fits',
+           "K": 'bessell_k_003_syn.fits'}
+#bandpass wavelength (angstroms) and throughput, and vega band integral, per filter 
+bandpasses = {}
+
+#how the star is normalized to its magnitude: "pysynphot" (sp.renorm, default) or 
+#"arrays" (renorm_vegamag, no pysynphot objects). Only switch the default once 
+#tests/test_normalization.py passes against the pysynphot reference values 
+norm_method = os.environ.get('PANDEXO_NORM', 'pysynphot')
+
+trapz = getattr(np, 'trapezoid', None) or np.trapz
+
+def band_integral(wave, flux_jy, bp_wave, bp_thru):
+    """Photon weighted integral of a spectrum through a bandpass 
+    
+    Photon flux density is proportional to F_nu/lambda, so this is the 
+    trapezoid integral of flux*throughput/wave on the union of the two 
+    wavelength grids within the bandpass. 
+    
+    Parameters
+    ----------
+    wave : array of float 
+        wavelength of spectrum in angstroms, ascending 
+    flux_jy : array of float 
+        flux of spectrum in Jy 
+    bp_wave : array of float 
+        wavelength of bandpass in angstroms, ascending 
+    bp_thru : array of float 
+        throughput of bandpass 
+    
+    Returns
+    -------
+    float 
+        band integral (arbitrary units, only ratios are meaningful)
+    """
+    inband = (wave >= bp_wave[0]) & (wave <= bp_wave[-1])
+    grid = np.union1d(wave[inband], bp_wave)
+    flux = np.interp(grid, wave, flux_jy, left=0.0, right=0.0)
+    thru = np.interp(grid, bp_wave, bp_thru, left=0.0, right=0.0)
+    return trapz(flux*thru/grid, grid)
+
+def get_bandpass(filt):
+    """Normalization bandpass as arrays, loaded once per process 
+    
+    Parameters
+    ----------
+    filt : str 
+        'J', 'H' or 'K'
+    
+    Returns
+    -------
+    dict 
+        'wave' (angstroms), 'throughput', 'vega' (band integral of Vega) and 
+        'bandpass' (the pysynphot bandpass)
+    """
+    if filt not in bandpasses:
+        refdata = os.environ.get("pandeia_refdata")
+        bp = psyn.FileBandpass(os.path.join(refdata, "normalization", "bandpass", all_bps[filt]))
+        bp.convert('angstroms')
+        bp_wave = np.array(bp.wave, dtype=float)
+        bp_thru = np.array(bp.throughput, dtype=float)
+        vega = deepcopy(psyn.Vega)
+        vega.convert('angstroms')
+        vega.convert('jy')
+        vega_int = band_integral(np.array(vega.wave), np.array(vega.flux), bp_wave, bp_thru)
+        bandpasses[filt] = {'wave': bp_wave, 'throughput': bp_thru, 'vega': vega_int, 
+                            'bandpass': bp}
+    return bandpasses[filt]
+
+def renorm_pysynphot(wave, flux_jy, mag, filt):
+    """Normalizes spectrum to a Vega magnitude with pysynphot's renorm 
+    
+    Same arguments and output as **renorm_vegamag**, the bandpass is only read once. 
+    """
+    sp = psyn.ArraySpectrum(wave, flux_jy, waveunits='angstrom', fluxunits='jy')
+    rn_sp = sp.renorm(mag, 'vegamag', get_bandpass(filt)['bandpass'])
+    rn_sp.convert('angstroms')
+    rn_sp.convert('jy')
+    return np.array(rn_sp.flux)
+
+def renorm(wave, flux_jy, mag, filt):
+    """Normalizes spectrum to a Vega magnitude with the method set by `norm_method`
+    
+    Parameters
+    ----------
+    wave : array of float 
+        wavelength in angstroms, ascending 
+    flux_jy : array of float 
+        flux in Jy 
+    mag : float 
+        magnitude in filt 
+    filt : str 
+        'J', 'H' or 'K'
+    
+    Returns
+    -------
+    array of float 
+        normalized flux in Jy 
+    """
+    if norm_method == 'arrays':
+        return renorm_vegamag(wave, flux_jy, mag, filt)
+    elif norm_method == 'pysynphot':
+        return renorm_pysynphot(wave, flux_jy, mag, filt)
+    raise Exception('PANDEXO_NORM should be pysynphot or arrays, not ' + str(norm_method))
+
+def renorm_vegamag(wave, flux_jy, mag, filt):
+    """Normalizes spectrum to a Vega magnitude without pysynphot objects 
+    
+    Meant to match pysynphot's sp.renorm(mag, 'vegamag', bp): the spectrum is scaled so 
+    that its photon flux through the bandpass is 10^(-0.4 mag) times that of Vega. 
+    Used if PANDEXO_NORM is "arrays", see `norm_method`. 
+    
+    Parameters
+    ----------
+    wave : array of float 
+        wavelength in angstroms, ascending 
+    flux_jy : array of float 
+        flux in Jy 
+    mag : float 
+        magnitude in filt 
+    filt : str 
+        'J', 'H' or 'K'
+    
+    Returns
+    -------
+    array of float 
+        normalized flux in Jy 
+    """
+    bp = get_bandpass(filt)
+    star_int = band_integral(wave, flux_jy, bp['wave'], bp['throughput'])
+    if star_int <= 0:
+        raise Exception('Stellar spectrum does not overlap with the ' + filt + ' bandpass')
+    return flux_jy * 10.0**(-0.4*mag) * bp['vega'] / star_int
+
+def phoenix_spectrum(temp, metal, logg):
+    """Interpolated phoenix spectrum from pysynphot, memoized
+    
+    Parameters
+    ----------
+    temp : float 
+        stellar temperature 
+    metal : float 
+        metallicity 
+    logg : float 
+        log surface gravity 
+    
+    Returns
+    -------
+    wave, flux : array of float 
+        phoenix spectrum in angstroms and flam 
+    """
+    key = (float(temp), float(metal), float(logg))
+    cached = icat_store.get(key)
+    if cached is None:
+        sp = psyn.Icat("phoenix", temp, metal, logg)
+        sp.convert('angstroms')
+        sp.convert('flam')
+        cached = {'wave': np.array(sp.wave), 'flux': np.array(sp.flux)}
+        icat_store.put(key, cached)
+    return cached['wave'], cached['flux']
+
+def read_spectrum(path):
+    """Reads a two column (wavelength, flux) text file 
+    
+    Uses the pandas C parser (falling back to np.genfromtxt for files it cannot 
+    parse, e.g. with a header line) and only sorts when the wavelengths are not 
+    already in order. The result is stored in memory, and in PANDEXO_CACHE if it 
+    is set, under the path, size and modification time of the file, so a file 
+    used across a sweep is only parsed once. 
+    
+    Parameters
+    ----------
+    path : str 
+        path to the file 
+    
+    Returns
+    -------
+    wave, flux : array of float 
+        in the units of the file, in ascending order of wavelength 
+    """
+    stat = os.stat(path)
+    key = (os.path.abspath(path), stat.st_size, stat.st_mtime)
+    cached = file_store.get(key)
+    if cached is not None:
+        return cached['w'], cached['f']
+    try:
+        df = pd.read_csv(path, sep=r'\s+', comment='#', header=None, usecols=[0, 1], 
+                         dtype=float, engine='c')
+        wave = df[0].values
+        flux = df[1].values
+    except ValueError:
+        load_file = np.genfromtxt(path, dtype=(float, float), names='w, f')
+        wave = load_file['w']
+        flux = load_file['f']
+    wave, flux = spec_units.sort_wave(wave, flux)
+    wave = np.ascontiguousarray(wave)
+    flux = np.ascontiguousarray(flux)
+    file_store.put(key, {'w': wave, 'f': flux})
+    return wave, flux
+
+def norm_filter(ref_wave):
+    """Bandpass (J, H or K) used to normalize the star at ref_wave (micron)
+    """
+    if (ref_wave <= 1.3) & (ref_wave >= 1.2):
+        filt = 'J'
+    elif (ref_wave <= 1.7) & (ref_wave >= 1.6):
+        filt = 'H'
+    elif (ref_wave <= 2.3) & (ref_wave >= 2.1):
+        filt = 'K'
+    else:
+        raise Exception('Only J H and K zeropoints are included')
+    return filt
     
 def outTrans(input) :
     """Compute out of transit spectra
@@ -26,107 +253,154 @@ def outTrans(input) :
     Return
     ------
     dict 
-        contains wave and flux_out_trans
+        contains wave, flux_out_trans, flux_jy (the spectrum in Jy before normalization) 
+        and phoenix (the same spectrum as a pysynphot ArraySpectrum in angstroms and Jy)
+    
+    Notes
+    -----
+    Normalized phoenix spectra are stored in memory (and in PANDEXO_CACHE if it is set), 
+    so repeated stars skip pysynphot. 
     """ 
 
     ref_wave = float(input['ref_wave'])
     mag = float(input['mag'])
+    filt = norm_filter(ref_wave)
 
     ################# USER ####################################
     if input['type'] == 'user':
-        star = np.genfromtxt(input['starpath'], dtype=(float, float), names='w, f') #pyfits.getdata(input['starpath'],1)
-        #get flux 
-        flux = star['f'] #star.field(input['logg'])
-        #get wavelength and reference wavelength for mag normalization
-        wave = star['w'] #star.field('WAVELENGTH')
+        wave, flux = read_spectrum(input['starpath'])
         
-        #sort if not in ascending order 
-        sort = np.array([wave,flux]).T
-        sort= sort[sort[:,0].argsort()]
-        wave = sort[:,0]
-        flux = sort[:,1] 
-        if input['w_unit'] == 'um':
-            PANDEIA_WAVEUNITS = 'um'
-            
-        elif input['w_unit'] == 'nm':
-            PANDEIA_WAVEUNITS = 'nm'
-      
-        elif input['w_unit'] == 'cm' :
-            PANDEIA_WAVEUNITS = 'cm'
-     
-        elif input['w_unit'] == 'Angs' :
-            PANDEIA_WAVEUNITS = 'angstrom'
-
-        elif input['w_unit'] == 'Hz' :
-            PANDEIA_WAVEUNITS = 'Hz'
-
-        else: 
-            raise Exception('Units are not correct. Pick um, nm, cm, hz, or Angs')        
-
-        #convert to photons/s/nm/m^2 for flux normalization based on 
-        #http://www.gemini.edu/sciops/instruments/integration-time-calculators/itc-help/source-definition
-        if input['f_unit'] == 'Jy':
-            PANDEIA_FLUXUNITS = 'jy' 
-        elif input['f_unit'] == 'FLAM' :
-            PANDEIA_FLUXUNITS = 'FLAM'
-        elif input['f_unit'] == 'erg/cm2/s/Hz':
-            flux = flux*1e23
-            PANDEIA_FLUXUNITS = 'jy' 
-        else: 
-            raise Exception('Units are not correct. Pick FLAM or Jy or erg/cm2/s/Hz')
-
-        sp = psyn.ArraySpectrum(wave, flux, waveunits=PANDEIA_WAVEUNITS, fluxunits=PANDEIA_FLUXUNITS)        #Convert evrything to nanometer for converstion based on gemini.edu  
-        sp.convert("nm")
-        sp.convert('jy')
+        #convert to microns and Jy and sort if not in ascending order 
+        wave = spec_units.wave_to_micron(wave, input['w_unit'], copy=False)
+        flux = spec_units.flux_to_jy(flux, input['f_unit'], wave, copy=False)
+        wave, flux = spec_units.sort_wave(wave, flux)
 
     ############ PHOENIX ################################################
     elif input['type'] =='phoenix':
         #make sure metal is not out of bounds
         if input['metal'] > 0.5: input['metal'] = 0.5
-        sp = psyn.Icat("phoenix", input['temp'], input['metal'], input['logg'])
-        sp.convert("nm")
-        sp.convert("jy")
-        wave = sp.wave
-        flux = sp.flux
         input['w_unit'] ='nm'
         input['f_unit'] = 'jy'
+        star_key = (float(input['temp']), float(input['metal']), float(input['logg']), mag, filt,
+                    norm_method)
+        cached = star_store.get(star_key)
+        if cached is not None:
+            return with_phoenix(cached)
+        wave, flux = phoenix_spectrum(input['temp'], input['metal'], input['logg'])
+        wave = spec_units.wave_to_micron(wave, 'Angs', copy=False)
+        flux = spec_units.flux_to_jy(flux, 'FLAM', wave, copy=False)
         
     else: 
         raise Exception('Wrong input type for stellar spectra')
     
 
     ############ NORMALIZATION ################################################
-    refdata = os.environ.get("pandeia_refdata")
+    flux_out_trans = renorm(wave*1e4, flux, mag, filt)*1e3 #mJy
 
-    all_bps = {"H": 'bessell_h_004_syn.fits',
-                 "J":'bessell_j_003_syn.fits' ,
-                 "K": 'bessell_k_003_syn.fits'}
+    star_spec = {'flux_out_trans': flux_out_trans, 'wave': wave, 'flux_jy': flux}
+    if input['type'] == 'phoenix':
+        star_store.put(star_key, star_spec)
+    return with_phoenix(star_spec)
 
-    if (ref_wave <= 1.3) & (ref_wave >= 1.2):
-        filt = 'J'
-    elif (ref_wave <= 1.7) & (ref_wave >= 1.6):
-        filt = 'H'
-    elif (ref_wave <= 2.3) & (ref_wave >= 2.1):
-        filt = 'K'
-    else:
-        raise Exception('Only J H and K zeropoints are included')
+def with_phoenix(star_spec):
+    """Adds the 'phoenix' key of the original outTrans output
+    
+    The unnormalized spectrum as a pysynphot ArraySpectrum (angstroms, Jy). Only 
+    the arrays are stored by star_store, the spectrum object is built on return. 
+    """
+    star_spec['phoenix'] = psyn.ArraySpectrum(star_spec['wave']*1e4, star_spec['flux_jy'], 
+                                              waveunits='angstrom', fluxunits='jy')
+    return star_spec
 
-    bp_path = os.path.join(refdata, "normalization", "bandpass", all_bps[filt])
-    bp = psyn.FileBandpass(bp_path)
 
-    sp.convert('angstroms')
-    bp.convert('angstroms')
+def fortney_spectrum(planet, star):
+    """Transit depth from the Fortney grid, scaled to the planet radius and mass 
+    
+    Parameters 
+    ----------
+    planet: dict
+        planet dictionary with temp, chem, cloud, radius and (optionally) mass
+    star: dict
+        star dictionary with radius 
 
-    rn_sp = sp.renorm(mag, 'vegamag', bp)
+    Return
+    ------
+    wave_planet, flux_planet : array of float 
+        wavelength (micron) and (rp/r*)^2 
+    """
+    grid = fortgrid.get_grid()
 
+    #radius of star
+    try:
+        rstar = (star['radius']*u.Unit(star['r_unit'])).to(u.km)
+    except Exception:
+        raise Exception("Radius of Star not supplied for scaling. Check exo_input['star']['radius']")
 
-    rn_sp.convert("microns")
-    rn_sp.convert("mjy")
+    #radius of planet
+    try:
+        rplan = (planet['radius']*u.Unit(planet['r_unit'])).to(u.km)
+    except Exception:
+        planet['radius'] = (1.25*c.R_jup).to(u.km)
+        rplan = planet['radius']
+        print('Default Planet Radius of 1.25 Rj given')
+
+    #clouds 
+    if planet['cloud'].find('flat') != -1: 
+        planet['flat'] = int(planet['cloud'][4:])
+        planet['ray'] = 0 
+    elif planet['cloud'].find('ray') != -1: 
+        planet['ray'] = int(planet['cloud'][3:])
+        planet['flat'] = 0 
+    elif int(planet['cloud']) == 0: 
+        planet['flat'] = 0 
+        planet['ray'] = 0     
+    else:
+        planet['flat'] = 0 
+        planet['ray'] = 0 
+        print('No cloud parameter not specified, default no clouds added')
+    
+    #chemistry 
+    if planet['chem'] == 'noTiO': 
+        planet['noTiO'] = True
+        planet['eqchem'] = True 
+    if planet['chem'] == 'eqchem': 
+        planet['noTiO'] = False
+        planet['eqchem'] = True 
+        #grid does not allow clouds for cases with TiO
+        planet['flat'] = 0 
+        planet['ray'] = 0 
+
+    #we are only using gravity of 25 and scaling by mass from there 
+    fort_grav = 25.0*u.m/u.s/u.s
+    wave, radius = grid.get(planet['temp'], planet['noTiO'], planet['ray'], planet['flat'])
+    wave_planet = np.array(wave)[::-1]
+
+    r_lambda = np.array(radius)*u.km
+    z_lambda = r_lambda- (1.25*u.R_jup).to(u.km) #all fortney models have fixed 1.25 radii
+
+    #scale with planetary mass 
+    try:
+        mass = (planet['mass']*u.Unit(planet['m_unit'])).to(u.kg)
+        gravity = c.G*(mass)/(rplan.to(u.m))**2.0 #convert radius to m for gravity units
+        #scale lambbda (this technically ignores the fact that scaleheight is altitude dependent)
+        #therefore, it will not be valide for very very low gravities
+        z_lambda = z_lambda*fort_grav/gravity
+    except Exception:
+        #keep original z lambda 
+        gravity=25.0
+        z_lambda = z_lambda*fort_grav/fort_grav
+        print('Default Planet Gravity of 25 m/s2 given')  
+    
+    #create new wavelength dependent R based on scaled ravity
+    r_lambda = z_lambda + rplan
 
-    flux_out_trans = rn_sp.flux
-    wave = rn_sp.wave
-    return {'flux_out_trans': flux_out_trans, 'wave': wave,'phoenix':sp} 
 
+    #finally compute (rp/r*)^2
+    flux_planet = np.array(r_lambda**2/rstar**2)[::-1]
+    planet['w_unit'] = 'um'
+    planet['f_unit'] = 'rp^2/r*^2'
+
+    return wave_planet, flux_planet
 
 def bothTrans(out_trans, planet,star=None) :
     """Calculates in transit flux 
@@ -153,17 +427,8 @@ def bothTrans(out_trans, planet,star=None) :
     """ 
     
     if planet['type'] =='user':
-        load_file = np.genfromtxt(planet['exopath'], dtype=(float, float), names='w, f')   
-        #get wavelength 
-        wave_planet = load_file['w']
-        #get planet flux 
-        flux_planet = load_file['f']
-        
-        #sort if not in ascending order 
-        sort = np.array([wave_planet,flux_planet]).T
-        sort= sort[sort[:,0].argsort()]
-        wave_planet = sort[:,0]
-        flux_planet = sort[:,1]
+        #wavelength and planet flux, sorted in ascending order 
+        wave_planet, flux_planet = read_spectrum(planet['exopath'])
     
     ############## IF USER SELECTS CONSTANT VALUE ##################   
     elif planet['type'] == 'constant':
@@ -181,7 +446,7 @@ def bothTrans(out_trans, planet,star=None) :
         elif planet['f_unit'] == 'fp/f*':
             planet['w_unit'] = 'um'
             wave_planet = out_trans['wave'][(out_trans['wave']>0.5) & (out_trans['wave']<15)]
-            flux_star = (out_trans['phoenix'].flux*(u.Jy)).to(u.mJy)[(out_trans['wave']>0.5) & (out_trans['wave']<15)]
+            flux_star = (out_trans['flux_jy']*(u.Jy)).to(u.mJy)[(out_trans['wave']>0.5) & (out_trans['wave']<15)]
             #MAKING SURE TO ADD IN SUPID PI FOR PER STERADIAN!!!!
             flux_planet = (bb.blackbody_nu(wave_planet*u.micron, planet['temp']*u.K)*np.pi*u.sr).to(u.mJy)
             # ( bb planet / pheonix sed ) * (rp/r*)^2
@@ -189,101 +454,14 @@ def bothTrans(out_trans, planet,star=None) :
 
     ############## IF USER SELECTS TO PULL FROM GRID ##################
     elif planet['type'] =='grid':
-        try:
-            db = create_engine('sqlite:///'+os.environ.get('FORTGRID_DIR'))
-            header= pd.read_sql_table('header',db)
-        except:
-            raise Exception('Fortney Grid File Path is incorrect, or not initialized')
-
-        #radius of star
-        try:
-            rstar = (star['radius']*u.Unit(star['r_unit'])).to(u.km)
-        except:
-            raise Exception("Radius of Star not supplied for scaling. Check exo_input['star']['radius']")
-
-        #radius of planet
-        try:
-            rplan = (planet['radius']*u.Unit(planet['r_unit'])).to(u.km)
-        except: 
-            planet['radius'] = (1.25*c.R_jup).to(u.km)
-            rplan = planet['radius']
-            print('Default Planet Radius of 1.25 Rj given')
-
-        #clouds 
-        if planet['cloud'].find('flat') != -1: 
-            planet['flat'] = int(planet['cloud'][4:])
-            planet['ray'] = 0 
-        elif planet['cloud'].find('ray') != -1: 
-            planet['ray'] = int(planet['cloud'][3:])
-            planet['flat'] = 0 
-        elif int(planet['cloud']) == 0: 
-            planet['flat'] = 0 
-            planet['ray'] = 0     
-        else:
-            planet['flat'] = 0 
-            planet['ray'] = 0 
-            print('No cloud parameter not specified, default no clouds added')
-        
-        #chemistry 
-        if planet['chem'] == 'noTiO': 
-            planet['noTiO'] = True
-            planet['eqchem'] = True 
-        if planet['chem'] == 'eqchem': 
-            planet['noTiO'] = False
-            planet['eqchem'] = True 
-            #grid does not allow clouds for cases with TiO
-            planet['flat'] = 0 
-            planet['ray'] = 0 
-
-        #we are only using gravity of 25 and scaling by mass from there 
-        fort_grav = 25.0*u.m/u.s/u.s
-        df = header.loc[(header.gravity==fort_grav) & (header.temp==planet['temp'])
-                           & (header.noTiO==planet['noTiO']) & (header.ray==planet['ray']) &
-                           (header.flat==planet['flat'])]
-        wave_planet=np.array(pd.read_sql_table(df['name'].values[0],db)['wavelength'])[::-1]
-
-        r_lambda=np.array(pd.read_sql_table(df['name'].values[0],db)['radius'])*u.km
-        z_lambda = r_lambda- (1.25*u.R_jup).to(u.km) #all fortney models have fixed 1.25 radii
-
-        #scale with planetary mass 
-        try:
-            mass = (planet['mass']*u.Unit(planet['m_unit'])).to(u.kg)
-            gravity = c.G*(mass)/(rplan.to(u.m))**2.0 #convert radius to m for gravity units
-            #scale lambbda (this technically ignores the fact that scaleheight is altitude dependent)
-            #therefore, it will not be valide for very very low gravities
-            z_lambda = z_lambda*fort_grav/gravity
-        except: 
-            #keep original z lambda 
-            gravity=25.0
-            z_lambda = z_lambda*fort_grav/fort_grav
-            print('Default Planet Gravity of 25 m/s2 given')  
-        
-        #create new wavelength dependent R based on scaled ravity
-        r_lambda = z_lambda + rplan
-
-
-        #finally compute (rp/r*)^2
-        flux_planet = np.array(r_lambda**2/rstar**2)[::-1]
-        planet['w_unit'] = 'um'
-        planet['f_unit'] = 'rp^2/r*^2'
+        wave_planet, flux_planet = fortney_spectrum(planet, star)
     else: 
         raise Exception("Incorrect Planet Type. Options are 'user','constant','grid'") 
 
     #Convert wave to micron 
-    if planet['w_unit'] == 'um':
-        wave_planet = wave_planet
-    elif planet['w_unit'] == 'nm':
-        wave_planet = wave_planet*1e-3
-    elif planet['w_unit'] == 'cm':
-        wave_planet = wave_planet*1e4
-    elif planet['w_unit'] == 'Angs' :
-        wave_planet = wave_planet*1e-4
-    elif planet['w_unit'] == 'Hz' :
-        wave_planet = 3e17/wave_planet
-    elif planet['w_unit'] == 'sec' :
-        wave_planet = wave_planet
-    else: 
-        raise Exception('Units are not correct. Pick um, nm, cm, Angs or sec.')
+    if planet['w_unit'] != 'sec':
+        wave_planet = spec_units.wave_to_micron(wave_planet, planet['w_unit'])
+        wave_planet, flux_planet = spec_units.sort_wave(wave_planet, flux_planet)
 
     if planet['w_unit'] == 'sec' :
         #star flux to feed into pandeia
@@ -351,17 +529,8 @@ def hst_spec(planet,star) :
     """ 
     
     if planet['type'] =='user':
-        load_file = np.genfromtxt(planet['exopath'], dtype=(float, float), names='w, f')   
-        #get wavelength 
-        wave_planet = load_file['w']
-        #get planet flux 
-        flux_planet = load_file['f']
-        
-        #sort if not in ascending order 
-        sort = np.array([wave_planet,flux_planet]).T
-        sort= sort[sort[:,0].argsort()]
-        wave_planet = sort[:,0]
-        flux_planet = sort[:,1]
+        #wavelength and planet flux, sorted in ascending order 
+        wave_planet, flux_planet = read_spectrum(planet['exopath'])
     
     ############## IF USER SELECTS CONSTANT VALUE ##################   
     elif planet['type'] == 'constant':
@@ -388,99 +557,13 @@ def hst_spec(planet,star) :
 
     ############## IF USER SELECTS TO PULL FROM GRID ##################
     elif planet['type'] =='grid':
-        try:
-            db = create_engine('sqlite:///'+os.environ.get('FORTGRID_DIR'))
-            header= pd.read_sql_table('header',db)
-        except:
-            raise Exception('Fortney Grid File Path is incorrect, or not initialized')
-
-        #radius of star
-        try:
-            rstar = (star['radius']*u.Unit(star['r_unit'])).to(u.km)
-        except:
-            raise Exception("Radius of Star not supplied for scaling. Check exo_input['star']['radius']")
-
-        #radius of planet
-        try:
-            rplan = (planet['radius']*u.Unit(planet['r_unit'])).to(u.km)
-        except: 
-            planet['radius'] = (1.25*c.R_jup).to(u.km)
-            rplan = planet['radius']
-            print('Default Planet Radius of 1.25 Rj given')
-
-        #clouds 
-        if planet['cloud'].find('flat') != -1: 
-            planet['flat'] = int(planet['cloud'][4:])
-            planet['ray'] = 0 
-        elif planet['cloud'].find('ray') != -1: 
-            planet['ray'] = int(planet['cloud'][3:])
-            planet['flat'] = 0 
-        elif int(planet['cloud']) == 0: 
-            planet['flat'] = 0 
-            planet['ray'] = 0     
-        else:
-            planet['flat'] = 0 
-            planet['ray'] = 0 
-            print('No cloud parameter not specified, default no clouds added')
-        
-        #chemistry 
-        if planet['chem'] == 'noTiO': 
-            planet['noTiO'] = True
-            planet['eqchem'] = True 
-        if planet['chem'] == 'eqchem': 
-            planet['noTiO'] = False
-            planet['eqchem'] = True 
-            #grid does not allow clouds for cases with TiO
-            planet['flat'] = 0 
-            planet['ray'] = 0 
-
-        #we are only using gravity of 25 and scaling by mass from there 
-        fort_grav = 25.0*u.m/u.s/u.s
-        df = header.loc[(header.gravity==fort_grav) & (header.temp==planet['temp'])
-                           & (header.noTiO==planet['noTiO']) & (header.ray==planet['ray']) &
-                           (header.flat==planet['flat'])]
-        wave_planet=np.array(pd.read_sql_table(df['name'].values[0],db)['wavelength'])[::-1]
-
-        r_lambda=np.array(pd.read_sql_table(df['name'].values[0],db)['radius'])*u.km
-        z_lambda = r_lambda- (1.25*u.R_jup).to(u.km) #all fortney models have fixed 1.25 radii
-
-        #scale with planetary mass 
-        try:
-            mass = (planet['mass']*u.Unit(planet['m_unit'])).to(u.kg)
-            gravity = c.G*(mass)/(rplan.to(u.m))**2.0 #convert radius to m for gravity units
-            #scale lambbda (this technically ignores the fact that scaleheight is altitude dependent)
-            #therefore, it will not be valide for very very low gravities
-            z_lambda = z_lambda*fort_grav/gravity
-        except: 
-            #keep original z lambda 
-            gravity=25.0
-            z_lambda = z_lambda*fort_grav/fort_grav
-            print('Default Planet Gravity of 25 m/s2 given')  
-        
-        #create new wavelength dependent R based on scaled ravity
-        r_lambda = z_lambda + rplan
-
-
-        #finally compute (rp/r*)^2
-        flux_planet = np.array(r_lambda**2/rstar**2)[::-1]
-        planet['w_unit'] = 'um'
-        planet['f_unit'] = 'rp^2/r*^2'
+        wave_planet, flux_planet = fortney_spectrum(planet, star)
     else: 
         raise Exception("Incorrect Planet Type. Options are 'user','constant','grid'") 
 
     #Convert wave to micron 
-    if planet['w_unit'] == 'um':
-        wave_planet = wave_planet
-    elif planet['w_unit'] == 'nm':
-        wave_planet = wave_planet*1e-3
-    elif planet['w_unit'] == 'cm':
-        wave_planet = wave_planet*1e4
-    elif planet['w_unit'] == 'Angs' :
-        wave_planet = wave_planet*1e-4
-    elif planet['w_unit'] == 'Hz' :
-        wave_planet = 3e17/wave_planet
-    else: 
-        raise Exception('Units are not correct. Pick um, nm, cm, Angs or sec.')
+    wave_planet = spec_units.wave_to_micron(wave_planet, planet['w_unit'])
+    wave_planet, flux_planet = spec_units.sort_wave(wave_planet, flux_planet)
 
     
     return wave_planet, flux_planet
@@ -0,0 +1,153 @@
+import os
+import hashlib
+import numpy as np
+import pandas as pd
+import astropy.units as u
+from sqlalchemy import create_engine
+from .cache import cache_dir
+
+#all grid spectra are computed at this gravity (m/s2) and scaled by mass from there
+fort_gravity = 25.0
+
+#open grids, keyed by path to the sqlite file
+grids = {}
+
+def _gravity(g):
+    """Gravity from the header in m/s2 (stored either as a number or a quantity string)
+    """
+    try:
+        return float(g)
+    except (TypeError, ValueError):
+        return u.Quantity(g).to(u.m/u.s/u.s).value
+
+def grid_key(temp, noTiO, ray, flat):
+    """Key of a model in the grid index
+    """
+    return (float(temp), bool(noTiO), float(ray), float(flat))
+
+class FortneyGrid():
+    """Indexed loader for the Fortney grid of transmission spectra
+
+    The sqlite header is read once and indexed on (temp, noTiO, ray, flat) for
+    the 25 m/s2 models. Each model table is read once into a contiguous 2 x N
+    array of wavelength and radius. If PANDEXO_CACHE is set, tables are also
+    saved as .npy files (see `convert`) and memory mapped on later loads,
+    so that workers share them without touching sqlite.
+
+    Parameters
+    ----------
+    path : str
+        path to the sqlite grid (FORTGRID_DIR)
+
+    Methods
+    -------
+    get
+        returns wavelength and radius of a model
+    convert
+        saves every model table as a .npy file
+
+    Examples
+    --------
+
+    >>> grid = get_grid()
+    >>> wave, radius = grid.get(1000, True, 0, 0)
+    """
+    def __init__(self, path):
+        self.path = path
+        self.db = create_engine('sqlite:///'+path)
+        header = pd.read_sql_table('header', self.db)
+        self.index = {}
+        for i in header.index:
+            row = header.loc[i]
+            if _gravity(row['gravity']) != fort_gravity:
+                continue
+            key = grid_key(row['temp'], row['noTiO'], row['ray'], row['flat'])
+            #the header lookup this replaces used the first matching row
+            if key not in self.index:
+                self.index[key] = row['name']
+        self.tables = {}
+
+        #.npy store is tied to this version of the grid file
+        store = cache_dir('fortney')
+        if store is not None:
+            stat = os.stat(path)
+            tag = '%s %d %f' % (os.path.abspath(path), stat.st_size, stat.st_mtime)
+            store = os.path.join(store, hashlib.sha256(tag.encode()).hexdigest()[0:16])
+            if not os.path.isdir(store):
+                try:
+                    os.makedirs(store)
+                except OSError:
+                    if not os.path.isdir(store):
+                        raise
+        self.store = store
+
+    def _npy(self, name):
+        return os.path.join(self.store, name + '.npy')
+
+    def _load(self, name):
+        if self.store is not None and os.path.isfile(self._npy(name)):
+            try:
+                table = np.load(self._npy(name), mmap_mode='r')
+                #most recently used for the eviction of ResultCache
+                os.utime(self._npy(name), None)
+                return table
+            except (IOError, OSError, ValueError):
+                #evicted from PANDEXO_CACHE in the meantime
+                pass
+        df = pd.read_sql_table(name, self.db)
+        table = np.ascontiguousarray(np.array([df['wavelength'], df['radius']], dtype=float))
+        table.flags.writeable = False
+        if self.store is not None:
+            tmp = self._npy(name) + '.' + str(os.getpid()) + '.tmp.npy'
+            np.save(tmp, table)
+            os.rename(tmp, self._npy(name))
+        return table
+
+    def get(self, temp, noTiO, ray, flat):
+        """Wavelength (micron) and radius (km) of a grid model, in the order of the table
+
+        Parameters
+        ----------
+        temp : float
+            planet temperature
+        noTiO : bool
+            True for the models without TiO
+        ray : float
+            rayleigh scattering enhancement (0 for none)
+        flat : float
+            flat cloud opacity (0 for none)
+
+        Returns
+        -------
+        wave, radius : array of float
+            read only arrays
+        """
+        key = grid_key(temp, noTiO, ray, flat)
+        if key not in self.index:
+            raise Exception('No Fortney Grid model for temp=%s, noTiO=%s, ray=%s, flat=%s' % key)
+        name = self.index[key]
+        if name not in self.tables:
+            self.tables[name] = self._load(name)
+        table = self.tables[name]
+        return table[0], table[1]
+
+    def convert(self):
+        """Saves every model in the index as a .npy file (requires PANDEXO_CACHE)
+        """
+        if self.store is None:
+            raise Exception('Set PANDEXO_CACHE to convert the Fortney Grid')
+        for name in self.index.values():
+            if not os.path.isfile(self._npy(name)):
+                self._load(name)
+
+def get_grid(path=None):
+    """Returns the (process wide) grid for path, FORTGRID_DIR by default
+    """
+    if path is None:
+        path = os.environ.get('FORTGRID_DIR')
+    if path not in grids:
+        try:
+            grids[path] = FortneyGrid(path)
+        except Exception:
+            raise Exception('Fortney Grid File Path is incorrect, or not initialized')
+    return grids[path]
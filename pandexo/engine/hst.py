@@ -218,7 +218,7 @@ def wfc3_TExoNS(dictinput):
     jmag = pandexo_input['star']['jmag']
     try:
         hmag = pandexo_input['star']['hmag']
-    except:
+    except Exception:
         hmag = jmag
         print("Hmag not found. Assuming no color dependence in the stellar type.")
     trdur = pandexo_input['planet']['transit_duration']
@@ -231,7 +231,7 @@ def wfc3_TExoNS(dictinput):
     useFirstOrbit = pandeia_input['strategy']['useFirstOrbit']
     try:
         targetFluence = pandeia_input['strategy']['targetFluence']
-    except:
+    except Exception:
         targetFluence = 30000.
         print("Assuming a target fluence of 30,000 electrons.")
     disperser = pandeia_input['configuration']['instrument']['disperser'].lower(
@@ -242,7 +242,7 @@ def wfc3_TExoNS(dictinput):
 
     try:
         samp_seq = samp_seq.lower()
-    except:
+    except Exception:
         pass
 
     if disperser == 'g141':
@@ -0,0 +1,75 @@
+from copy import deepcopy
+from pandeia.engine.instrument_factory import InstrumentFactory
+
+#process wide registry of pandeia instruments. Building an InstrumentFactory
+#loads the reference data for the mode, so it is only done once per worker
+registry = {}
+
+def registry_key(conf):
+    """Key for an instrument configuration
+
+    ngroup, nint and nexp are not part of the key. They do not change the
+    detector parameters, throughputs or the frame time.
+
+    Parameters
+    ----------
+    conf : dict
+        pandeia configuration dictionary (pandeia_input['configuration'])
+
+    Returns
+    -------
+    tuple
+        (instrument, mode, aperture, disperser, filter, subarray, readmode)
+    """
+    inst = conf['instrument']
+    det = conf['detector']
+    return (inst.get('instrument'), inst.get('mode'), inst.get('aperture'),
+            inst.get('disperser'), inst.get('filter'), det.get('subarray'),
+            det.get('readmode'))
+
+def get_instrument(conf):
+    """Returns memoized pandeia InstrumentFactory for a configuration
+
+    The instrument is built with 2 groups, 1 integration and 1 exposure, so
+    configurations with ngroup='optimize' can be looked up as well.
+
+    Parameters
+    ----------
+    conf : dict
+        pandeia configuration dictionary (pandeia_input['configuration'])
+
+    Returns
+    -------
+    InstrumentFactory
+        pandeia instrument
+
+    Examples
+    --------
+
+    >>> i = get_instrument(inst_dict['configuration'])
+    >>> wr = i.get_wave_range()
+    """
+    key = registry_key(conf)
+    if key not in registry:
+        conf_temp = deepcopy(conf)
+        conf_temp['detector']['ngroup'] = 2
+        conf_temp['detector']['nint'] = 1
+        conf_temp['detector']['nexp'] = 1
+        registry[key] = InstrumentFactory(config=conf_temp)
+    return registry[key]
+
+def get_detector_pars(conf):
+    """Memoized detector parameters (fullwell, rn, mingroups, etc)
+    """
+    return get_instrument(conf).get_detector_pars()
+
+def get_exposure_pars(conf):
+    """Memoized exposure parameters. Only use the frame parameters (tframe, nframe, nskip)
+    since the instrument is always built with 2 groups
+    """
+    return get_instrument(conf).get_exposure_pars()
+
+def clear_registry():
+    """Empties the registry (e.g. after updating the pandeia reference data)
+    """
+    registry.clear()
@@ -0,0 +1,362 @@
+import os
+import time
+import pickle
+import socket
+import threading
+from collections import OrderedDict
+
+#states of a job. pending covers queued and running, the web server knows
+#which of the two only for the jobs its own executor is running
+job_states = ['pending', 'finished', 'error', 'cancelled']
+
+#default number of jobs kept by a store
+default_max_jobs = 100
+
+#error of pending jobs whose server process is gone
+orphan_error = 'The server was restarted before the calculation finished, please submit it again'
+
+def current_owner():
+    """Host and pid of this server process, stored with the jobs it runs
+    """
+    return '%s:%d' % (socket.gethostname(), os.getpid())
+
+def owner_alive(owner):
+    """False if owner (see `current_owner`) is a process on this host that is gone
+
+    Processes on other hosts can't be checked and count as alive.
+    """
+    if not owner:
+        return True
+    host, pid = owner.rsplit(':', 1)
+    if host != socket.gethostname():
+        return True
+    if int(pid) == os.getpid():
+        return True
+    try:
+        os.kill(int(pid), 0)
+    except ProcessLookupError:
+        return False
+    except OSError:
+        #e.g. owned by another user
+        pass
+    return True
+
+def default_url():
+    """SQLite file in PANDEXO_TEMP (the temp directory of the web server by default)
+    """
+    temp = os.environ.get("PANDEXO_TEMP", os.path.join(os.path.dirname(__file__), "temp"))
+    return 'sqlite:///' + os.path.join(temp, 'jobs.db')
+
+def from_env():
+    """Builds the job store of the web server from the environment
+
+    PANDEXO_JOBSTORE is either "memory" or a sqlalchemy database url. It defaults
+    to a SQLite file in PANDEXO_TEMP. PANDEXO_MAX_JOBS caps the number of jobs kept
+    (default 100). Pending jobs left behind by a server process on this host that 
+    is gone are marked as errors.
+
+    Returns
+    -------
+    MemoryJobStore or SQLJobStore
+    """
+    url = os.environ.get('PANDEXO_JOBSTORE', default_url())
+    max_jobs = int(os.environ.get('PANDEXO_MAX_JOBS', default_max_jobs))
+    if url == 'memory':
+        return MemoryJobStore(max_jobs=max_jobs)
+    store = SQLJobStore(url, max_jobs=max_jobs)
+    norphans = store.fail_orphans()
+    if norphans > 0:
+        print("Marked %d calculations of stopped servers as errors" % norphans)
+    return store
+
+class MemoryJobStore():
+    """Job store of a single server process
+
+    Keeps the state and result of the last max_jobs jobs in memory, like the
+    original task buffer of the web server. Results are lost on restart.
+
+    Parameters
+    ----------
+    max_jobs : int
+        (Optional) jobs kept, oldest are removed first. Default = 100
+
+    Methods
+    -------
+    add
+        registers a new job
+    finish
+        stores the result or error of a job
+    get
+        state of a job
+    result
+        result of a finished job
+    view
+        rendered page of a finished job
+    put_view
+        stores the rendered page of a job
+    jobs
+        jobs of a user
+    fail_orphans
+        marks pending jobs of stopped servers as errors
+    """
+    def __init__(self, max_jobs=default_max_jobs):
+        self.max_jobs = max_jobs
+        self.lock = threading.Lock()
+        self.records = OrderedDict()
+        self.results = {}
+        self.views = {}
+        self.count = 0
+
+    def add(self, id, name, cookie):
+        """Registers a pending job
+
+        Parameters
+        ----------
+        id : str
+            job id
+        name : str
+            name given by the user
+        cookie : str
+            pandexo_user cookie of the user
+        """
+        with self.lock:
+            self.count += 1
+            self.records[id] = {'id': id, 'name': name, 'cookie': cookie, 'count': self.count,
+                                'state': 'pending', 'error': None, 'created': time.time(),
+                                'owner': current_owner()}
+            while (self.max_jobs is not None) and (len(self.records) > self.max_jobs):
+                old, record = self.records.popitem(last=False)
+                self.results.pop(old, None)
+                self.views.pop(old, None)
+
+    def finish(self, id, state, result=None, error=None, view=None):
+        """Stores the outcome of a job
+
+        Parameters
+        ----------
+        id : str
+            job id
+        state : str
+            "finished", "error" or "cancelled"
+        result : dict
+            (Optional) output of the calculation
+        error : str
+            (Optional) traceback of the calculation
+        view : tuple
+            (Optional) rendered (script, div) of the result page
+        """
+        with self.lock:
+            if id not in self.records:
+                return
+            self.records[id]['state'] = state
+            self.records[id]['error'] = error
+            if result is not None:
+                self.results[id] = result
+            if view is not None:
+                self.views[id] = view
+
+    def get(self, id):
+        """Job record (id, name, cookie, count, state, error, created, owner) or None
+        """
+        with self.lock:
+            record = self.records.get(id)
+            return None if record is None else dict(record)
+
+    def result(self, id):
+        """Result of a finished job or None
+        """
+        with self.lock:
+            return self.results.get(id)
+
+    def view(self, id):
+        """Rendered (script, div) of a job or None
+        """
+        with self.lock:
+            return self.views.get(id)
+
+    def put_view(self, id, view):
+        """Stores the rendered (script, div) of a job
+        """
+        with self.lock:
+            if id in self.records:
+                self.views[id] = view
+
+    def jobs(self, cookie):
+        """Records of all jobs of a user, oldest first
+        """
+        with self.lock:
+            return [dict(r) for r in self.records.values() if r['cookie'] == cookie]
+
+    def fail_orphans(self):
+        """Marks pending jobs whose server process is gone as errors
+
+        Jobs in memory always belong to this process, so there are none.
+
+        Returns
+        -------
+        int
+            number of jobs marked
+        """
+        return 0
+
+class SQLJobStore():
+    """Job store in a database, shared by several server processes
+
+    Holds the state of every job and its pickled result in a single table, so
+    that status, view and download requests can be answered by any process
+    behind a load balancer, and results survive restarts.
+
+    Parameters
+    ----------
+    url : str
+        sqlalchemy database url, e.g. "sqlite:////data/pandexo/jobs.db"
+    max_jobs : int
+        (Optional) jobs kept, oldest are removed first, None for no limit. Default = 100
+
+    Methods
+    -------
+    add
+        registers a new job
+    finish
+        stores the result or error of a job
+    get
+        state of a job
+    result
+        result of a finished job
+    view
+        rendered page of a finished job
+    put_view
+        stores the rendered page of a job
+    jobs
+        jobs of a user
+    fail_orphans
+        marks pending jobs of stopped servers as errors
+    """
+    def __init__(self, url, max_jobs=default_max_jobs):
+        from sqlalchemy import (create_engine, MetaData, Table, Column, Integer, String,
+                                Float, Text, LargeBinary)
+        self.url = url
+        self.max_jobs = max_jobs
+        connect_args = {}
+        if url.startswith('sqlite'):
+            #done callbacks write from the executor's thread
+            connect_args = {'check_same_thread': False, 'timeout': 30}
+        self.engine = create_engine(url, connect_args=connect_args)
+        metadata = MetaData()
+        self.table = Table('jobs', metadata,
+                           Column('count', Integer, primary_key=True, autoincrement=True),
+                           Column('id', String(64), unique=True, index=True),
+                           Column('name', Text),
+                           Column('cookie', String(64), index=True),
+                           Column('state', String(16)),
+                           Column('error', Text),
+                           Column('created', Float),
+                           Column('owner', String(128)),
+                           Column('result', LargeBinary),
+                           Column('view', LargeBinary))
+        metadata.create_all(self.engine)
+        self.columns = [c for c in self.table.columns if c.name not in ['result', 'view']]
+
+    def _record(self, row):
+        row = getattr(row, '_mapping', row)
+        return {c.name: row[c.name] for c in self.columns}
+
+    def add(self, id, name, cookie):
+        """Registers a pending job (see `MemoryJobStore.add`)
+        """
+        table = self.table
+        with self.engine.begin() as conn:
+            conn.execute(table.insert().values(id=id, name=name, cookie=cookie, state='pending',
+                                               created=time.time(), owner=current_owner()))
+        if self.max_jobs is not None:
+            self.prune(self.max_jobs)
+
+    def prune(self, max_jobs):
+        """Removes the oldest jobs so that at most max_jobs are left
+        """
+        table = self.table
+        with self.engine.begin() as conn:
+            rows = conn.execute(table.select().with_only_columns(table.c['count'])
+                                .order_by(table.c['count'].desc()).offset(max_jobs).limit(1)).fetchall()
+            if len(rows) > 0:
+                conn.execute(table.delete().where(table.c['count'] <= rows[0][0]))
+
+    def finish(self, id, state, result=None, error=None, view=None):
+        """Stores the outcome of a job (see `MemoryJobStore.finish`)
+        """
+        values = {'state': state, 'error': error}
+        if result is not None:
+            values['result'] = pickle.dumps(result, protocol=pickle.HIGHEST_PROTOCOL)
+        if view is not None:
+            values['view'] = pickle.dumps(view, protocol=pickle.HIGHEST_PROTOCOL)
+        table = self.table
+        with self.engine.begin() as conn:
+            conn.execute(table.update().where(table.c.id == id).values(**values))
+
+    def get(self, id):
+        """Job record (id, name, cookie, count, state, error, created, owner) or None
+        """
+        table = self.table
+        with self.engine.connect() as conn:
+            row = conn.execute(table.select().with_only_columns(*self.columns)
+                               .where(table.c.id == id)).fetchone()
+        return None if row is None else self._record(row)
+
+    def _load(self, id, column):
+        table = self.table
+        with self.engine.connect() as conn:
+            row = conn.execute(table.select().with_only_columns(table.c[column])
+                               .where(table.c.id == id)).fetchone()
+        if (row is None) or (row[0] is None):
+            return None
+        return pickle.loads(row[0])
+
+    def result(self, id):
+        """Result of a finished job or None
+        """
+        return self._load(id, 'result')
+
+    def view(self, id):
+        """Rendered (script, div) of a job or None
+        """
+        return self._load(id, 'view')
+
+    def put_view(self, id, view):
+        """Stores the rendered (script, div) of a job
+        """
+        table = self.table
+        with self.engine.begin() as conn:
+            conn.execute(table.update().where(table.c.id == id)
+                         .values(view=pickle.dumps(view, protocol=pickle.HIGHEST_PROTOCOL)))
+
+    def jobs(self, cookie):
+        """Records of all jobs of a user, oldest first
+        """
+        table = self.table
+        with self.engine.connect() as conn:
+            rows = conn.execute(table.select().with_only_columns(*self.columns)
+                                .where(table.c.cookie == cookie)
+                                .order_by(table.c['count'])).fetchall()
+        return [self._record(r) for r in rows]
+
+    def fail_orphans(self):
+        """Marks pending jobs whose server process is gone as errors
+
+        Only the server processes on this host can be checked (see `owner_alive`).
+
+        Returns
+        -------
+        int
+            number of jobs marked
+        """
+        table = self.table
+        with self.engine.connect() as conn:
+            rows = conn.execute(table.select().with_only_columns(table.c.id, table.c.owner)
+                                .where(table.c.state == 'pending')).fetchall()
+        orphans = [row[0] for row in rows if not owner_alive(row[1])]
+        if len(orphans) > 0:
+            with self.engine.begin() as conn:
+                conn.execute(table.update().where(table.c.id.in_(orphans))
+                             .where(table.c.state == 'pending')
+                             .values(state='error', error=orphan_error))
+        return len(orphans)
@@ -1,10 +1,16 @@
 import numpy as np
-from pandeia.engine.instrument_factory import InstrumentFactory
 from .pandexo import wrapper
 from .load_modes import SetDefaultModes
+from .inst_registry import get_instrument
+from . import create_input as create
+from .sweep import grid_points, set_param, GridResult, PointStore, inst_dim
+from .sweep import point_key, summarize, sweep_tag, run_safe, error_table
+from concurrent.futures import ProcessPoolExecutor, as_completed, wait, FIRST_COMPLETED
+from concurrent.futures.process import BrokenProcessPool
+import traceback
+from copy import deepcopy
 import os
 import pickle as pkl
-from joblib import Parallel, delayed
 import multiprocessing
 import json
 from .exomast import get_target_data
@@ -13,6 +19,10 @@ import astropy.units as u
 
 user_cores = multiprocessing.cpu_count()
 
+#arguments that are the same for every task of a sweep (exo, shared spectra),
+#set once per worker process by _init_worker
+_worker_args = None
+
 ALL = {"WFC3 G141":False,
        "MIRI LRS":False,
        "NIRISS SOSS":False,
@@ -105,7 +115,7 @@ def load_exo_dict(planet_name=None):
         pandexo_input["planet"]["ecc"]        = planet_data['eccentricity'] 
         try:
             pandexo_input["planet"]["w"]      = float(planet_data['omega'] )
-        except: 
+        except Exception:
             pandexo_input["planet"]["w"]      = 90.
     return pandexo_input
 
@@ -167,7 +177,7 @@ def get_thruput(inst, niriss=1, nirspec='f100lp'):
         #pandeia handles slit losses inside the 2d engine. So, you need to account for the
         #extra .663 here
         conf["instrument"]["disperser"] = conf["instrument"]["disperser"] +'_'+str(niriss)
-        i = InstrumentFactory(config=conf)
+        i = get_instrument(conf)
         wr = i.get_wave_range()
         wave = np.linspace(wr['wmin'], wr['wmax'], num=500)
         pce = i.get_total_eff(wave)
@@ -175,13 +185,113 @@ def get_thruput(inst, niriss=1, nirspec='f100lp'):
     elif (conf['instrument']['instrument'].lower() =='nirspec') and ('g140' in conf["instrument"]["disperser"]):
         conf["instrument"]["filter"] = nirspec
 
-    i = InstrumentFactory(config=conf)
+    i = get_instrument(conf)
     wr = i.get_wave_range()
     wave = np.linspace(wr['wmin'], wr['wmax'], num=500)
     pce = i.get_total_eff(wave)
     return {'wave':wave,'pce':pce}
 
-def run_param_space(i,exo,inst,param_space):
+def shared_inputs(exo, param_space=None):
+    """Computes the stellar and planet spectra once for a sweep
+
+    The normalized stellar spectrum and the planet spectrum do not change in a
+    sweep over instruments or over observation parameters, so they are computed
+    once in the parent and sent once to each worker (see `run_shared`).
+    The stellar spectrum is also shared for sweeps over planet parameters.
+
+    Parameters
+    ----------
+    exo : dict
+        Exoplanet dictionary which can be loaded in and editted through `load_exo_dict`
+    param_space : str
+        (Optional) parameter being looped over, e.g. "star+temp"
+
+    Returns
+    -------
+    dict or None
+        {"pandexo_input": copy of exo, "star_spec": dict, "both_spec": dict} to add to
+        the input of **compute_full_sim**, or None if nothing can be shared
+    """
+    key1 = None
+    if isinstance(param_space, str):
+        key1 = param_space[0:param_space.find('+')]
+    if key1 == 'star':
+        return None
+    #outTrans and bothTrans fill in units etc in exo, so work on a copy
+    exo = deepcopy(exo)
+    shared = {"pandexo_input": exo}
+    shared['star_spec'] = create.outTrans(exo['star'])
+    #the pysynphot copy of the spectrum is not used by the workers, don't send it
+    shared['star_spec'].pop('phoenix', None)
+    if key1 != 'planet':
+        shared['both_spec'] = create.bothTrans(shared['star_spec'], exo['planet'], star=exo['star'])
+    return shared
+
+def shared_probe(exo, inst, param_space, param_range, shared=None):
+    """Runs the Pandeia duty cycle run once for a FML sweep
+
+    For the FML calculation the out of transit Pandeia run and the saturation
+    probe only depend on the instrument and on the stellar sed. If the sed is the
+    same for every point in the sweep (observation parameters, planet models on a
+    common wavelength grid) or only scales with it (stellar magnitude), one run of
+    the first point is rescaled in **compute_full_sim** instead of running Pandeia
+    for each point. Points where it does not apply fall back to a full run. Only
+    used if exo['observation']['share_probe'] is True, as these runs leave out
+    Pandeia's out of transit SNR products (see **jwst.rescale_probe**).
+
+    Parameters
+    ----------
+    exo : dict
+        Exoplanet dictionary which can be loaded in and editted through `load_exo_dict`
+    inst : str
+        Key which indicates with instrument
+    param_space : str
+        parameter being looped over, e.g. "planet+exopath"
+    param_range : list
+        values of the parameter
+    shared : dict
+        (Optional) output of `shared_inputs`
+
+    Returns
+    -------
+    dict or None
+        output of **jwst.make_probe**, or None if the sweep can not share it
+    """
+    from .jwst import make_probe
+    key1 = param_space[0:param_space.find('+')]
+    key2 = param_space[param_space.find('+')+1:len(param_space)]
+    if exo['calculation'].lower() != 'fml' or exo['planet']['w_unit'] == 'sec':
+        return None
+    if (key1 == 'star') and (key2 != 'mag'):
+        return None
+    if len(param_range) < 2:
+        return None
+    dictinput = {"pandeia_input": load_mode_dict(inst)}
+    #only the optimized ngroup uses the duty cycle run
+    if isinstance(dictinput['pandeia_input']['configuration']['detector']['ngroup'], (float,int)):
+        return None
+    if shared is not None:
+        dictinput.update(shared)
+    dictinput['pandexo_input'] = deepcopy(dictinput.get('pandexo_input', exo))
+    dictinput['pandexo_input'][key1][key2] = param_range[0]
+    #the planet spectrum changes in a planet sweep
+    if key1 == 'planet':
+        dictinput.pop('both_spec', None)
+    print("Computing Shared Duty Cycle Calc")
+    return make_probe(dictinput)
+
+def run_sweep_point(name, dictinput, timeout=None, capture_errors=False):
+    """Runs one point of a run_pandexo sweep. Errors are raised unless
+    capture_errors is True, in which case they are printed with their traceback
+    and give None so that a failure does not stop the others
+    """
+    result, error = run_safe(wrapper, (dictinput,), timeout=timeout, capture=capture_errors)
+    if error is not None:
+        print("Run %s failed after %.1f secs: %s" % (name, error['secs'], error['error']))
+        print(error['traceback'])
+    return result
+
+def run_param_space(i,exo,inst,param_space,shared=None,timeout=None,capture_errors=False):
     """Changes exo dictionary and submits run
 
     This function is used to reset the exo dictionary based on what parameter
@@ -201,23 +311,34 @@ def run_param_space(i,exo,inst,param_space):
         Set of keys within exo_dict to indicate which parameter to loop through.
         Should be in the format of "first level of dict"+"second level of dict".
         For example, for stellar temp `param_space` would be "star+temp"
+    shared : dict
+        (Optional) output of `shared_inputs` and `shared_probe`, only used for JWST
+    timeout : float
+        (Optional) wall clock limit of the run in seconds
+    capture_errors : bool
+        (Optional) if True a failed run gives None instead of raising. Default = False
 
     Returns
     -------
     dict
         Dictionary with output of pandexo. Key is the value of the parameter that was
-        looped through.
+        looped through. The output is None if the run failed and capture_errors is True
     """
+    #load in correct dict format
+    inst_dict = load_mode_dict(inst)
+    dictinput = {"pandeia_input": inst_dict , "pandexo_input":exo}
+    if (shared is not None) and (inst_dict['telescope'] == 'jwst'):
+        dictinput.update(shared)
+    #exo and shared are the same objects for every point a worker runs, never change them
+    dictinput['pandexo_input'] = deepcopy(dictinput['pandexo_input'])
     #break up parameter space to two separate dictionary keys
     key1 = param_space[0:param_space.find('+')]
     key2 = param_space[param_space.find('+')+1:len(param_space)]
-    exo[key1][key2] = i
-    #load in correct dict format
-    inst_dict = load_mode_dict(inst)
+    dictinput['pandexo_input'][key1][key2] = i
     name = os.path.split(str(i))[1]
-    return {name: wrapper({"pandeia_input": inst_dict , "pandexo_input":exo})}
+    return {name: run_sweep_point(name, dictinput, timeout, capture_errors)}
 
-def run_inst_space(inst,exo):
+def run_inst_space(inst,exo,shared=None,timeout=None,capture_errors=False):
     """Changes inst dictionary and submits run
 
     This function is used to reset the instrument dictionary.
@@ -228,20 +349,32 @@ def run_inst_space(inst,exo):
         Exoplanet dictionary which can be loaded in and editted through `load_exo_dict`
     inst : str
         Key which indicates with instrument
+    shared : dict
+        (Optional) output of `shared_inputs`, only used for JWST
+    timeout : float
+        (Optional) wall clock limit of the run in seconds
+    capture_errors : bool
+        (Optional) if True a failed run gives None instead of raising. Default = False
 
     Returns
     -------
     dict
         Dictionary with output of pandexo. Key is the value of the parameter that was
-        looped through.
+        looped through. The output is None if the run failed and capture_errors is True
     """
     #load in correct dict format
     inst_dict = load_mode_dict(inst)
-    return {inst: wrapper({"pandeia_input": inst_dict , "pandexo_input":exo})}
+    dictinput = {"pandeia_input": inst_dict , "pandexo_input":exo}
+    if (shared is not None) and (inst_dict['telescope'] == 'jwst'):
+        dictinput.update(shared)
+    #exo and shared are the same objects for every point a worker runs, never change them
+    dictinput['pandexo_input'] = deepcopy(dictinput['pandexo_input'])
+    return {inst: run_sweep_point(inst, dictinput, timeout, capture_errors)}
 
 
 def run_pandexo(exo, inst, param_space = 0, param_range = 0,save_file = True,
-                            output_path=os.getcwd(), output_file = '',num_cores=user_cores):
+                            output_path=os.getcwd(), output_file = '',num_cores=user_cores,
+                            store=None, timeout=None, capture_errors=False):
     """Submits multiple runs of pandexo in parallel.
 
     Functionality: program contains functionality for running single or
@@ -271,6 +404,17 @@ def run_pandexo(exo, inst, param_space = 0, param_range = 0,save_file = True,
     output_file : str
         (Optional) Default is "singlerun.p" for single runs, "param_space.p" for exo parameter runs
         or "instrument_run.p" for instrument parameter space runs.
+    store : str
+        (Optional) For multiple runs, directory to write each output to as soon as it
+        is done instead of keeping all of them in memory. An interrupted run resumes
+        from the store (see `run_grid`)
+    timeout : float
+        (Optional) For multiple runs, wall clock limit of each run in seconds. Only
+        enforced on unix, in workers that run the point in their main thread
+    capture_errors : bool
+        (Optional) For multiple runs, runs that fail or time out give None instead of
+        stopping the others. Default = False raises the error. Runs with a store
+        always keep going and list their failures (see `run_grid`)
 
     Returns
     -------
@@ -280,6 +424,7 @@ def run_pandexo(exo, inst, param_space = 0, param_range = 0,save_file = True,
         For multiple runs the output will be organized into a list with each
         a dictionary named by whatever you are looping through
         i.e. [{'First temp': PandExoDict}, {'Second temp': PandExoDict}, etc..]
+        With store, multiple runs return the `sweep.GridResult` of `run_grid`
 
     Example
     -------
@@ -315,6 +460,21 @@ def run_pandexo(exo, inst, param_space = 0, param_range = 0,save_file = True,
         print('Enter in format ["NIRSpec G140M"] or ["NIRISS SOSS","MIRI LRS"]')
         return
 
+    #stream multiple runs to disk
+    if store is not None:
+        if len(inst)==1 and inst[0].lower() == 'run all':
+            inst = list(ALL.keys())
+        if len(inst) > 1:
+            grid = {inst_dim: inst}
+        elif not isinstance(param_space, (float, int)):
+            grid = {param_space: param_range}
+        else:
+            grid = None
+        if grid is not None:
+            return run_grid(exo, grid, inst=inst[0], save_file=save_file, output_path=output_path,
+                            output_file=output_file, num_cores=num_cores, store=store,
+                            timeout=timeout)
+
     #single instrument mode and single planet OR several planets
 
     if len(inst)==1 and inst[0] != 'RUN ALL':
@@ -332,7 +492,15 @@ def run_pandexo(exo, inst, param_space = 0, param_range = 0,save_file = True,
         #if there are parameters to cycle through this will run
         print("Running through exo parameters in parallel: " + param_space)
         #run the above function in parallel
-        results = Parallel(n_jobs=num_cores)(delayed(run_param_space)(i,exo,inst[0],param_space) for i in param_range)
+        shared = None
+        if load_mode_dict(inst[0])['telescope'] == 'jwst':
+            shared = shared_inputs(exo, param_space)
+            if exo['observation'].get('share_probe', False):
+                probe = shared_probe(exo, inst[0], param_space, param_range, shared)
+                if probe is not None:
+                    shared = dict(shared or {}, probe=probe)
+        results = run_shared(run_param_space, param_range,
+                             (exo,inst[0],param_space,shared,timeout,capture_errors), num_cores)
 
         #Default dump all results [an array of dictionaries] into single file
         #and return results immediately to user
@@ -346,7 +514,8 @@ def run_pandexo(exo, inst, param_space = 0, param_range = 0,save_file = True,
     print("Running select instruments")
     if len(inst)>1:
 
-        results = Parallel(n_jobs=num_cores)(delayed(run_inst_space)(i, exo) for i in inst)
+        shared = shared_inputs(exo)
+        results = run_shared(run_inst_space, inst, (exo, shared, timeout, capture_errors), num_cores)
 
         #Default dump all results [an array of dictionaries] into single file
         #and return results immediately to user
@@ -358,7 +527,9 @@ def run_pandexo(exo, inst, param_space = 0, param_range = 0,save_file = True,
     #cycle through all options
     elif inst[0].lower() == 'run all':
         print("Running through all instruments")
-        results = Parallel(n_jobs=num_cores)(delayed(run_inst_space)(i, exo) for i in ALL.keys())
+        shared = shared_inputs(exo)
+        results = run_shared(run_inst_space, list(ALL.keys()), (exo, shared, timeout, capture_errors),
+                             num_cores)
 
         #Default dump all results [an array of dictionaries] into single file
         #and return results immediately to user
@@ -367,6 +538,349 @@ def run_pandexo(exo, inst, param_space = 0, param_range = 0,save_file = True,
         if save_file: pkl.dump(results, open(os.path.join(output_path,output_file),'wb'))
         return results
 
+def run_grid_point(point, exo, inst, shared=None):
+    """Runs one point of a grid sweep
+
+    Parameters
+    ----------
+    point : dict
+        {param: value} for this point (see `sweep.grid_points`)
+    exo : dict
+        Exoplanet dictionary which can be loaded in and editted through `load_exo_dict`
+    inst : str or dict
+        instrument used if "inst" is not one of the grid parameters
+    shared : dict
+        (Optional) output of `shared_inputs`, only used for JWST
+
+    Returns
+    -------
+    dict
+        output of pandexo
+    """
+    #points of a batch are sent together, so never change the exo they share
+    exo = deepcopy(exo)
+    for param, value in point.items():
+        if param != inst_dim:
+            set_param(exo, param, value)
+    inst = point.get(inst_dim, inst)
+    if isinstance(inst, dict):
+        inst_dict = deepcopy(inst)
+    else:
+        inst_dict = load_mode_dict(inst)
+    dictinput = {"pandeia_input": inst_dict , "pandexo_input":exo}
+    if (shared is not None) and (inst_dict['telescope'] == 'jwst'):
+        dictinput.update(shared)
+        dictinput['pandexo_input'] = exo
+    return wrapper(dictinput)
+
+def run_grid_chunk(points, exo, inst, shared, path, summary, timeout):
+    """Runs points of a grid sweep, isolating failures of each point
+
+    Parameters
+    ----------
+    points : list of dict
+        {param: value} for each point
+    exo : dict
+        Exoplanet dictionary
+    inst : str or dict
+        instrument used if "inst" is not one of the grid parameters
+    shared : dict
+        output of `shared_inputs` or None
+    path : str
+        directory of the `sweep.PointStore`, or None to return the outputs
+    summary : function
+        with path, returns what is kept in memory of each output
+    timeout : float
+        wall clock limit of each point in seconds, or None
+
+    Returns
+    -------
+    list
+        (point, output or summary, error) of each point. Failed points have no
+        output and an error dict (see `sweep.run_safe`)
+    """
+    store = None
+    if path is not None:
+        store = PointStore(path)
+    out = []
+    for point in points:
+        result, error = run_safe(run_grid_point, (point, exo, inst, shared), timeout=timeout)
+        if error is not None:
+            print("Point %s failed: %s" % (dict(point), error['error']))
+        elif store is not None:
+            store.write(point, result)
+            result = summary(result)
+        out += [(point, result, error)]
+    return out
+
+def _init_worker(args):
+    """Initializer of the sweep workers, so that exo and shared are sent once per
+    worker instead of with every task
+    """
+    global _worker_args
+    _worker_args = args
+
+def _run_worker_chunk(points):
+    """`run_grid_chunk` with the arguments given to `_init_worker`
+    """
+    return run_grid_chunk(points, *_worker_args)
+
+def _run_worker_value(value):
+    """Calls the function given to `_init_worker` for one value (see `run_shared`)
+    """
+    return _worker_args[0](value, *_worker_args[1:])
+
+def run_shared(func, values, args, num_cores):
+    """Runs func(value, *args) for every value in a process pool
+
+    Only the value is sent with each task. The other arguments (exo, shared
+    spectra and duty cycle run) are the same for every value, so they are sent
+    once to each worker (see `_init_worker`). func must not change them.
+
+    Parameters
+    ----------
+    func : function
+        e.g. `run_param_space` or `run_inst_space`
+    values : list
+        first argument of func for each task
+    args : tuple
+        other arguments of func
+    num_cores : int
+        number of workers
+
+    Returns
+    -------
+    list
+        output of func for each value, in order. The first error is raised
+    """
+    values = list(values)
+    num_cores = max(min(num_cores, len(values)), 1)
+    with ProcessPoolExecutor(num_cores, initializer=_init_worker,
+                             initargs=((func,) + tuple(args),)) as executor:
+        return list(executor.map(_run_worker_value, values))
+
+def _chunk_error(points, e):
+    #e.g. inputs or outputs that can not be pickled
+    return [(p, None, {'error': repr(e), 'traceback': traceback.format_exc(),
+                       'secs': 0.0}) for p in points]
+
+def run_chunks(chunks, args, num_cores, retries):
+    """Runs chunks of grid points in a process pool, yielding them as they finish
+
+    The arguments other than the points are sent once to each worker (see
+    `_init_worker`). If a worker dies (segfault, out of memory) every chunk that
+    was still pending fails with it, so the points of those chunks are run again
+    one at a time, each in its own single worker pool (see `run_isolated`). There
+    a crash is charged only to the point that caused it.
+
+    Parameters
+    ----------
+    chunks : list of list of dict
+        points of each chunk
+    args : tuple
+        other arguments of `run_grid_chunk`
+    num_cores : int
+        number of workers
+    retries : int
+        times a point is run again after it crashed its worker
+
+    Yields
+    ------
+    list
+        output of `run_grid_chunk` for one chunk
+    """
+    broken = []
+    with ProcessPoolExecutor(num_cores, initializer=_init_worker, initargs=(args,)) as executor:
+        futures = {executor.submit(_run_worker_chunk, chunk): chunk for chunk in chunks}
+        for future in as_completed(futures):
+            chunk = futures[future]
+            try:
+                out = future.result()
+            except BrokenProcessPool:
+                broken += chunk
+                continue
+            except Exception as e:
+                out = _chunk_error(chunk, e)
+            yield out
+    if len(broken) > 0:
+        print("Worker crashed, running the %d unfinished points one at a time" % len(broken))
+        for out in run_isolated(broken, args, num_cores, retries):
+            yield out
+
+def run_isolated(points, args, num_cores, retries):
+    """Runs grid points one at a time, each worker in its own pool
+
+    Every pool has a single worker that only ever holds one point, so when it
+    dies the crash is charged to that point alone and only its pool is restarted.
+
+    Parameters
+    ----------
+    points : list of dict
+        points to run
+    args : tuple
+        other arguments of `run_grid_chunk`
+    num_cores : int
+        number of pools running at once
+    retries : int
+        times a point is run again after it crashed its worker
+
+    Yields
+    ------
+    list
+        output of `run_grid_chunk` for one point
+    """
+    todo = list(range(len(points)))
+    crashes = [0]*len(points)
+    pools = [None]*min(num_cores, len(points))
+    running = {}
+    try:
+        while (len(todo) > 0) or (len(running) > 0):
+            busy = [slot for slot, i in running.values()]
+            for slot in range(len(pools)):
+                if (slot in busy) or (len(todo) == 0):
+                    continue
+                if pools[slot] is None:
+                    pools[slot] = ProcessPoolExecutor(1, initializer=_init_worker, initargs=(args,))
+                i = todo.pop(0)
+                running[pools[slot].submit(_run_worker_chunk, [points[i]])] = (slot, i)
+            finished, pending = wait(list(running), return_when=FIRST_COMPLETED)
+            for future in finished:
+                slot, i = running.pop(future)
+                try:
+                    out = future.result()
+                except BrokenProcessPool:
+                    pools[slot].shutdown(wait=False)
+                    pools[slot] = None
+                    crashes[i] += 1
+                    if crashes[i] > retries:
+                        error = {'error': 'Worker crashed (%d attempts)' % crashes[i],
+                                 'traceback': '', 'secs': 0.0}
+                        yield [(points[i], None, error)]
+                    else:
+                        print("Worker crashed on point %s, running it again" % dict(points[i]))
+                        todo += [i]
+                    continue
+                except Exception as e:
+                    out = _chunk_error([points[i]], e)
+                yield out
+    finally:
+        for pool in pools:
+            if pool is not None:
+                pool.shutdown(wait=False)
+
+def run_grid(exo, grid, inst=None, mode='product', batch_size='auto', save_file=True,
+                    output_path=os.getcwd(), output_file='', num_cores=user_cores,
+                    store=None, summary=summarize, timeout=None, retries=2):
+    """Runs a multi dimensional sweep in a single parallel pool
+
+    Every combination of instruments and exo parameters is flattened into one list
+    of jobs, so that all cores stay busy across dimensions, and the outputs are
+    put back on a labeled grid. A point that fails or runs out of time does not
+    stop the sweep: its output is None and it is listed in `GridResult.errors`.
+
+    Parameters
+    ----------
+    exo : dict
+        exoplanet input dictionary
+    grid : dict
+        {param: list of values}. Keys are "inst" for a list of instruments or
+        "first level+second level" of exo, e.g. {"inst": ["NIRSpec G395M", "MIRI LRS"],
+        "star+mag": [8, 10], "observation+noccultations": [1, 2]}
+    inst : str or dict
+        (Optional) instrument for every point if "inst" is not in grid
+    mode : str
+        (Optional) "product" runs every combination, "zip" steps through all lists
+        together. Default = "product"
+    batch_size : int or 'auto'
+        (Optional) number of points sent to a worker at once. Default = 'auto' (1)
+    save_file : bool
+        (Optional) Default = True saves the GridResult as a pickle
+    output_path : str
+        (Optional) Default = os.getcwd()
+    output_file : str
+        (Optional) Default = "grid_run.p"
+    num_cores : int
+        (Optional) Default = multiprocessing.cpu_count()
+    store : str
+        (Optional) directory to stream the outputs to. Each point is saved there as
+        soon as it is done and only its summary is kept in memory. Running the same
+        sweep again with the same store skips the points that are already done, 
+        failed points are run again
+    summary : function
+        (Optional) with store, returns what is kept in memory of each output.
+        Must be importable by the workers. Default = `sweep.summarize`
+    timeout : float
+        (Optional) wall clock limit of a single point in seconds. It uses SIGALRM, so
+        it is not enforced on windows. Default = None
+    retries : int
+        (Optional) times a point that crashed its worker is run again. Default = 2
+
+    Returns
+    -------
+    GridResult
+        labeled N dimensional array of pandexo outputs (see `sweep.GridResult`), or
+        of their summaries if store is given (use `GridResult.load` for the outputs)
+
+    Examples
+    --------
+
+    >>> res = run_grid(exo, {"inst": ["NIRSpec G395M", "MIRI LRS"],
+                             "planet+exopath": ["wasp12b.txt", "hd189.txt"],
+                             "observation+noccultations": [1, 2, 4]}, timeout=600)
+    >>> res.shape
+    (2, 2, 3)
+    >>> res.sel({"inst": "MIRI LRS", "observation+noccultations": 2})
+    >>> res.errors
+    """
+    if (inst_dim not in grid) and (inst is None):
+        raise Exception('Specify inst or include "inst" in grid')
+    dims, coords, points = grid_points(grid, mode)
+    print("Running grid of %d points in parallel: %s" % (len(points), ', '.join(grid.keys())))
+
+    #spectra only need to be computed once if no star or planet parameter changes
+    shared = None
+    if not any(k.startswith('star+') or k.startswith('planet+') for k in grid):
+        shared = shared_inputs(exo)
+
+    done = {}
+    path = None
+    if store is not None:
+        store = PointStore(store, tag=sweep_tag(exo, inst, mode))
+        path = store.path
+        done = store.done()
+        if len(done) > 0:
+            print("Resuming grid: %d points already in %s" % (len(done), store.path))
+
+    todo = [p for p in points if point_key(p) not in done]
+    if batch_size == 'auto':
+        batch_size = 1
+    chunks = [todo[i:i+batch_size] for i in range(0, len(todo), batch_size)]
+
+    errors = []
+    ndone = len(points) - len(todo)
+    for out in run_chunks(chunks, (exo, inst, shared, path, summary, timeout), num_cores, retries):
+        for point, result, error in out:
+            if error is not None:
+                errors += [(point, error)]
+                continue
+            if store is not None:
+                store.add(point, result)
+            done[point_key(point)] = result
+        ndone += len(out)
+        print("Finished %d of %d points" % (ndone, len(points)))
+    if len(errors) > 0:
+        print("%d of %d points failed, see GridResult.errors" % (len(errors), len(points)))
+
+    values = np.empty(len(points), dtype=object)
+    values[:] = [done.get(point_key(p)) for p in points]
+    res = GridResult(dims, coords, values.reshape([len(coords[d]) for d in dims]), store=store,
+                     errors=error_table(errors, list(grid.keys())))
+
+    if output_file == '':
+        output_file = 'grid_run.p'
+    if save_file: pkl.dump(res, open(os.path.join(output_path,output_file),'wb'))
+    return res
+
 def subarrays(inst):
   """function to show availalble subarrays and their times (in secons)
 
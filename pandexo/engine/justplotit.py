@@ -4,6 +4,7 @@ import pickle as pk
 import numpy as np
 from bokeh.layouts import row
 import pandas as pd
+from .bintools import bin_wave_to_R, uniform_tophat_sum, rebin
 def jwst_1d_spec(result_dict, model=True, title='Model + Data + Error Bars', output_file = 'data.html',legend = False,
         R=False,  num_tran = False, plot_width=800, plot_height=400,x_range=[1,10],y_range=None, plot=True):
     """Plots 1d simulated spectrum and rebin or rescale for more transits
@@ -203,99 +204,6 @@ def jwst_1d_spec(result_dict, model=True, title='Model + Data + Error Bars', out
     return outx,outy,oute
 
 
-def bin_wave_to_R(w, R):
-    """Creates new wavelength axis at specified resolution
-
-    Parameters
-    ----------
-    w : list of float or numpy array of float
-        Wavelength axis to be rebinned
-    R : float or int
-        Resolution to bin axis to
-
-    Returns
-    -------
-    list of float
-        New wavelength axis at specified resolution
-
-    Examples
-    --------
-
-    >>> newwave = bin_wave_to_R(np.linspace(1,2,1000), 10)
-    >>> print(len(newwave))
-    11
-    """
-    wave = []
-    tracker = min(w)
-    i = 1
-    ind= 0
-    firsttime = True
-    while(tracker<max(w)):
-        if i <len(w)-1:
-            dlambda = w[i]-w[ind]
-            newR = w[i]/dlambda
-            if (newR < R) & (firsttime):
-                tracker = w[ind]
-                wave += [tracker]
-                ind += 1
-                i += 1
-                firsttime = True
-            elif newR < R:
-                tracker = w[ind]+dlambda/2.0
-                wave +=[tracker]
-                ind = (np.abs(w-tracker)).argmin()
-                i = ind+1
-                firsttime = True
-            else:
-                firsttime = False
-                i+=1
-        else:
-            tracker = max(w)
-            wave += [tracker]
-    return wave
-
-def uniform_tophat_sum(xnew,x, y):
-    """Adapted from Mike R. Line to rebin spectra
-
-    Takes sum of group of points in bin of wave points
-    Parameters
-    ----------
-    xnew : list of float or numpy array of float
-        New wavelength grid to rebin to
-    x : list of float or numpy array of float
-        Old wavelength grid to get rid of
-    y : list of float or numpy array of float
-        New rebinned y axis
-
-    Returns
-    -------
-    array of floats
-        new y axis
-
-    Examples
-    --------
-
-    >>> oldgrid = np.linspace(1,3,100)
-    >>> y = np.zeros(100)+10.0
-    >>> newy = uniform_tophat_sum(np.linspace(2,3,3), oldgrid, y)
-    >>> newy
-    array([ 240.,  250.,  130.])
-    """
-    xnew = np.array(xnew)
-    szmod=xnew.shape[0]
-    delta=np.zeros(szmod)
-    ynew=np.zeros(szmod)
-    delta[0:-1]=xnew[1:]-xnew[:-1]
-    delta[szmod-1]=delta[szmod-2]
-    #pdb.set_trace()
-    for i in range(szmod-1):
-        i=i+1
-        loc=np.where((x >= xnew[i]-0.5*delta[i-1]) & (x < xnew[i]+0.5*delta[i]))
-        ynew[i]=np.sum(y[loc])
-    loc=np.where((x > xnew[0]-0.5*delta[0]) & (x < xnew[0]+0.5*delta[0]))
-    ynew[0]=np.sum(y[loc])
-    return ynew
-
 def uniform_tophat_mean(xnew,x, y):
     """Adapted from Mike R. Line to rebin spectra
 
@@ -319,24 +227,11 @@ def uniform_tophat_mean(xnew,x, y):
     --------
     >>> oldgrid = np.linspace(1,3,100)
     >>> y = np.zeros(100)+10.0
-    >>> newy = uniform_tophat_sum(np.linspace(2,3,3), oldgrid, y)
+    >>> newy = uniform_tophat_mean(np.linspace(2,3,3), oldgrid, y)
     >>> newy
-    array([ 240.,  250.,  130.])
+    array([ 10.,  10.,  10.])
     """
-    xnew = np.array(xnew)
-    szmod=xnew.shape[0]
-    delta=np.zeros(szmod)
-    ynew=np.zeros(szmod)
-    delta[0:-1]=xnew[1:]-xnew[:-1]
-    delta[szmod-1]=delta[szmod-2]
-    #pdb.set_trace()
-    for i in range(szmod-1):
-        i=i+1
-        loc=np.where((x >= xnew[i]-0.5*delta[i-1]) & (x < xnew[i]+0.5*delta[i]))
-        ynew[i]=np.mean(y[loc])
-    loc=np.where((x > xnew[0]-0.5*delta[0]) & (x < xnew[0]+0.5*delta[0]))
-    ynew[0]=np.mean(y[loc])
-    return ynew
+    return rebin(xnew, x, y, how='mean')
 
 def jwst_1d_flux(result_dict, plot=True, output_file= 'flux.html'):
     """Plot flux rate in e/s
@@ -534,6 +429,8 @@ def jwst_2d_det(result_dict, plot=True, output_file='det2d.html'):
     """
     TOOLS = "pan,wheel_zoom,box_zoom,reset,save"
     out = result_dict['PandeiaOutTrans']
+    if '2d' not in out:
+        raise Exception('No 2d Pandeia products, these are not kept when share_probe is True')
     data = out['2d']['detector']
 
 
@@ -579,6 +476,8 @@ def jwst_2d_sat(result_dict, plot=True, output_file='sat2d.html'):
     """
     TOOLS = "pan,wheel_zoom,box_zoom,reset,save"    #saturation
     out = result_dict['PandeiaOutTrans']
+    if '2d' not in out:
+        raise Exception('No 2d Pandeia products, these are not kept when share_probe is True')
     data = out['2d']['saturation']
     xr, yr = data.shape
     plot_sat_2d = Figure(tools=TOOLS,
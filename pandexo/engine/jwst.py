@@ -5,12 +5,15 @@ import numpy as np
 import pandas as pd
 from copy import deepcopy 
 from astropy.io import fits
-from pandeia.engine.instrument_factory import InstrumentFactory
 from pandeia.engine.perform_calculation import perform_calculation
 from . import create_input as create
+from . import inst_registry
 from .compute_noise import ExtractSpec
+from .bintools import bin_wave_to_R, uniform_tophat_sum, rebin
+from .profiling import StageTimer
 import astropy.units as u
 import pickle
+from types import SimpleNamespace
 from pandeia.engine.calc_utils import build_default_calc, build_default_source
 
 #constant parameters.. consider putting these into json file 
@@ -18,6 +21,9 @@ from pandeia.engine.calc_utils import build_default_calc, build_default_source
 max_ngroup = 65536.0 
 #minimum number of integrations
 min_nint_trans = 1
+#pandeia products of the duty cycle run that are still valid for the out of 
+#transit run (rates do not depend on ngroup or nint), see rescale_probe
+probe_products = {'1d': ['extracted_flux', 'extracted_bg_only']}
 
 #refdata directory
 default_refdata_directory = os.environ.get("pandeia_refdata")
@@ -33,12 +39,19 @@ def compute_full_sim(dictinput):
     ----------
     dictinput : dict
         dictionary containing instrument parameters and exoplanet specific 
-        parameters. {"pandeia_input":dict1, "pandexo_input":dict1}
+        parameters. {"pandeia_input":dict1, "pandexo_input":dict1}. Can also contain 
+        "star_spec" and "both_spec", the output of create_input.outTrans and bothTrans, 
+        if these have already been computed, and "probe", the output of **make_probe**. 
+        For fml, the probe replaces the duty cycle and out of transit pandeia runs when 
+        the sed only differs from its sed by a constant factor. 'PandeiaOutTrans' then 
+        only has the products that do not depend on ngroup or nint (see **rescale_probe**) 
     
     Returns
     -------
     dict
-        large dictionary with 1d, 2d simualtions, timing info, instrument info, warnings
+        large dictionary with 1d, 2d simualtions, timing info, instrument info, warnings. 
+        If pandexo_input['observation']['profile'] is True, also contains 'Profiling' 
+        with the time and memory high water mark of each stage 
     
     Examples
     --------  
@@ -60,6 +73,7 @@ def compute_full_sim(dictinput):
     """
     pandeia_input = dictinput['pandeia_input']
     pandexo_input = dictinput['pandexo_input']    	
+    prof = StageTimer()
 	
     #define the calculation we'll be doing 
     if pandexo_input['planet']['w_unit'] == 'sec':
@@ -71,37 +85,16 @@ def compute_full_sim(dictinput):
     instrument = pandeia_input['configuration']['instrument']['instrument']
     conf = pandeia_input['configuration']
     
-    #if optimize is in the ngroups section, this will throw an error 
-    #so create temp conf with 2 groups 
-    try:
-        i = InstrumentFactory(config=conf)
-        det_pars = i.get_detector_pars()
-        exp_pars = i.get_exposure_pars()
-    except: 
-        conf_temp = deepcopy(conf) 
-        conf_temp['detector']['ngroup'] = 2 
-        i = InstrumentFactory(config=conf_temp)
-        det_pars = i.get_detector_pars()
-        exp_pars = i.get_exposure_pars()
-        
-    #detector parameters
-    fullwell = det_pars['fullwell'] #from pandeia data
-    rn = det_pars['rn']
-    sat_unit = pandexo_input['observation']['sat_unit']
-
-    if sat_unit =='%':
-        sat_level = pandexo_input['observation']['sat_level']/100.0*fullwell
-    elif sat_unit =='e':
-        sat_level = pandexo_input['observation']['sat_level']
-    else: 
-        raise Exception("Saturation Level Needs Units: % fullwell or Electrons ")
-
-    mingroups = det_pars['mingroups']
-    
-    #exposure parameters 
-    tframe = exp_pars.tframe
-    nframe = exp_pars.nframe
-    nskip = exp_pars.nskip
+    #detector and exposure parameters 
+    det = detector_setup(conf, pandexo_input)
+    fullwell = det['fullwell']
+    rn = det['rn']
+    sat_level = det['sat_level']
+    mingroups = det['mingroups']
+    tframe = det['tframe']
+    nframe = det['nframe']
+    nskip = det['nskip']
+    prof.mark('detector_setup')
     
     #parameteres needed from exo_input
     mag = pandexo_input['star']['mag']
@@ -113,60 +106,105 @@ def compute_full_sim(dictinput):
     noise_floor = pandexo_input['observation']['noise_floor']
 
     
-    #get stellar spectrum and in transit spec
-    star_spec = create.outTrans(pandexo_input['star'])
+    #get stellar spectrum and in transit spec. these can be computed once 
+    #for a sweep and passed in (see justdoit.shared_inputs)
+    if 'star_spec' in dictinput:
+        star_spec = dictinput['star_spec']
+    else:
+        star_spec = create.outTrans(pandexo_input['star'])
+    prof.mark('outTrans')
     #get rstar if user calling from grid 
-    both_spec = create.bothTrans(star_spec, pandexo_input['planet'], star=pandexo_input['star'])
+    if 'both_spec' in dictinput:
+        both_spec = dictinput['both_spec']
+    else:
+        both_spec = create.bothTrans(star_spec, pandexo_input['planet'], star=pandexo_input['star'])
+    prof.mark('bothTrans')
     out_spectrum = np.array([both_spec['wave'], both_spec['flux_out_trans']])
     
-    #get transit duration from phase curve or from input 
-    if calculation == 'phase_spec': 
-        transit_duration = max(both_spec['time']) - min(both_spec['time'])
-    else: 
-        #convert to seconds, then remove quantity and convert back to float 
-        transit_duration = float((pandexo_input['planet']['transit_duration']*u.Unit(pandexo_input['planet']['td_unit'])).to(u.second)/u.second)
-
-    #amount of exposure time out-of-occultation, as a fraction of in-occ time 
-    try:
-        expfact_out = pandexo_input['observation']['fraction'] 
-        print("WARNING: key input fraction has been replaced with new 'baseline option'. See notebook example")
-        pandexo_input['observation']['baseline'] = pandexo_input['observation']['fraction'] 
-        pandexo_input['observation']['baseline_unit'] ='frac'
-    except:
-        if pandexo_input['observation']['baseline_unit'] =='frac':
-            expfact_out = pandexo_input['observation']['baseline'] 
-        elif pandexo_input['observation']['baseline_unit'] =='total':
-            expfact_out = transit_duration/( pandexo_input['observation']['baseline'] - transit_duration)
-        elif pandexo_input['observation']['baseline_unit'] =='total_hrs':
-            expfact_out = transit_duration/( pandexo_input['observation']['baseline']*3600.0 - transit_duration)
-        else: 
-            raise Exception("Wrong units for baseine: either 'frac' or 'total' or 'total_hrs' accepted")
+    #get transit duration and out of transit baseline 
+    transit_duration, expfact_out = baseline_setup(pandexo_input, both_spec, calculation)
 
     #add to pandeia input 
     pandeia_input['scene'][0]['spectrum']['sed']['spectrum'] = out_spectrum
     
-    if isinstance(pandeia_input["configuration"]["detector"]["ngroup"], (float,int)):
+    #for fml the duty cycle run can double as the out of transit run 
+    share_probe = pandexo_input['observation'].get('share_probe', False) & (calculation == 'fml')
+    probe = None
+
+    #duty cycle run shared by a sweep (see justdoit.shared_probe), usable if the sed 
+    #only differs by a constant factor 
+    #it only replaces the duty cycle run, so not with a fixed ngroup 
+    fixed_ngroup = isinstance(pandeia_input["configuration"]["detector"]["ngroup"], (float,int))
+    scale = None
+    if ('probe' in dictinput) & share_probe & (not fixed_ngroup):
+        if 'nonlinear' in dictinput['probe']['out'].get('warnings', {}):
+            print("Shared Duty Cycle Calc is Non Linear, Not Using It")
+        else:
+            scale = probe_scale(dictinput['probe'], out_spectrum, pandeia_input)
+    if scale is not None:
+        shared = dictinput['probe']
+        maxrate = np.max(shared['rate_plus_bg'] + (scale-1.0)*shared['rate'])
+        probe_maxrate = np.max(shared['rate_plus_bg'])
+
+    if fixed_ngroup:
         m = {"ngroup":pandeia_input["configuration"]["detector"]["ngroup"], "tframe":tframe,
             "nframe":nframe,"mingroups":mingroups,"nskip":nskip}
+    elif scale is not None:
+        print("Using Shared Duty Cycle Calc")
+        m = {"maxexptime_per_int":sat_level/maxrate, 
+            "tframe":tframe,"nframe":nframe,"mingroups":mingroups,"nskip":nskip}
     else:
         #run pandeia once to determine max exposure time per int and get exposure params
         print("Optimization Reqested: Computing Duty Cycle")
-        m = {"maxexptime_per_int":compute_maxexptime_per_int(pandeia_input, sat_level) , 
+        if share_probe:
+            maxexptime_per_int, probe = compute_maxexptime_per_int(pandeia_input, sat_level, return_report=True)
+        else:
+            maxexptime_per_int = compute_maxexptime_per_int(pandeia_input, sat_level)
+        m = {"maxexptime_per_int":maxexptime_per_int , 
             "tframe":tframe,"nframe":nframe,"mingroups":mingroups,"nskip":nskip}
         print("Finished Duty Cycle Calc")
+        prof.mark('saturation_probe')
 
     #calculate all timing info
     timing, flags = compute_timing(m,transit_duration,expfact_out,noccultations)
+
+    if probe is not None:
+        maxrate = np.max(probe.signal.rate_plus_bg_list[0]['fp_pix'])
+        probe_maxrate = maxrate
+        probe_out = probe.as_dict()
+        probe_out.pop('3d')
+        if 'nonlinear' in probe_out.get('warnings', {}):
+            print("Duty Cycle Calc is Non Linear, Not Using It")
+            probe = None
+    #the out of transit run can only be skipped if it is known to be linear 
+    if ((scale is not None) or (probe is not None)) and (not probe_linear(maxrate, probe_maxrate, timing)):
+        print("Final Number of Groups May Be Non Linear, Not Using Duty Cycle Calc")
+        scale = None
+        probe = None
     
     #Simulate out trans and in transit
-    print("Starting Out of Transit Simulation")
-    out = perform_out(pandeia_input, pandexo_input,timing, both_spec)
+    if scale is not None:
+        print("Using Shared Duty Cycle Calc for Out of Transit Simulation")
+        extraction_area = shared['extraction_area']
+        out_report = None
+        out = deepcopy(shared['out'])
+        out['1d']['extracted_flux'][1] = out['1d']['extracted_flux'][1]*scale
+        out = rescale_probe(out, maxrate, pandeia_input, timing, fullwell)
+    else:
+        if probe is None:
+            print("Starting Out of Transit Simulation")
+            out_report = perform_out(pandeia_input, pandexo_input,timing, both_spec)
+            out = out_report.as_dict()
+            out.pop('3d')
+        else:
+            print("Using Duty Cycle Calc for Out of Transit Simulation")
+            out_report = probe
+            out = rescale_probe(probe_out, maxrate, pandeia_input, timing, fullwell)
     
-    #extract extraction area before dict conversion
-    extraction_area = out.extraction_area
-    out = out.as_dict()
-    out.pop('3d')
+        #2d extract works on the 2d signal and noise in the report itself 
+        extraction_area = out_report.extraction_area
     print("End out of Transit")
+    prof.mark('perform_out')
 
     #Remove effects of Quantum Yield from shot noise 
     out = remove_QY(out, instrument)
@@ -174,15 +212,20 @@ def compute_full_sim(dictinput):
     #this kind of redundant going to compute inn from out instead 
     #keep perform_in but change inputs to (out, timing, both_spec)
     print("Starting In Transit Simulation")
-    inn = perform_in(pandeia_input, pandexo_input,timing, both_spec, out, calculation)
+    inn = perform_in(pandeia_input, pandexo_input,timing, both_spec, out, calculation, 
+                    out_report=out_report)
     print("End In Transit")
+    prof.mark('perform_in')
     
 
 
     #compute warning flags for timing info 
     warnings = add_warnings(out, timing, sat_level/fullwell, flags, instrument) 
 
-    compNoise = ExtractSpec(inn, out, rn, extraction_area, timing)
+    if calculation == '2d extract':
+        compNoise = ExtractSpec(inn, out_report, rn, extraction_area, timing)
+    else:
+        compNoise = ExtractSpec(inn, out, rn, extraction_area, timing)
     
     #slope method is pandeia's pure noise calculation (taken from SNR)
     #contains correlated noise, RN, dark current, sky, 
@@ -214,6 +257,7 @@ def compute_full_sim(dictinput):
     else:
         result = None
         raise Exception('WARNING: Calculation method not found.')
+    prof.mark('ExtractSpec')
         
     varin = result['var_in_1d']
     varout = result['var_out_1d']
@@ -267,6 +311,8 @@ def compute_full_sim(dictinput):
     #Add in user specified noise floor 
     error_spec_nfloor = add_noise_floor(noise_floor, wbin, error_spec) 
 
+    prof.mark('binning')
+
     #add in random noise for the simulated spectrum 
     np.random.seed()
     rand_noise= error_spec_nfloor*(np.random.randn(len(wbin)))
@@ -300,10 +346,230 @@ def compute_full_sim(dictinput):
     result_dict = as_dict(out,both_spec ,finalspec, 
                 timing, mag, sat_level, warnings,
                 pandexo_input['planet']['f_unit'], rawstuff,calculation)
+    prof.mark('as_dict')
+
+    #stage timers and memory high water marks 
+    if pandexo_input['observation'].get('profile', False):
+        result_dict['Profiling'] = prof.as_dict()
 
     return result_dict 
     
-def compute_maxexptime_per_int(pandeia_input, sat_level):
+def compute_timing_grid(dictinput, ngroup, noccultations): 
+    """Precision versus observing time for a grid of groups and transits 
+    
+    When planning an observation of a fixed target it is common to sweep through the 
+    number of groups per integration and the number of transits. Instead of running 
+    **compute_full_sim** for every point, this runs Pandeia once for the instrument 
+    mode and then computes the timing, the first minus last noise and the error 
+    propagation for every point in the grid with arrays. Only the fml calculation is 
+    supported, since it only uses the flux rates from Pandeia (which do not depend on 
+    ngroup or nint). No random noise is added. 
+    
+    Parameters
+    ----------
+    dictinput : dict
+        dictionary containing instrument parameters and exoplanet specific 
+        parameters. {"pandeia_input":dict1, "pandexo_input":dict1}
+    ngroup : list or array of int 
+        number of groups per integration 
+    noccultations : list or array of int 
+        number of transits 
+    
+    Returns
+    -------
+    dict 
+        'table' : pandas.DataFrame with one row per (ngroup, noccultations) with timing 
+        info, the median and minimum error and 'saturated' (True if the integration is 
+        longer than maxexptime_per_int, i.e. the brightest pixel goes past the saturation 
+        level); 'wave' : binned wavelength axis; 'error_w_floor' : errors with shape 
+        (len(ngroup), len(noccultations), len(wave)); 'maxexptime_per_int' : seconds 
+        per integration before saturation
+    
+    Examples
+    --------
+    
+    >>> grid = compute_timing_grid({"pandeia_input": pandeiadict, "pandexo_input":exodict}, 
+                                    ngroup=np.arange(2,20), noccultations=[1,2,3])
+    >>> grid['table'].head()
+    """
+    #the sed, ngroup and units are filled in below, leave the caller's dicts alone 
+    pandeia_input = deepcopy(dictinput['pandeia_input'])
+    pandexo_input = deepcopy(dictinput['pandexo_input'])
+
+    if (pandexo_input['planet']['w_unit'] == 'sec') or (pandexo_input['calculation'].lower() != 'fml'):
+        raise Exception('Timing grids are only available for the fml calculation')
+
+    instrument = pandeia_input['configuration']['instrument']['instrument']
+    det = detector_setup(pandeia_input['configuration'], pandexo_input)
+    R = pandexo_input['observation']['R']
+    noise_floor = pandexo_input['observation']['noise_floor']
+    ngroup = np.atleast_1d(ngroup).astype(float)
+    noccultations = np.atleast_1d(noccultations).astype(float)
+
+    #get stellar spectrum and in transit spec
+    star_spec = create.outTrans(pandexo_input['star'])
+    both_spec = create.bothTrans(star_spec, pandexo_input['planet'], star=pandexo_input['star'])
+    transit_duration, expfact_out = baseline_setup(pandexo_input, both_spec, 'fml')
+    pandeia_input['scene'][0]['spectrum']['sed']['spectrum'] = np.array([both_spec['wave'], 
+                                                                        both_spec['flux_out_trans']])
+
+    #one pandeia run for all points in the grid 
+    print("Starting Out of Transit Simulation")
+    maxexptime_per_int, report = compute_maxexptime_per_int(pandeia_input, det['sat_level'], 
+                                                            return_report=True)
+    extraction_area = report.extraction_area
+    out = report.as_dict()
+    out.pop('3d')
+    out = remove_QY(out, instrument)
+    inn = perform_in(pandeia_input, pandexo_input, None, both_spec, out, 'fml')
+    print("End out of Transit")
+
+    #timing for every ngroup, the number of transits only scales the final error
+    timings = []
+    for ng in ngroup:
+        m = {"ngroup":ng, "tframe":det['tframe'], "nframe":det['nframe'],
+             "mingroups":det['mingroups'], "nskip":det['nskip']}
+        timings += [compute_timing(m, transit_duration, expfact_out, 1)[0]]
+    timing = {key: np.array([t[key] for t in timings])[:,np.newaxis] for key in timings[0]}
+    timing['Seconds per Frame'] = det['tframe']
+
+    #ExtractSpec broadcasts the (ngroup, 1) timing arrays against the 1d spectra 
+    result = ExtractSpec(inn, out, det['rn'], extraction_area, timing).run_f_minus_l()
+    w = out['1d']['extracted_flux'][0]
+    shape = (len(ngroup), len(w))
+    photon_out = np.broadcast_to(result['photon_out_1d'], shape)
+    photon_in = np.broadcast_to(result['photon_in_1d'], shape)
+    var_in = np.broadcast_to(result['var_in_1d'], shape)
+    var_out = np.broadcast_to(result['var_out_1d'], shape)
+
+    if R != None: 
+        wbin = bin_wave_to_R(w, R)
+        photon_out = rebin(wbin, w, photon_out)
+        photon_in = rebin(wbin, w, photon_in)
+        var_in = rebin(wbin, w, var_in)
+        var_out = rebin(wbin, w, var_out)
+    else: 
+        wbin = w 
+
+    #flux sign does not depend on ngroup
+    keep = photon_out[0] > 0 
+    wbin = wbin[keep]
+    photon_out = photon_out[:,keep]
+    photon_in = photon_in[:,keep]
+    var_in = var_in[:,keep]
+    var_out = var_out[:,keep]
+
+    to = result['on_source_out']
+    ti = result['on_source_in']
+    var_tot = (to/ti/photon_out)**2.0 * var_in + (photon_in*to/ti/photon_out**2.0)**2.0 * var_out
+    error_spec = np.sqrt(var_tot)[:,np.newaxis,:] / np.sqrt(noccultations)[np.newaxis,:,np.newaxis]
+
+    rows = []
+    for i in range(len(ngroup)):
+        for j in range(len(noccultations)):
+            error_spec[i,j] = add_noise_floor(noise_floor, wbin, error_spec[i,j])
+            hrs = timings[i]["Transit+Baseline, no overhead (hrs)"]
+            exptime_per_int = timings[i]["APT: Num Groups per Integration"]*det['tframe']
+            rows += [{"APT: Num Groups per Integration": timings[i]["APT: Num Groups per Integration"], 
+                      "Number of Transits": noccultations[j],
+                      "Num Integrations Out of Transit": timings[i]["Num Integrations Out of Transit"],
+                      "Num Integrations In Transit": timings[i]["Num Integrations In Transit"], 
+                      "Observing Efficiency (%)": timings[i]["Observing Efficiency (%)"],
+                      "Transit+Baseline, no overhead (hrs)": hrs,
+                      "Total Time, no overhead (hrs)": hrs*noccultations[j],
+                      "Median Error (ppm)": np.median(error_spec[i,j])*1e6, 
+                      "Min Error (ppm)": np.min(error_spec[i,j])*1e6, 
+                      "saturated": bool(exptime_per_int > maxexptime_per_int)}]
+
+    return {'table': pd.DataFrame(rows), 'wave': wbin, 'error_w_floor': error_spec, 
+            'maxexptime_per_int': maxexptime_per_int}
+
+def detector_setup(conf, pandexo_input):
+    """Detector and exposure parameters needed for the timing calculation
+    
+    Parameters
+    ----------
+    conf : dict 
+        pandeia configuration dictionary (pandeia_input['configuration'])
+    pandexo_input : dict 
+        exoplanet specific observation info 
+    
+    Returns
+    -------
+    dict 
+        fullwell, rn, sat_level (electrons), mingroups, tframe, nframe, nskip
+    """
+    #instruments are memoized per process, the reference data is only loaded once 
+    det_pars = inst_registry.get_detector_pars(conf)
+    exp_pars = inst_registry.get_exposure_pars(conf)
+
+    #detector parameters
+    fullwell = det_pars['fullwell'] #from pandeia data
+    rn = det_pars['rn']
+    sat_unit = pandexo_input['observation']['sat_unit']
+
+    if sat_unit =='%':
+        sat_level = pandexo_input['observation']['sat_level']/100.0*fullwell
+    elif sat_unit =='e':
+        sat_level = pandexo_input['observation']['sat_level']
+    else: 
+        raise Exception("Saturation Level Needs Units: % fullwell or Electrons ")
+
+    mingroups = det_pars['mingroups']
+    
+    #exposure parameters 
+    tframe = exp_pars.tframe
+    nframe = exp_pars.nframe
+    nskip = exp_pars.nskip
+
+    return {'fullwell':fullwell, 'rn':rn, 'sat_level':sat_level, 'mingroups':mingroups,
+            'tframe':tframe, 'nframe':nframe, 'nskip':nskip}
+
+def baseline_setup(pandexo_input, both_spec, calculation):
+    """Transit duration and out of transit baseline 
+    
+    Parameters
+    ----------
+    pandexo_input : dict 
+        exoplanet specific observation info 
+    both_spec : dict 
+        dictionary transit spectra computed from **createInput.bothTrans** 
+    calculation : str 
+        noise calculation type
+    
+    Returns
+    -------
+    transit_duration : float 
+        transit duration in seconds 
+    expfact_out : float 
+        fraction of time spent in transit versus out of transit 
+    """
+    #get transit duration from phase curve or from input 
+    if calculation == 'phase_spec': 
+        transit_duration = max(both_spec['time']) - min(both_spec['time'])
+    else: 
+        #convert to seconds, then remove quantity and convert back to float 
+        transit_duration = float((pandexo_input['planet']['transit_duration']*u.Unit(pandexo_input['planet']['td_unit'])).to(u.second)/u.second)
+
+    #amount of exposure time out-of-occultation, as a fraction of in-occ time 
+    try:
+        expfact_out = pandexo_input['observation']['fraction'] 
+        print("WARNING: key input fraction has been replaced with new 'baseline option'. See notebook example")
+        pandexo_input['observation']['baseline'] = pandexo_input['observation']['fraction'] 
+        pandexo_input['observation']['baseline_unit'] ='frac'
+    except Exception:
+        if pandexo_input['observation']['baseline_unit'] =='frac':
+            expfact_out = pandexo_input['observation']['baseline'] 
+        elif pandexo_input['observation']['baseline_unit'] =='total':
+            expfact_out = transit_duration/( pandexo_input['observation']['baseline'] - transit_duration)
+        elif pandexo_input['observation']['baseline_unit'] =='total_hrs':
+            expfact_out = transit_duration/( pandexo_input['observation']['baseline']*3600.0 - transit_duration)
+        else: 
+            raise Exception("Wrong units for baseine: either 'frac' or 'total' or 'total_hrs' accepted")
+
+    return transit_duration, expfact_out
+
+def compute_maxexptime_per_int(pandeia_input, sat_level, return_report=False):
     """Computes optimal maximum exposure time per integration
     
     Function to simulate 2d jwst image with 2 groups, 1 integration, 1 exposure 
@@ -319,11 +585,16 @@ def compute_maxexptime_per_int(pandeia_input, sat_level):
         pandeia dictionary input 
     sat_level : int or float
         user defined saturation level in units of electrons
+    return_report : bool
+        (Optional) also return the pandeia report so it can be reused as the 
+        out of transit run (see **rescale_probe**). Default = False
     
     Returns
     ------- 
     float 
         Maximum exposure time per integration before specified saturation level
+    report 
+        (Only if return_report) pandeia report of the 2 group run 
     
     Examples
     --------
@@ -356,10 +627,182 @@ def compute_maxexptime_per_int(pandeia_input, sat_level):
 
     try:
         maxexptime_per_int = sat_level/maxdetvalue
-    except: 
+    except Exception:
         maxexptime_per_int = np.nan
     
+    if return_report:
+        return maxexptime_per_int, report
     return maxexptime_per_int
+
+def make_probe(dictinput):
+    """Runs the duty cycle run once so that it can be shared by a sweep 
+    
+    Runs pandeia with 2 groups, 1 integration (as **compute_maxexptime_per_int**) and 
+    keeps what the fml calculation needs from it. Passing the output to 
+    **compute_full_sim** as dictinput['probe'] replaces both the duty cycle run and 
+    the out of transit run, as long as the instrument is the same and the stellar sed 
+    only differs by a constant factor (e.g. a sweep over planet radius, transit 
+    duration or stellar magnitude). Otherwise it is ignored. 
+    
+    Parameters
+    ----------
+    dictinput : dict 
+        {"pandeia_input":dict1, "pandexo_input":dict1}, optionally with precomputed 
+        "star_spec" and "both_spec"
+    
+    Returns
+    -------
+    dict 
+        sed, instrument key, pandeia output dictionary, extraction area, 2d rate with 
+        and without background 
+    """
+    pandeia_input = deepcopy(dictinput['pandeia_input'])
+    pandexo_input = deepcopy(dictinput['pandexo_input'])
+    if 'star_spec' in dictinput:
+        star_spec = dictinput['star_spec']
+    else:
+        star_spec = create.outTrans(pandexo_input['star'])
+    if 'both_spec' in dictinput:
+        both_spec = dictinput['both_spec']
+    else:
+        both_spec = create.bothTrans(star_spec, pandexo_input['planet'], star=pandexo_input['star'])
+    out_spectrum = np.array([both_spec['wave'], both_spec['flux_out_trans']])
+    pandeia_input['scene'][0]['spectrum']['sed']['spectrum'] = out_spectrum
+
+    pandeia_input['configuration']['detector']['ngroup'] = 2 
+    pandeia_input['configuration']['detector']['nint'] = 1 
+    pandeia_input['configuration']['detector']['nexp'] = 1
+    report = perform_calculation(pandeia_input, dict_report=False)
+    out = report.as_dict()
+    out.pop('3d')
+    return {'sed': out_spectrum, 
+            'key': probe_key(pandeia_input),
+            'out': out, 
+            'extraction_area': report.extraction_area, 
+            'rate_plus_bg': report.signal.rate_plus_bg_list[0]['fp_pix'], 
+            'rate': report.signals[0].rate}
+
+def probe_key(pandeia_input):
+    """Everything in the pandeia input that the duty cycle run depends on, except 
+    for the sed and ngroup, nint, nexp 
+    """
+    pandeia_input = deepcopy(pandeia_input)
+    pandeia_input['scene'][0]['spectrum']['sed'].pop('spectrum', None)
+    for i in ['ngroup', 'nint', 'nexp']:
+        pandeia_input['configuration']['detector'].pop(i, None)
+    return json.dumps(pandeia_input, sort_keys=True, default=str)
+
+def probe_scale(probe, out_spectrum, pandeia_input): 
+    """Factor between the sed of a run and that of a shared duty cycle run 
+    
+    Parameters
+    ----------
+    probe : dict 
+        output of **make_probe**
+    out_spectrum : array 
+        (2, N) stellar sed of this run 
+    pandeia_input : dict 
+        pandeia input of this run 
+    
+    Returns
+    -------
+    float or None 
+        out_spectrum flux / probe flux, or None if the probe can not be used 
+    """
+    if probe['key'] != probe_key(pandeia_input):
+        return None
+    sed = probe['sed']
+    if (sed.shape != out_spectrum.shape) or (not np.array_equal(sed[0], out_spectrum[0])):
+        return None
+    ref = sed[1]
+    flux = out_spectrum[1]
+    scale = np.sum(flux*ref)/np.sum(ref*ref)
+    if not np.allclose(flux, scale*ref, rtol=1e-8, atol=0):
+        return None
+    return scale
+
+def probe_linear(maxrate, probe_maxrate, timing):
+    """Checks that the final ngroup stays in the counts covered by the duty cycle run
+    
+    Pandeia's detector parameters only give the full well, not the non linearity 
+    limit, so the nonlinear warning of the duty cycle run (2 groups) can't be redone 
+    for another ngroup. If that run was linear, the out of transit run is known to be 
+    linear only as long as its counts per integration are not higher. 
+    
+    Parameters
+    ----------
+    maxrate : float
+        maximum rate (including background) of the out of transit run in e-/s/pixel
+    probe_maxrate : float
+        maximum rate (including background) of the duty cycle run in e-/s/pixel
+    timing : dict 
+        timing dictionary from **compute_timing** 
+    
+    Returns
+    -------
+    bool 
+        True if the duty cycle run can be used as the out of transit run 
+    """
+    ngroup = timing['APT: Num Groups per Integration']
+    return maxrate*ngroup <= probe_maxrate*2 
+
+def rescale_probe(out, maxrate, pandeia_input, timing, fullwell):
+    """Converts duty cycle run to out of transit run 
+    
+    The duty cycle run from **compute_maxexptime_per_int** (2 groups, 1 integration) 
+    has the same 2d rate image as the out of transit run. For the fml calculation only 
+    the extracted flux rates are used, which do not depend on ngroup or nint, so 
+    this rescales the bookkeeping (detector setup and saturation warnings) 
+    to the final timing instead of running pandeia again. The other pandeia 
+    products (SNR, noise, 2d maps, scalars) are those of the 2 group run, so 
+    only the 1d products in `probe_products` are kept. 
+    
+    The nonlinear warning of the duty cycle run is kept as is, so callers have to 
+    check **probe_linear** first. 
+    
+    Parameters
+    ----------
+    out : dict 
+        pandeia output dictionary of the duty cycle run 
+    maxrate : float
+        maximum rate (including background) on the detector in e-/s/pixel
+    pandeia_input : dict 
+        pandeia specific input info 
+    timing : dict 
+        timing dictionary from **compute_timing** 
+    fullwell : float
+        full well of the detector in electrons 
+    
+    Returns
+    -------
+    dict 
+        pandeia output dictionary for out of transit data 
+    """
+    ngroup = timing['APT: Num Groups per Integration']
+    nint = timing['Num Integrations Out of Transit']
+    for detector in [pandeia_input['configuration']['detector'], 
+                    out['input']['configuration']['detector']]:
+        detector['ngroup'] = ngroup
+        detector['nint'] = nint
+        detector['nexp'] = 1 
+
+    #saturation warnings were computed for 2 groups, redo them for the final ngroup
+    maxcounts = maxrate*ngroup*timing['Seconds per Frame']
+    warnings = out.get('warnings', {})
+    warnings.pop('saturated', None)
+    if maxcounts > fullwell:
+        warnings['saturated'] = "Full saturation: " + str(int(maxcounts)) + " e- per int > full well"
+    out['warnings'] = warnings
+
+    #drop the products of the 2 group run that would be stale 
+    for level in list(out.keys()):
+        if level in ['input', 'warnings']:
+            continue
+        if level not in probe_products:
+            out.pop(level)
+            continue
+        out[level] = {k: v for k, v in out[level].items() if k in probe_products[level]}
+    return out
         
 def compute_timing(m,transit_duration,expfact_out,noccultations): 
     """Computes all timing info for observation
@@ -407,7 +850,7 @@ def compute_timing(m,transit_duration,expfact_out,noccultations):
     try: 
         #are we starting with a exposure time ?
         maxexptime_per_int = m['maxexptime_per_int']
-    except:
+    except Exception:
         #or a pre defined number of groups specified by user
         ngroups_per_int = m['ngroup']
         
@@ -519,7 +962,7 @@ def remove_QY(pandeia_dict, instrument):
     if instrument == 'niriss':
         try:
             qy = fits.open(os.path.join(default_refdata_directory,'jwst', instrument,'qe' ,'jwst_niriss_h2rg_qe_20160902163017.fits'))
-        except: 
+        except Exception:
             raise Exception('PANDEIA REFERENCE DATA NEEDS TO BE UPDATED')
 
         x_grid = pandeia_dict['1d']['extracted_flux'][0]
@@ -527,7 +970,7 @@ def remove_QY(pandeia_dict, instrument):
     elif instrument == 'nirspec':
         try:
             qy = fits.open(os.path.join(default_refdata_directory,'jwst', instrument,'qe' ,'jwst_nirspec_qe_20160902193401.fits'))
-        except: 
+        except Exception:
             raise Exception('PANDEIA REFERENCE DATA NEEDS TO BE UPDATED')        
         x_grid = pandeia_dict['1d']['extracted_flux'][0]
         qy_on_grid = np.interp(x_grid, qy[1].data['WAVELENGTH'], qy[1].data['CONVERSION'])
@@ -567,11 +1010,13 @@ def perform_out(pandeia_input, pandexo_input,timing, both_spec):
     return report_out
 
     
-def perform_in(pandeia_input, pandexo_input,timing, both_spec, out, calculation): 
+def perform_in(pandeia_input, pandexo_input,timing, both_spec, out, calculation, out_report=None): 
     """Computes in transit data 
     
     Runs Pandeia for the in transit data or computes the in transit simulation 
-    from the out of transit pandeia run 
+    from the out of transit pandeia run. For slope method and 2d extract, the in 
+    transit run is only derived from the out of transit run if 
+    pandexo_input['observation']['derive_in_transit'] is True (see **derive_in**). 
     
     Parameters
     ----------
@@ -589,11 +1034,13 @@ def perform_in(pandeia_input, pandexo_input,timing, both_spec, out, calculation)
         key which speficies the kind of noise calcualtion 
         (2d extract, slope method, fml, phase_spec). 
         Recommended for transit transmisstion spectra = fml
+    out_report : report
+        (Optional) pandeia report of the out of transit run. Needed for 2d extract
 
     Returns
     -------
-    dict
-        pandeia output dictionary 
+    dict or report
+        pandeia output dictionary (pandeia report for 2d extract)
     """
     
     #function to run pandeia for in transit
@@ -608,6 +1055,8 @@ def perform_in(pandeia_input, pandexo_input,timing, both_spec, out, calculation)
         transit_depth = np.interp(report_in['1d']['extracted_flux'][0],
                                     both_spec['wave'], both_spec['frac'])
         report_in['1d']['extracted_flux'][1] = report_in['1d']['extracted_flux'][1]*transit_depth
+    elif pandexo_input['observation'].get('derive_in_transit', False):
+        report_in = derive_in(out, out_report, timing, both_spec, calculation)
     else: 
         #only run pandeia a third time if doing slope method and need accurate run for the 
         #nint and timing
@@ -619,6 +1068,10 @@ def perform_in(pandeia_input, pandexo_input,timing, both_spec, out, calculation)
     
         pandeia_input['scene'][0]['spectrum']['sed']['spectrum'] = in_transit_spec
 
+        if calculation == '2d extract':
+            #2d extract needs the report itself 
+            return perform_calculation(pandeia_input, dict_report=False)
+
         report_in = perform_calculation(pandeia_input, dict_report=True)
         instrument = pandeia_input['configuration']['instrument']['instrument']
         #remove QY effects 
@@ -626,6 +1079,101 @@ def perform_in(pandeia_input, pandexo_input,timing, both_spec, out, calculation)
         report_in.pop('3d')
     
     return report_in
+
+def derive_in(out, out_report, timing, both_spec, calculation):
+    """Derives in transit data from the out of transit run 
+    
+    The in transit Pandeia run only differs from the out of transit run by the 
+    wavelength dependent transit depth, `frac`. So, like for fml, this scales the 
+    out of transit products instead of running Pandeia a third time. 
+    
+    For slope method the extracted flux is scaled by `frac` and Pandeia's 1d SNR is 
+    rescaled assuming the noise is set by the source plus background and that SNR goes 
+    as sqrt(nint). For 2d extract the source rate on each pixel is scaled by `frac` at the 
+    wavelength of its column, and the background and read noise are kept. 
+    Use **validate_derived_in** to compare against the full third run. 
+    
+    Parameters
+    ----------
+    out : dict 
+        out of transit pandeia dictionary 
+    out_report : report 
+        out of transit pandeia report (only used for 2d extract)
+    timing : dict 
+        timing dictionary from **compute_timing** 
+    both_spec : dict 
+        dictionary transit spectra computed from **createInput.bothTrans** 
+    calculation : str
+        'slope method' or '2d extract'
+    
+    Returns
+    -------
+    dict or report-like 
+        in transit pandeia dictionary (slope method) or object with the signals and 
+        noise attributes used by **ExtractSpec.extract_region** (2d extract)
+    """
+    if calculation == '2d extract':
+        signal = out_report.signals[0]
+        transit_depth = np.interp(signal.wave_pix, both_spec['wave'], both_spec['frac'])
+        rate = signal.rate*transit_depth[np.newaxis,:]
+        rate_plus_bg = rate + (signal.rate_plus_bg - signal.rate)
+        return SimpleNamespace(signals=[SimpleNamespace(rate=rate, rate_plus_bg=rate_plus_bg)], 
+                                noise=out_report.noise)
+
+    report_in = deepcopy(out)
+    curves = report_in['1d']
+    transit_depth = np.interp(curves['extracted_flux'][0], both_spec['wave'], both_spec['frac'])
+
+    flux = out['1d']['extracted_flux'][1]
+    bkg = np.interp(curves['extracted_flux'][0], curves['extracted_bg_only'][0], curves['extracted_bg_only'][1])
+    curves['extracted_flux'][1] = flux*transit_depth
+
+    #rescale snr to the lower in transit flux and to the number of in transit integrations 
+    sn_scale = (transit_depth*np.sqrt((flux + bkg)/(flux*transit_depth + bkg)) 
+                * np.sqrt(timing['Num Integrations In Transit']/timing['Num Integrations Out of Transit']))
+    curves['sn'][1] = curves['sn'][1]*np.interp(curves['sn'][0], curves['extracted_flux'][0], sn_scale)
+    return report_in
+
+def validate_derived_in(dictinput):
+    """Compares derived in transit data against the full in transit Pandeia run
+    
+    Runs **compute_full_sim** twice, once with the full third Pandeia run for the 
+    in transit data and once with `derive_in_transit`, and reports the fractional 
+    difference of the in transit electrons and of the final error bars. 
+    
+    Parameters
+    ----------
+    dictinput : dict
+        {"pandeia_input":dict1, "pandexo_input":dict1} with calculation 
+        'slope method' or '2d extract'
+    
+    Returns
+    -------
+    dict 
+        max and median fractional differences and both results 
+    
+    Examples
+    --------
+    
+    >>> diff = validate_derived_in({"pandeia_input": pandeiadict, "pandexo_input":exodict})
+    >>> print(diff['error_w_floor'])
+    {'max': 0.0021, 'median': 0.0004}
+    """
+    full_input = deepcopy(dictinput)
+    full_input['pandexo_input']['observation']['derive_in_transit'] = False
+    derived_input = deepcopy(dictinput)
+    derived_input['pandexo_input']['observation']['derive_in_transit'] = True
+
+    full = compute_full_sim(full_input)
+    derived = compute_full_sim(derived_input)
+
+    report = {'full':full, 'derived':derived}
+    for level, key in [('RawData','electrons_in'), ('FinalSpectrum','error_w_floor')]:
+        a = full[level][key]
+        b = np.interp(full[level]['wave'], derived[level]['wave'], derived[level][key])
+        diff = np.abs(b - a)/np.abs(a)
+        report[key] = {'max': np.nanmax(diff), 'median':np.nanmedian(diff)}
+    return report
           
 def add_warnings(pand_dict, timing, sat_level, flags,instrument): 
     """Add warnings for front end 
@@ -664,11 +1212,11 @@ def add_warnings(pand_dict, timing, sat_level, flags,instrument):
     #check for saturation 
     try:  
         flag_nonl = pand_dict['warnings']['nonlinear']
-    except: 
+    except Exception:
         flag_nonl = "All good"    
     try: 
         flag_sat = pand_dict['warnings']['saturated']
-    except: 
+    except Exception:
         flag_sat = "All good"
         
     #check for too small number of groups
@@ -742,101 +1290,6 @@ def add_noise_floor(noise_floor, wave_bin, error_spec):
         raise ValueError('Noise Floor added was not integer or file')
     return error_spec
 
-def bin_wave_to_R(w, R):
-    """Creates new wavelength axis at specified resolution
-    
-    Parameters
-    ----------
-    w : list of float or numpy array of float
-        Wavelength axis to be rebinned 
-    R : float or int 
-        Resolution to bin axis to 
-    
-    Returns
-    -------
-    list of float
-        New wavelength axis at specified resolution
-    
-    Examples
-    --------
-    
-    >>> newwave = bin_wave_to_R(np.linspace(1,2,1000), 10)
-    >>> print((len(newwave)))
-    11
-    """
-    wave = []
-    tracker = min(w)
-    i = 1 
-    ind= 0
-    firsttime = True
-    while(tracker<max(w)):
-        if i <len(w)-1:
-            dlambda = w[i]-w[ind]
-            newR = w[i]/dlambda
-            if (newR < R) & (firsttime):
-                tracker = w[ind]
-                wave += [tracker]
-                ind += 1
-                i += 1 
-                firsttime = True
-            elif newR < R:
-                tracker = w[ind]+dlambda/2.0
-                wave +=[tracker]
-                ind = (np.abs(w-tracker)).argmin()
-                i = ind+1
-                firsttime = True
-            else:
-                firsttime = False            
-                i+=1    
-        else:
-            tracker = max(w)
-            wave += [tracker]
-    return np.array(wave)
-    
-def uniform_tophat_sum(newx,x, y):
-    """Adapted from Mike R. Line to rebin spectra
-    
-    Sums groups of points in certain wave bin 
-    
-    Parameters
-    ----------
-    newx : list of float or numpy array of float
-        New wavelength grid to rebin to 
-    x : list of float or numpy array of float 
-        Old wavelength grid to get rid of 
-    y : list of float or numpy array of float 
-        New rebinned y axis 
-    
-    Returns
-    -------
-    array of floats 
-        new wavelength grid 
-        
-    Examples 
-    --------
-        
-    >>> from .pandexo.engine.jwst import uniform_tophat_sum
-    >>> oldgrid = np.linspace(1,3,100)
-    >>> y = np.zeros(100)+10.0
-    >>> newy = uniform_tophat_sum(np.linspace(2,3,3), oldgrid, y)
-    >>> newy
-    array([ 240.,  250.,  130.])
-    """
-    newx = np.array(newx)
-    szmod=newx.shape[0]
-    delta=np.zeros(szmod)
-    ynew=np.zeros(szmod)
-    delta[0:-1]=newx[1:]-newx[:-1]  
-    delta[szmod-1]=delta[szmod-2] 
-    #pdb.set_trace()
-    for i in range(szmod-1):
-        i=i+1
-        loc=np.where((x >= newx[i]-0.5*delta[i-1]) & (x < newx[i]+0.5*delta[i]))
-        ynew[i]=np.sum(y[loc])
-    loc=np.where((x > newx[0]-0.5*delta[0]) & (x < newx[0]+0.5*delta[0]))
-    ynew[0]=np.sum(y[loc])
-    return ynew
-
 def target_acq(instrument, both_spec, warning): 
     """Contains functionality to compute optimal TA strategy 
 
@@ -869,12 +1322,12 @@ def target_acq(instrument, both_spec, warning):
     #check warnings (pandeia doesn't return values for these warnings, so try will fail if all good)
     try: 
         warnings['TA Satruated?'] = rphot['warnings']['saturated']
-    except:
+    except Exception:
         warnings['TA Satruated?'] = 'All good'
 
     try: 
         warnings['TA SNR Threshold'] = rphot['warnings']['ta_snr_threshold']
-    except:
+    except Exception:
         warnings['TA SNR Threshold'] = 'All good'
 
     #build TA dict 
@@ -16,6 +16,9 @@ def wrapper(dictinput):
     
     Notes
     -----
+    JWST results are cached on disk if the environment variable PANDEXO_CACHE 
+    points to a directory (see **pandexo.engine.cache**). 
+    
     You should not run simulations through this. It is much easier to run simulations through 
     either **run_online** or **justdoit**. **justdoit** contains functions 
     to create input dictionaries and **run_online** contains web forms to create input dictionaries.
@@ -30,7 +33,11 @@ def wrapper(dictinput):
 
     if telescope=='jwst':
         from .jwst import compute_full_sim
-        return compute_full_sim(dictinput)
+        from .cache import ResultCache
+        cache = ResultCache.from_env()
+        if cache is None:
+            return compute_full_sim(dictinput)
+        return cache.run(compute_full_sim, dictinput)
     elif telescope=='hst':
         from .hst import compute_sim_hst
         return compute_sim_hst(dictinput)
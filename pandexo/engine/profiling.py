@@ -0,0 +1,145 @@
+import os
+import time
+import threading
+from collections import OrderedDict
+try:
+    import resource
+except ImportError:
+    #not available on windows
+    resource = None
+import sys
+
+def max_rss():
+    """Memory high water mark of the current process in MB
+    """
+    if resource is None:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    #linux reports kB, mac reports bytes
+    if sys.platform == 'darwin':
+        return rss/1024.0**2
+    return rss/1024.0
+
+def current_rss():
+    """Resident memory of the current process in MB (linux only, else None)
+    """
+    try:
+        with open('/proc/self/statm') as f:
+            pages = int(f.read().split()[1])
+    except (IOError, OSError, ValueError, IndexError):
+        return None
+    return pages*os.sysconf('SC_PAGE_SIZE')/1024.0**2
+
+class StageTimer():
+    """Low overhead stage timer for the simulation pipeline
+
+    Records the wall time between consecutive calls to `mark` and the change
+    in resident memory over each stage (None where it can not be read). The
+    memory high water mark is only reported for the whole run, since a worker
+    process keeps it from earlier runs.
+
+    Methods
+    -------
+    mark
+        ends the current stage
+    as_dict
+        returns all stages
+
+    Examples
+    --------
+
+    >>> prof = StageTimer()
+    >>> star_spec = create.outTrans(pandexo_input['star'])
+    >>> prof.mark('outTrans')
+    >>> prof.as_dict()['stages']['outTrans']
+    {'secs': 1.2, 'rss_delta_mb': 25.5}
+    """
+    def __init__(self):
+        self.start = time.time()
+        self.last = self.start
+        self.last_rss = current_rss()
+        self.stages = OrderedDict()
+
+    def mark(self, name):
+        """Ends the stage called name. Repeated stages are added together
+        """
+        now = time.time()
+        rss = current_rss()
+        secs = now - self.last
+        delta = None
+        if (rss is not None) and (self.last_rss is not None):
+            delta = rss - self.last_rss
+        self.last = now
+        self.last_rss = rss
+        if name in self.stages:
+            secs += self.stages[name]['secs']
+            if (delta is not None) and (self.stages[name]['rss_delta_mb'] is not None):
+                delta += self.stages[name]['rss_delta_mb']
+        self.stages[name] = {'secs': secs, 'rss_delta_mb': delta}
+
+    def as_dict(self):
+        """All stages, total time and memory high water mark
+
+        Returns
+        -------
+        dict
+            {'stages': {name: {'secs', 'rss_delta_mb'}}, 'total_secs', 'maxrss_mb'}
+        """
+        return {'stages': dict(self.stages), 'total_secs': self.last - self.start,
+                'maxrss_mb': max_rss()}
+
+class ProfileAggregator():
+    """Collects 'Profiling' output from many runs (e.g. on the web server)
+
+    Thread safe, since results come back on the executor's callback thread.
+
+    Methods
+    -------
+    add
+        adds one profile
+    summary
+        per stage count, mean and max time
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.stages = OrderedDict()
+        self.nruns = 0
+        self.ncached = 0
+        self.total_secs = 0.0
+        self.maxrss_mb = 0.0
+
+    def add(self, profile):
+        """Adds the 'Profiling' dictionary of a single run. None is ignored
+        """
+        if profile is None:
+            return
+        with self.lock:
+            if profile.get('cache_hit', False):
+                self.ncached += 1
+                return
+            self.nruns += 1
+            self.total_secs += profile['total_secs']
+            if profile['maxrss_mb'] is not None:
+                self.maxrss_mb = max(self.maxrss_mb, profile['maxrss_mb'])
+            for name, stage in profile['stages'].items():
+                agg = self.stages.setdefault(name, {'count':0, 'total_secs':0.0, 'max_secs':0.0})
+                agg['count'] += 1
+                agg['total_secs'] += stage['secs']
+                agg['max_secs'] = max(agg['max_secs'], stage['secs'])
+
+    def summary(self):
+        """Summary of all runs
+
+        Returns
+        -------
+        dict
+            number of runs, mean run time, max memory and count/mean/max secs per stage
+        """
+        with self.lock:
+            stages = OrderedDict()
+            for name, agg in self.stages.items():
+                stages[name] = {'count': agg['count'], 'max_secs': agg['max_secs'],
+                                'mean_secs': agg['total_secs']/agg['count']}
+            mean = self.total_secs/self.nruns if self.nruns > 0 else 0.0
+            return {'runs': self.nruns, 'cache_hits': self.ncached, 'mean_secs': mean,
+                    'maxrss_mb': self.maxrss_mb, 'stages': stages}
@@ -1,13 +1,17 @@
+import io
 import json
 import os
 import uuid
-from collections import namedtuple, OrderedDict
+import functools
 import tornado.escape
 import tornado.httpserver
 import tornado.ioloop
+import tornado.iostream
 import tornado.options
 import tornado.web
+from tornado import gen
 from tornado.options import define, options
+from datetime import timedelta
 
 import traceback
 from sqlalchemy import *
@@ -20,6 +24,9 @@ from astroquery.simbad import Simbad
 import astropy.units as u
 
 from .pandexo import wrapper
+from .profiling import ProfileAggregator
+from . import jobstore
+from .scheduler import FairScheduler, QueueFull
 from .utils.plotters import create_component_jwst, create_component_hst
 from .logs import jwst_log, hst_log
 from .exomast import get_target_data
@@ -42,10 +49,58 @@ Simbad.add_votable_fields('flux(J)')
 define("port", default=1111, help="run on the given port", type=int)
 define("debug", default=False, help="automatically detect code changes in development")
 define("workers", default=4, help="maximum number of simultaneous async tasks")
+define("max_queue", default=100, help="maximum number of calculations waiting for a worker")
+define("profiling", default=False, help="time the stages of JWST calculations and serve them at /profiling")
 
-# Define a simple named tuple to keep track for submitted calculations
-CalculationTask = namedtuple('CalculationTask', ['id', 'name', 'task',
-                                                 'cookie', 'count'])
+#key of the rendered result page in the output of **run_and_render**
+view_key = 'rendered_view'
+
+def render_jwst(result):
+    """
+    Bokeh components (script, div) of the JWST result page
+    """
+    script, div = create_component_jwst(result)
+    div['timing_div'] = result['timing_div']
+    div['input_div'] = result['input_div'] 
+    div['warnings_div'] = result['warnings_div']
+    return script, div
+
+def render_hst(result):
+    """
+    Bokeh components (script, div) of the HST result page
+    """
+    script, div = create_component_hst(result)
+    div['info_div'] = result['info_div']
+    return script, div
+
+def pickle_result(result):
+    """
+    Pickled result for the download, as a buffer
+    """
+    buf = io.BytesIO()
+    pickle.dump(result, buf)
+    return buf.getbuffer()
+
+def pandexo_input_file(result):
+    """
+    Wavelength and alpha columns of the PandExo input file, as a buffer
+    """
+    buf = io.BytesIO()
+    np.savetxt(buf, np.transpose([result['w'], result['alpha']]))
+    return buf.getbuffer()
+
+def run_and_render(finaldata, render):
+    """
+    Runs a calculation in a worker and renders its result page there, so 
+    that views only need to render the template. A failed render is 
+    printed and the page is rendered when it is first viewed instead.
+    """
+    result = wrapper(finaldata)
+    try:
+        result[view_key] = render(result)
+    except Exception:
+        traceback.print_exc()
+    return result
 
 
 class Application(tornado.web.Application):
@@ -71,6 +126,9 @@ class Application(tornado.web.Application):
             (r"/calculation/download/([^/]+)", CalculationDownloadHandler),
             (r"/calculation/downloadpandin/([^/]+)", CalculationDownloadPandInHandler)
         ]
+        if options.profiling:
+            #stage timings of every calculation, for whoever can reach the server
+            handlers.append((r"/profiling", ProfilingHandler))
         settings = dict(
             blog_title="Pandexo",
             template_path=os.path.join(os.path.dirname(__file__), "templates"),
@@ -79,6 +137,8 @@ class Application(tornado.web.Application):
             cookie_secret="__TODO:_GENERATE_YOUR_OWN_RANDOM_VALUE_HERE__",
             debug=options.debug,
         )
+        if BaseHandler.scheduler is None:
+            BaseHandler.start_workers(options.workers, options.max_queue)
         super(Application, self).__init__(handlers, **settings)
 
 
@@ -86,62 +146,143 @@ class BaseHandler(tornado.web.RequestHandler):
     """
     Logic to handle user information and database access might go here.
     """
-    executor = ProcessPoolExecutor(max_workers=16)
-    buffer = OrderedDict()
+    #worker pool and the scheduler that queues calculations in front of it,
+    #both sized from the command line options (see start_workers)
+    executor = None
+    scheduler = None
+    #job states and results (see jobstore). main() replaces it with the store 
+    #from PANDEXO_JOBSTORE so that several server processes can share it
+    jobs = jobstore.MemoryJobStore()
+    #futures of the jobs submitted by this process, until they are done
+    tasks = {}
+    profiles = ProfileAggregator()
+    #seconds a request waits for a running calculation before answering 202
+    result_wait = 5.0
+    #Retry-After (seconds) sent with a 202
+    retry_after = 10
+    #size of the chunks of a download
+    chunk_size = 64*1024
+
+    @classmethod
+    def start_workers(cls, workers, max_queue):
+        """
+        Creates the worker pool and the scheduler in front of it.
+        """
+        cls.executor = ProcessPoolExecutor(max_workers=workers)
+        cls.scheduler = FairScheduler(cls.executor, workers, max_queue=max_queue)
 
-    def _get_task_response(self, id):
+    def _submit(self, kind, finaldata, render):
         """
-        Simple function to grab a calculation that's stored in the buffer,
-        and return a dictionary/json-like response to the front-end.
+        Queues a calculation ("jwst" or "hst") with the scheduler. If the 
+        queue is full, answers 429 with the estimated wait, deletes the 
+        uploaded files and returns None.
         """
-        calc_task = self.buffer.get(id)
-        task = calc_task.task
+        try:
+            return self.scheduler.submit(self.get_cookie("pandexo_user"), kind,
+                                         run_and_render, finaldata, render)
+        except QueueFull as e:
+            for path in self.uploads:
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+            self._queue_full(e)
+            return None
 
-        response = {'id': id,
-                    'name': calc_task.name,
-                    'count': calc_task.count}
+    def _queue_full(self, e):
+        """
+        Answers 429 with the estimated wait of a full scheduler queue.
+        """
+        self.set_status(429)
+        self.set_header('Retry-After', str(max(int(np.ceil(e.wait)), 1)))
+        self.write({'error': str(e), 'estimated_wait': e.wait})
 
-        if task.running():
-            response['state'] = 'running'
-            response['code'] = 202
-        elif task.done():
-            response['state'] = 'finished'
-        elif task.cancelled():
-            response['state'] = 'cancelled'
-        else:
-            response['state'] = 'pending'
+    def initialize(self):
+        #files uploaded with this request (see _save_upload)
+        self.uploads = []
 
-        response['html'] = tornado.escape.to_basestring(
-            self.render_string("calc_row.html", response=response))
-        return response
+    def _save_upload(self, field, name):
+        """
+        Writes the file uploaded in form field `field` to __TEMP__ as name 
+        plus the original extension and returns its path. The file is 
+        deleted when the calculation is done.
+        """
+        fileinfo = self.request.files[field][0]
+        extn = os.path.splitext(fileinfo['filename'])[1]
+        path = os.path.join(__TEMP__, name + extn)
+        with open(path, 'wb') as f:
+            f.write(fileinfo['body'])
+        self.uploads.append(path)
+        return path
+
+    @gen.coroutine
+    def _stream_download(self, data, file_name):
+        """
+        Writes data to the response in chunks, waiting for each chunk to 
+        be flushed to the client before writing the next.
+        """
+        self.set_header('Content-Type', 'application/octet-stream')
+        self.set_header('Content-Disposition',
+                        'attachment; filename=' + file_name)
+        self.set_header('Content-Length', str(len(data)))
+        view = memoryview(data)
+        for i in range(0, len(data), self.chunk_size):
+            self.write(bytes(view[i:i+self.chunk_size]))
+            try:
+                yield self.flush()
+            except tornado.iostream.StreamClosedError:
+                #client went away
+                return
+        self.finish()
 
- 
-    def _get_task_response_hst(self, id):
+    @gen.coroutine
+    def _get_job(self, id):
         """
-        Simple function to grab a calculation that's stored in the buffer,
-        and return a dictionary/json-like response to the front-end.
+        Job record from the store, read off the IOLoop. Unknown (or expired) 
+        ids are a 404.
         """
-        calc_task = self.buffer.get(id)
-        task = calc_task.task
+        job = yield tornado.ioloop.IOLoop.current().run_in_executor(None, self.jobs.get, id)
+        if job is None:
+            raise tornado.web.HTTPError(404, 'No calculation with id {}'.format(id))
+        return job
+
+    @gen.coroutine
+    def _task_response(self, id, template, job=None):
+        """
+        Grabs a calculation from the job store (unless its record `job` is 
+        given) and returns a dictionary/json-like response to the front-end.
+        """
+        if job is None:
+            job = yield self._get_job(id)
 
         response = {'id': id,
-                    'name': calc_task.name,
-                    'count': calc_task.count}
+                    'name': job['name'],
+                    'count': job['count'], 
+                    'state': job['state']}
 
-        if task.running():
+        #only the process running a job knows when it starts
+        task = self.tasks.get(id)
+        if (job['state'] == 'pending') and (task is not None) and task.running():
             response['state'] = 'running'
             response['code'] = 202
-        elif task.done():
-            response['state'] = 'finished'
-        elif task.cancelled():
-            response['state'] = 'cancelled'
-        else:
-            response['state'] = 'pending'
 
         response['html'] = tornado.escape.to_basestring(
-            self.render_string("calc_rowhst.html", response=response))
-
+            self.render_string(template, response=response))
         return response
+
+    def _get_task_response(self, id, job=None):
+        """
+        Simple function to grab a calculation that's stored in the job store,
+        and return a dictionary/json-like response to the front-end.
+        """
+        return self._task_response(id, "calc_row.html", job)
+ 
+    def _get_task_response_hst(self, id, job=None):
+        """
+        Simple function to grab a calculation that's stored in the job store,
+        and return a dictionary/json-like response to the front-end.
+        """
+        return self._task_response(id, "calc_rowhst.html", job)
         
     def write_error(self, status_code, **kwargs):
         """
@@ -160,27 +301,144 @@ class BaseHandler(tornado.web.RequestHandler):
         self.render('errors.html',page=None, status_code=status_code, reason=reason, error_log=trace_print)
 
 
+    @gen.coroutine
     def _get_task_result(self, id):
         """
-        This method grabs only the result returned from the python `Future`
-        object. This contains the stuff that Pandeia returns.
+        This method grabs only the result of the calculation from the job
+        store. This contains the stuff that Pandeia returns. A calculation
+        running in this process is awaited for up to `result_wait` seconds 
+        without blocking the IOLoop. Returns None if it is not finished.
         """
-        calc_task = self.buffer.get(id)
-        task = calc_task.task
+        job = yield self._get_job(id)
+        if job['state'] == 'cancelled':
+            raise tornado.web.HTTPError(410, 'Calculation {} was cancelled'.format(id))
+        if job['state'] == 'error':
+            raise Exception(job['error'])
+        if job['state'] == 'finished':
+            #unpickling a large result from the store is done off the IOLoop
+            result = yield tornado.ioloop.IOLoop.current().run_in_executor(
+                                None, self.jobs.result, id)
+            return result
+        task = self.tasks.get(id)
+        if task is None:
+            if not jobstore.owner_alive(job.get('owner')):
+                #its server process is gone, it will never finish
+                yield tornado.ioloop.IOLoop.current().run_in_executor(
+                    None, functools.partial(self.jobs.finish, id, 'error', 
+                                            error=jobstore.orphan_error))
+                raise Exception(jobstore.orphan_error)
+            #pending, but running in another server process
+            return None
+        try:
+            result = yield gen.with_timeout(timedelta(seconds=self.result_wait), task)
+        except gen.TimeoutError:
+            return None
+        return result
 
-        return task.result()
+    @gen.coroutine
+    def _get_task_view(self, id, kind, render):
+        """
+        Rendered (script, div) of a calculation. It is normally rendered by 
+        the worker with the result. Otherwise it is rendered on first view, 
+        queued with the scheduler like a calculation of the same kind, and 
+        stored with the result. Returns None if the calculation is not 
+        finished. Raises QueueFull if the scheduler queue is full.
+        """
+        ioloop = tornado.ioloop.IOLoop.current()
+        job = yield self._get_job(id)
+        if job['state'] == 'finished':
+            view = yield ioloop.run_in_executor(None, self.jobs.view, id)
+            if view is not None:
+                return view
+        result = yield self._get_task_result(id)
+        if result is None:
+            return None
+        #stored by the done callback while the result was awaited
+        view = yield ioloop.run_in_executor(None, self.jobs.view, id)
+        if view is None:
+            view = yield self.scheduler.submit(self.get_cookie("pandexo_user"), kind,
+                                               render, result)
+            yield ioloop.run_in_executor(None, self.jobs.put_view, id, view)
+        return view
+
+    @gen.coroutine
+    def _retry_later(self, id):
+        """
+        Answers 202 with a Retry-After header for a calculation that is not
+        finished yet.
+        """
+        job = yield self._get_job(id)
+        self.set_status(202)
+        self.set_header('Retry-After', str(self.retry_after))
+        self.write({'id': id, 'state': job['state'], 
+                    'retry_after': self.retry_after})
 
+    @gen.coroutine
     def _add_task(self, id, name, task):
         """
-        This creates the task and adds it to the buffer.
+        This adds the task to the job store. The result is written to the 
+        store when the task is done.
         """
-        self.buffer[id] = CalculationTask(id=id, name=name, task=task,
-                                          count=len(self.buffer)+1,
-                                          cookie=self.get_cookie("pandexo_user"))
+        ioloop = tornado.ioloop.IOLoop.current()
+        yield ioloop.run_in_executor(None, self.jobs.add, id, name, 
+                                     self.get_cookie("pandexo_user"))
+        self.tasks[id] = task
+        #done callbacks run in the executor's thread, hop back to the IOLoop
+        finish = functools.partial(self._finish_task, id, list(self.uploads))
+        task.add_done_callback(lambda task: ioloop.add_callback(finish, task))
+
+    @classmethod
+    @gen.coroutine
+    def _finish_task(cls, id, uploads, task):
+        """
+        Runs on the IOLoop when a task is done. Moves the result (or the 
+        traceback) of the calculation to the job store in the executor, as 
+        pickling a large result would block the IOLoop.
+        """
+        try:
+            yield tornado.ioloop.IOLoop.current().run_in_executor(
+                None, cls._store_task, id, uploads, task)
+        finally:
+            cls.tasks.pop(id, None)
 
-        # Only allow 100 tasks **globally**. This will delete old tasks first.
-        if len(self.buffer) > 100:
-            self.buffer.popitem(last=False)
+    @classmethod
+    def _store_task(cls, id, uploads, task):
+        """
+        Writes the result (or the traceback) of a finished task to the job 
+        store and deletes its uploaded files.
+        """
+        for path in uploads:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+        try:
+            if task.cancelled():
+                cls.jobs.finish(id, 'cancelled')
+            elif task.exception() is not None:
+                e = task.exception()
+                error = "".join(traceback.format_exception(type(e), e, e.__traceback__))
+                cls.jobs.finish(id, 'error', error=error)
+            else:
+                result = task.result()
+                #the rendered page is stored next to the result, not in it
+                view = result.pop(view_key, None) if isinstance(result, dict) else None
+                cls.jobs.finish(id, 'finished', result=result, view=view)
+        except Exception:
+            traceback.print_exc()
+            cls.jobs.finish(id, 'error', error=traceback.format_exc())
+
+    @classmethod
+    def _add_profile(cls, task):
+        """
+        Done callback for JWST tasks. Adds the stage timers of the finished
+        calculation to the server wide profile.
+        """
+        if task.cancelled() or task.exception() is not None:
+            return
+        result = task.result()
+        if isinstance(result, dict):
+            cls.profiles.add(result.get('Profiling'))
             
 
 
@@ -222,11 +480,12 @@ class DashboardHandler(BaseHandler):
     Request handler for the dashboard page. This will retrieve and render
     the html template, along with the list of current task objects.
     """
+    @gen.coroutine
     def get(self):
-        task_responses = [self._get_task_response(id) for id, nt in
-                          list(self.buffer.items())
-                          if ((nt.cookie == self.get_cookie("pandexo_user"))
-                          & (id[len(id)-1]=='e'))]
+        jobs = yield tornado.ioloop.IOLoop.current().run_in_executor(
+                        None, self.jobs.jobs, self.get_cookie("pandexo_user"))
+        task_responses = yield [self._get_task_response(job['id'], job) for job in jobs
+                                if job['id'][-1]=='e']
         
         self.render("dashboard.html", calculations=task_responses[::-1])
 
@@ -236,11 +495,12 @@ class DashboardHSTHandler(BaseHandler):
     Request handler for the dashboard page. This will retrieve and render
     the html template, along with the list of current task objects.
     """
+    @gen.coroutine
     def get(self):
-        task_responses = [self._get_task_response_hst(id) for id, nt in
-                          list(self.buffer.items())
-                          if ((nt.cookie == self.get_cookie("pandexo_user"))
-                          & (id[len(id)-1]=='h'))]
+        jobs = yield tornado.ioloop.IOLoop.current().run_in_executor(
+                        None, self.jobs.jobs, self.get_cookie("pandexo_user"))
+        task_responses = yield [self._get_task_response_hst(job['id'], job) for job in jobs
+                                if job['id'][-1]=='h']
         
         self.render("dashboardhst.html", calculations=task_responses[::-1])
 
@@ -268,6 +528,7 @@ class CalculationNewHandler(BaseHandler):
                                  planets=all_planets
                                  )
 
+    @gen.coroutine
     def post(self):
         """
         The post method contains the returned data from the form data (
@@ -347,14 +608,7 @@ class CalculationNewHandler(BaseHandler):
 
             if exodata["star"]["type"] == "user":
                 # process star file
-                fileinfo_star = self.request.files['starFile'][0]
-                fname_star = fileinfo_star['filename']
-                extn_star = os.path.splitext(fname_star)[1]
-                cname_star = id+'star' + extn_star
-                fh_star = open(os.path.join(__TEMP__, cname_star), 'wb')
-                fh_star.write(fileinfo_star['body'])
-
-                exodata["star"]["starpath"] = os.path.join(__TEMP__, cname_star)
+                exodata["star"]["starpath"] = self._save_upload('starFile', id+'star')
                 exodata["star"]["f_unit"] = self.get_argument("starfunits")
                 exodata["star"]["w_unit"] = self.get_argument("starwunits")
  
@@ -363,14 +617,7 @@ class CalculationNewHandler(BaseHandler):
             exodata["planet"]["type"] = self.get_argument("planetModel")
             if exodata["planet"]["type"] == "user":
                 # process planet file
-                fileinfo_plan = self.request.files['planFile'][0]
-                fname_plan = fileinfo_plan['filename']
-                extn_plan = os.path.splitext(fname_plan)[1]
-                cname_plan = id+'planet' + extn_plan
-                fh_plan = open(os.path.join(__TEMP__, cname_plan), 'wb')
-                fh_plan.write(fileinfo_plan['body'])
-
-                exodata["planet"]["exopath"] = os.path.join(__TEMP__, cname_plan)
+                exodata["planet"]["exopath"] = self._save_upload('planFile', id+'planet')
                 exodata["planet"]["w_unit"] = self.get_argument("planwunits")
                 exodata["planet"]["f_unit"] = self.get_argument("planfunits")
             elif exodata["planet"]["type"] == "constant":                               
@@ -403,13 +650,7 @@ class CalculationNewHandler(BaseHandler):
                 observation_type = self.get_argument("noiseModel")
                 if observation_type == "user":
                     # process noise file
-                    fileinfo_noise = self.request.files['noiseFile'][0]
-                    fname_noise = fileinfo_noise['filename']
-                    extn_noise = os.path.splitext(fname_noise)[1]
-                    cname_noise = id + 'noise' + extn_noise
-                    fh_noise = open(os.path.join(__TEMP__, cname_noise), 'wb')
-                    fh_noise.write(fileinfo_star['body'])
-                    exodata["observation"]["noise_floor"] = os.path.join(__TEMP__, cname_noise)
+                    exodata["observation"]["noise_floor"] = self._save_upload('noiseFile', id+'noise')
                 else:
                     exodata["observation"]["noise_floor"] = float(self.get_argument("noisefloor"))
             except:
@@ -447,6 +688,10 @@ class CalculationNewHandler(BaseHandler):
 
         pandata['configuration']['instrument']['instrument'] = instrument
         
+        # collect stage timers for the server wide profile
+        if options.profiling:
+            exodata["observation"]["profile"] = True
+        
         # write in optimal groups or set a number
         try:
             pandata["configuration"]["detector"]["ngroup"] = int(self.get_argument("optimize"))
@@ -461,12 +706,15 @@ class CalculationNewHandler(BaseHandler):
         except: 
             pass
 
-        task = self.executor.submit(wrapper, finaldata)
-
+        task = self._submit('jwst', finaldata, render_jwst)
+        if task is None:
+            return
+        if options.profiling:
+            task.add_done_callback(self._add_profile)
 
-        self._add_task(id, self.get_argument("calcName"), task)
+        yield self._add_task(id, self.get_argument("calcName"), task)
 
-        response = self._get_task_response(id)
+        response = yield self._get_task_response(id)
         response['info'] = {}
         response['location'] = '/calculation/status/{}'.format(id)
         
@@ -495,6 +743,7 @@ class CalculationNewHSTHandler(BaseHandler):
                                  planets=all_planets
                                  )
 
+    @gen.coroutine
     def post(self):
         """
         The post method contains the retured data from the form data (
@@ -604,14 +853,7 @@ class CalculationNewHSTHandler(BaseHandler):
 
             if exodata["planet"]["type"] == "user":
                 # process planet file
-                fileinfo_plan = self.request.files['planFile'][0]
-                fname_plan = fileinfo_plan['filename']
-                extn_plan = os.path.splitext(fname_plan)[1]
-                cname_plan = id+'planet' + extn_plan
-                fh_plan = open(os.path.join(__TEMP__, cname_plan), 'wb')
-                fh_plan.write(fileinfo_plan['body'])
-
-                exodata["planet"]["exopath"] = os.path.join(__TEMP__, cname_plan)
+                exodata["planet"]["exopath"] = self._save_upload('planFile', id+'planet')
                 exodata["planet"]["w_unit"] = self.get_argument("planwunits")
                 exodata["planet"]["f_unit"] = self.get_argument("planfunits")
 
@@ -681,11 +923,13 @@ class CalculationNewHSTHandler(BaseHandler):
         except: 
             pass
 
-        task = self.executor.submit(wrapper, finaldata)
+        task = self._submit('hst', finaldata, render_hst)
+        if task is None:
+            return
 
-        self._add_task(id, self.get_argument("calcName"), task)
+        yield self._add_task(id, self.get_argument("calcName"), task)
 
-        response = self._get_task_response_hst(id)
+        response = yield self._get_task_response_hst(id)
         response['info'] = {}
         response['location'] = '/calculation/statushst/{}'.format(id)
         
@@ -700,8 +944,9 @@ class CalculationStatusHandler(BaseHandler):
     """
     Handlers returning the status of a particular JWST calculation task.
     """
+    @gen.coroutine
     def get(self, id):
-        response = self._get_task_response(id)
+        response = yield self._get_task_response(id)
 
         if self.request.connection.stream.closed():
             return
@@ -713,8 +958,9 @@ class CalculationStatusHSTHandler(BaseHandler):
     """
     Handlers returning the status of a particular HST calculation task.
     """
+    @gen.coroutine
     def get(self, id):
-        response = self._get_task_response_hst(id)
+        response = yield self._get_task_response_hst(id)
 
         if self.request.connection.stream.closed():
             return
@@ -724,73 +970,43 @@ class CalculationStatusHSTHandler(BaseHandler):
 class CalculationDownloadHandler(BaseHandler):
     """
     Handlers returning the downloaded data of a particular calculation task.
-    Handlers returning the status of a particular calculation task.
+    The result is pickled in memory and streamed to the client.
     """
+    @gen.coroutine
     def get(self, id):
-        result = self._get_task_result(id)
+        result = yield self._get_task_result(id)
+        if result is None:
+            yield self._retry_later(id)
+            return
   
         if self.request.connection.stream.closed():
             return
         file_name = "ETC-calculation" +id+".p"
  
-        with open(os.path.join(__TEMP__,file_name), "wb") as f:
-            pickle.dump(result, f)
- 
-        buf_size = 4096
-        self.set_header('Content-Type', 'application/octet-stream')
-        self.set_header('Content-Disposition',
-                        'attachment; filename=' + file_name)
- 
-        with open(os.path.join(__TEMP__,file_name), "rb") as f:
-            while True:
-                data = f.read(buf_size)
-                if not data:
-                    break
-                self.write(data)
-        
-        allfiles = os.listdir(__TEMP__)
-        for i in allfiles:
-            if i.find(id) != -1:
-                os.remove(os.path.join(__TEMP__,i))
-        self.finish()
+        #pickling a large result is done off the IOLoop
+        data = yield tornado.ioloop.IOLoop.current().run_in_executor(None, pickle_result, result)
+        yield self._stream_download(data, file_name)
 
 
 
 class CalculationDownloadPandInHandler(BaseHandler):
     """
     Handlers returning the downloaded data of a particular calculation task.
-    Handlers returning the status of a particular calculation task.
+    The PandExo input file is written in memory and streamed to the client.
     """
+    @gen.coroutine
     def get(self, id):
-        result = self._get_task_result(id)
+        result = yield self._get_task_result(id)
+        if result is None:
+            yield self._retry_later(id)
+            return
   
         if self.request.connection.stream.closed():
             return
         file_name = "PandExo-Input-file"+id+".txt"
  
-        #with open(os.path.join(__TEMP__,file_name), "w") as f:
-        #    pickle.dump(result, f)
-        np.savetxt(os.path.join(__TEMP__,file_name), np.transpose([result['w'], result['alpha']]))
-        
-        buf_size = 4096
-        self.set_header('Content-Type', 'application/octet-stream')
-        self.set_header('Content-Disposition',
-                        'attachment; filename=' + file_name)
- 
-        with open(os.path.join(__TEMP__,file_name), "rb") as f:
-            while True:
-                data = f.read(buf_size)
-                if not data:
-                    break
-                self.write(data)
-        
-        allfiles = os.listdir(__TEMP__)
-        for i in allfiles:
-            if i.find(id) != -1:
-                os.remove(os.path.join(__TEMP__,i))
-
-
-        self.finish()
+        data = yield tornado.ioloop.IOLoop.current().run_in_executor(None, pandexo_input_file, result)
+        yield self._stream_download(data, file_name)
 
 
 
@@ -798,21 +1014,19 @@ class CalculationViewHandler(BaseHandler):
     """
     This handler deals with passing the results from Pandeia to the
     `create_component_jwst` function which generates the Bokeh interative plots.
+    The plots are normally rendered by the worker (see `run_and_render`).
     """
+    @gen.coroutine
     def get(self, id):
-        
-        result = self._get_task_result(id)
-        
-        script, div = create_component_jwst(result)
-        div['timing_div'] = result['timing_div']
-        div['input_div'] = result['input_div'] 
-        div['warnings_div'] = result['warnings_div']
-
-        #delete files
-        allfiles = os.listdir(__TEMP__)
-        for i in allfiles:
-            if i.find(id) != -1:
-                os.remove(os.path.join(__TEMP__,i))
+        try:
+            view = yield self._get_task_view(id, 'jwst', render_jwst)
+        except QueueFull as e:
+            self._queue_full(e)
+            return
+        if view is None:
+            yield self._retry_later(id)
+            return
+        script, div = view
 
         self.render("view.html", script=script, div=div, id=id)
 
@@ -822,17 +1036,36 @@ class CalculationViewHSTHandler(BaseHandler):
     """
     This handler deals with passing the results from Pandeia to the
     `create_component_hst` function which generates the Bokeh interative plots.
+    The plots are normally rendered by the worker (see `run_and_render`).
     """
+    @gen.coroutine
     def get(self, id):
-        result = self._get_task_result(id)
-        script, div = create_component_hst(result)
-        div['info_div'] = result['info_div']
+        try:
+            view = yield self._get_task_view(id, 'hst', render_hst)
+        except QueueFull as e:
+            self._queue_full(e)
+            return
+        if view is None:
+            yield self._retry_later(id)
+            return
+        script, div = view
         self.render("viewhst.html", script=script, div=div, id=id)
 
 
+class ProfilingHandler(BaseHandler):
+    """
+    Handler returning the stage timers of all JWST calculations run by this
+    server (count, mean and max seconds per stage, memory high water mark).
+    Only served if the server is started with --profiling.
+    """
+    def get(self):
+        self.write(self.profiles.summary())
+
+
 def main():
     tornado.options.parse_command_line()
-    BaseHandler.executor = ProcessPoolExecutor(max_workers=options.workers)
+    BaseHandler.start_workers(options.workers, options.max_queue)
+    BaseHandler.jobs = jobstore.from_env()
     http_server = tornado.httpserver.HTTPServer(Application())
     http_server.listen(options.port)
     tornado.ioloop.IOLoop.current().start()
@@ -0,0 +1,202 @@
+import time
+import threading
+from collections import OrderedDict, deque
+from concurrent.futures import Future, CancelledError
+
+#priority classes, lower runs first. HST runs take seconds, JWST runs minutes
+priorities = {'hst': 0, 'jwst': 1}
+
+#initial guess of the run time of each class in seconds, updated as runs finish
+default_run_secs = {'hst': 10.0, 'jwst': 60.0}
+
+#seconds of waiting that move a job up one priority class, so that a steady
+#stream of HST jobs can not starve JWST
+default_aging = 300.0
+
+class QueueFull(Exception):
+    """Raised by `FairScheduler.submit` when the queue is full
+
+    Attributes
+    ----------
+    wait : float
+        estimated seconds until a new job could be queued
+    """
+    def __init__(self, wait):
+        self.wait = wait
+        super(QueueFull, self).__init__('Too many calculations queued, try again in %d secs' % wait)
+
+class FairScheduler():
+    """Admission control and fair queueing in front of an executor
+
+    Jobs are queued per user and per priority class. At most max_workers jobs are
+    handed to the executor at once, so that the executor never builds up a
+    backlog of its own. When a worker frees up, the next job comes from the
+    highest priority class (HST before JWST) with a queue, taking one job from
+    each user in turn. Classes age: every `aging` seconds that the oldest job of
+    a class has waited counts as one class higher, so a JWST job that waited
+    longer than `aging` runs before a new HST job. At most max_queue jobs wait,
+    further submissions are refused with `QueueFull`.
+
+    Parameters
+    ----------
+    executor : concurrent.futures.Executor
+        executor that runs the jobs
+    max_workers : int
+        jobs running at once, the number of workers of the executor
+    max_queue : int
+        (Optional) jobs waiting. Default = 100
+    aging : float
+        (Optional) seconds of waiting worth one priority class. Default = 300
+
+    Methods
+    -------
+    submit
+        queues a job, returns a Future
+    estimate_wait
+        seconds until a job submitted now would start
+
+    Examples
+    --------
+
+    >>> scheduler = FairScheduler(ProcessPoolExecutor(4), 4, max_queue=50)
+    >>> task = scheduler.submit(cookie, 'jwst', wrapper, finaldata)
+    """
+    def __init__(self, executor, max_workers, max_queue=100, aging=default_aging):
+        self.executor = executor
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self.aging = aging
+        self.lock = threading.Lock()
+        #priority -> OrderedDict of user -> deque of jobs, users in round robin order
+        self.queues = dict((p, OrderedDict()) for p in priorities.values())
+        self.nqueued = dict((p, 0) for p in priorities.values())
+        self.nrunning = dict((p, 0) for p in priorities.values())
+        self.run_secs = dict((priorities[k], v) for k, v in default_run_secs.items())
+
+    def _wait(self, queued):
+        """Seconds until the jobs queued in the classes `queued` have started
+        """
+        ahead = sum(self.nqueued[p] for p in queued)
+        if sum(self.nrunning.values()) + ahead < self.max_workers:
+            return 0.0
+        work = sum(self.nqueued[p]*self.run_secs[p] for p in queued)
+        #running jobs are assumed to be half done
+        work += 0.5*sum(self.nrunning[p]*self.run_secs[p] for p in self.nrunning)
+        return work/self.max_workers
+
+    def estimate_wait(self, kind='jwst'):
+        """Rough number of seconds until a job submitted now would start
+
+        Parameters
+        ----------
+        kind : str
+            (Optional) "hst" or "jwst". Default = "jwst"
+
+        Returns
+        -------
+        float
+        """
+        with self.lock:
+            priority = priorities[kind]
+            return self._wait([p for p in self.queues if p <= priority])
+
+    def submit(self, user, kind, func, *args):
+        """Queues func(*args)
+
+        Parameters
+        ----------
+        user : str
+            id of the user (pandexo_user cookie)
+        kind : str
+            "hst" or "jwst"
+        func : function
+            job to run in the executor
+        args
+            arguments of func
+
+        Returns
+        -------
+        concurrent.futures.Future
+            future of the job. It is running once handed to the executor
+
+        Raises
+        ------
+        QueueFull
+            if max_queue jobs are already waiting
+        """
+        priority = priorities[kind]
+        future = Future()
+        with self.lock:
+            if sum(self.nqueued.values()) >= self.max_queue:
+                raise QueueFull(self._wait(list(self.queues)))
+            self.queues[priority].setdefault(user, deque()).append((func, args, future, time.time()))
+            self.nqueued[priority] += 1
+        self._dispatch()
+        return future
+
+    def _next(self):
+        """Pops the next job: highest priority (after aging) first, round robin
+        over users
+        """
+        now = time.time()
+        best = None
+        for priority, queue in self.queues.items():
+            if len(queue) == 0:
+                continue
+            #the first job of each user is the oldest one
+            oldest = min(jobs[0][3] for jobs in queue.values())
+            rank = (priority - (now - oldest)/self.aging, priority)
+            if (best is None) or (rank < best[0]):
+                best = (rank, priority)
+        if best is None:
+            return None
+        priority = best[1]
+        queue = self.queues[priority]
+        user, jobs = queue.popitem(last=False)
+        job = jobs.popleft()
+        if len(jobs) > 0:
+            #back of the line for this user's next job
+            queue[user] = jobs
+        self.nqueued[priority] -= 1
+        return priority, job[0:3]
+
+    def _dispatch(self):
+        """Hands queued jobs to the executor while there are free workers
+        """
+        while True:
+            with self.lock:
+                if sum(self.nrunning.values()) >= self.max_workers:
+                    return
+                job = self._next()
+                if job is None:
+                    return
+                priority, (func, args, future) = job
+                if not future.set_running_or_notify_cancel():
+                    #cancelled while queued
+                    continue
+                self.nrunning[priority] += 1
+            start = time.time()
+            try:
+                inner = self.executor.submit(func, *args)
+            except Exception as e:
+                with self.lock:
+                    self.nrunning[priority] -= 1
+                future.set_exception(e)
+                continue
+            inner.add_done_callback(lambda inner, future=future, priority=priority, start=start:
+                                    self._done(inner, future, priority, start))
+
+    def _done(self, inner, future, priority, start):
+        """Done callback of a job in the executor, frees its worker
+        """
+        with self.lock:
+            self.nrunning[priority] -= 1
+            #running mean of the last ~10 runs
+            self.run_secs[priority] += 0.1*(time.time() - start - self.run_secs[priority])
+        if inner.cancelled():
+            future.set_exception(CancelledError())
+        elif inner.exception() is not None:
+            future.set_exception(inner.exception())
+        else:
+            future.set_result(inner.result())
+        self._dispatch()
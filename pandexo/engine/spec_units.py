@@ -0,0 +1,97 @@
+import numpy as np
+
+#speed of light in micron/s and angstrom/s
+c_micron = 2.99792458e14
+c_angs = 2.99792458e18
+
+#multiplicative factors to microns for wavelength units
+wave_factors = {'um': 1.0, 'nm': 1e-3, 'Angs': 1e-4, 'cm': 1e4}
+
+#multiplicative factors to Jy for frequency flux density units
+fnu_factors = {'Jy': 1.0, 'jy': 1.0, 'mJy': 1e-3, 'erg/cm2/s/Hz': 1e23}
+
+def wave_to_micron(wave, unit, copy=True):
+    """Converts wavelength (or frequency) to microns
+
+    Parameters
+    ----------
+    wave : array of float
+        wavelength in unit
+    unit : str
+        'um', 'nm', 'Angs', 'cm' or 'Hz'
+    copy : bool
+        (Optional) if False and wave is a float array, it is converted in place. Default = True
+
+    Returns
+    -------
+    array of float
+        wavelength in microns. Note that frequencies in ascending order become
+        wavelengths in descending order
+
+    Examples
+    --------
+
+    >>> wave_to_micron(np.array([1000.0, 2000.0]), 'nm')
+    array([ 1.,  2.])
+    """
+    wave = _as_float(wave, copy)
+    if unit in wave_factors:
+        if wave_factors[unit] != 1.0:
+            np.multiply(wave, wave_factors[unit], out=wave)
+    elif unit == 'Hz':
+        np.divide(c_micron, wave, out=wave)
+    else:
+        raise Exception('Units are not correct. Pick um, nm, cm, Hz, or Angs')
+    return wave
+
+def flux_to_jy(flux, unit, wave_micron, copy=True):
+    """Converts flux density to Jy
+
+    Parameters
+    ----------
+    flux : array of float
+        flux density in unit
+    unit : str
+        'Jy', 'mJy', 'erg/cm2/s/Hz' or 'FLAM' (erg/cm2/s/Angs)
+    wave_micron : array of float
+        wavelength in microns (only used for FLAM)
+    copy : bool
+        (Optional) if False and flux is a float array, it is converted in place. Default = True
+
+    Returns
+    -------
+    array of float
+        flux density in Jy
+    """
+    flux = _as_float(flux, copy)
+    if unit in fnu_factors:
+        if fnu_factors[unit] != 1.0:
+            np.multiply(flux, fnu_factors[unit], out=flux)
+    elif unit == 'FLAM':
+        #F_nu = F_lambda lambda^2 / c
+        wave_angs = np.asarray(wave_micron, dtype=float)*1e4
+        np.multiply(flux, wave_angs, out=flux)
+        np.multiply(flux, wave_angs, out=flux)
+        np.multiply(flux, 1e23/c_angs, out=flux)
+    else:
+        raise Exception('Units are not correct. Pick FLAM or Jy or erg/cm2/s/Hz')
+    return flux
+
+def sort_wave(wave, flux):
+    """Puts spectrum in ascending order of wavelength. Already sorted spectra are
+    returned as is and descending ones are reversed without a sort
+    """
+    if len(wave) < 2:
+        return wave, flux
+    dw = np.diff(wave)
+    if (dw >= 0).all():
+        return wave, flux
+    if (dw <= 0).all():
+        return wave[::-1], flux[::-1]
+    order = np.argsort(wave, kind='mergesort')
+    return wave[order], flux[order]
+
+def _as_float(arr, copy):
+    if copy:
+        return np.array(arr, dtype=float)
+    return np.asarray(arr, dtype=float)
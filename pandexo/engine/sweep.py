@@ -0,0 +1,528 @@
+import os
+import time
+import json
+import pickle
+import signal
+import hashlib
+import itertools
+import threading
+import warnings
+import traceback
+from collections import OrderedDict
+import numpy as np
+import pandas as pd
+from .cache import _to_json
+
+#name of the grid dimension that loops over instruments
+inst_dim = 'inst'
+
+def set_param(exo, param, value):
+    """Sets one parameter in the exo dictionary
+
+    Parameters
+    ----------
+    exo : dict
+        exoplanet input dictionary (changed in place)
+    param : str
+        "first level of dict"+"second level of dict", e.g. "star+mag"
+    value : float or str
+        new value
+    """
+    key1 = param[0:param.find('+')]
+    key2 = param[param.find('+')+1:len(param)]
+    exo[key1][key2] = value
+
+def grid_points(grid, mode='product'):
+    """Flattens a sweep into a list of points
+
+    Parameters
+    ----------
+    grid : dict
+        {param: list of values}. Keys are either "first level+second level" of the
+        exo dictionary (e.g. "star+mag", "planet+exopath") or "inst" for a list of
+        instruments. Use an OrderedDict (or python >= 3.7) to fix the order of the
+        dimensions
+    mode : str
+        (Optional) "product" for every combination of the values (Cartesian grid)
+        or "zip" to step through all lists together. Default = "product"
+
+    Returns
+    -------
+    dims : list of str
+        names of the dimensions of the result
+    coords : OrderedDict
+        {dim: list of values}
+    points : list of dict
+        {param: value} for each point, in C order of the result
+    """
+    grid = OrderedDict((k, list(v)) for k, v in grid.items())
+    if len(grid) == 0:
+        raise Exception('Grid is empty, pick at least one parameter to loop through')
+    for k, v in grid.items():
+        if (k != inst_dim) and ('+' not in k):
+            raise Exception('Grid keys should be "inst" or in the format "star+mag", not '+k)
+        if len(v) == 0:
+            raise Exception('No values given for '+k)
+
+    keys = list(grid.keys())
+    if mode == 'product':
+        dims = keys
+        coords = grid
+        points = [OrderedDict(zip(keys, p)) for p in itertools.product(*grid.values())]
+    elif mode == 'zip':
+        n = set(len(v) for v in grid.values())
+        if len(n) > 1:
+            raise Exception('All parameters in a zip grid need the same number of values')
+        #one dimension, labeled by the values of every parameter
+        dims = ['point']
+        coords = OrderedDict([('point', list(range(n.pop())))])
+        coords.update(grid)
+        points = [OrderedDict(zip(keys, p)) for p in zip(*grid.values())]
+    else:
+        raise Exception('Grid mode should be "product" or "zip"')
+    return dims, coords, points
+
+class PointTimeout(BaseException):
+    """Raised in a point that runs past the timeout of `run_safe`
+
+    Not an Exception, so that the try/except blocks in the calculation (and
+    in pandeia) can't swallow it or turn it into a different error.
+    """
+
+def _timeout(signum, frame):
+    raise PointTimeout('Point timed out')
+
+def run_safe(func, args, timeout=None, capture=True):
+    """Calls func(*args), returning the error instead of raising it
+
+    Parameters
+    ----------
+    func : function
+        function to call
+    args : tuple
+        arguments of func
+    timeout : float
+        (Optional) wall clock limit in seconds. Uses SIGALRM, so it is only
+        enforced on unix in the main thread of a process (e.g. a pool worker).
+        Elsewhere, or if timeout is None, no signal handler is installed and
+        func runs without a limit
+    capture : bool
+        (Optional) if False errors are raised as usual (a timeout raises an
+        Exception) instead of being returned. Default = True
+
+    Returns
+    -------
+    result, error
+        output of func (None if it failed) and None or a dict with the
+        'error' message, 'traceback' and 'secs' it ran for
+    """
+    use_alarm = False
+    if timeout is not None:
+        use_alarm = (hasattr(signal, 'SIGALRM') and
+                     (threading.current_thread() is threading.main_thread()))
+        if not use_alarm:
+            warnings.warn('Timeout is only enforced in the main thread on unix, running without it')
+    if use_alarm:
+        previous = signal.signal(signal.SIGALRM, _timeout)
+        signal.setitimer(signal.ITIMER_REAL, timeout)
+    start = time.time()
+    try:
+        return func(*args), None
+    except PointTimeout as e:
+        if not capture:
+            raise Exception('Timed out after %.1f secs' % (time.time() - start))
+        return None, {'error': str(e), 'traceback': traceback.format_exc(),
+                      'secs': time.time() - start}
+    except Exception as e:
+        if not capture:
+            raise
+        return None, {'error': str(e) or repr(e), 'traceback': traceback.format_exc(),
+                      'secs': time.time() - start}
+    finally:
+        if use_alarm:
+            signal.setitimer(signal.ITIMER_REAL, 0)
+            signal.signal(signal.SIGALRM, previous)
+
+def error_table(errors, params):
+    """Table of failed points
+
+    Parameters
+    ----------
+    errors : list
+        (point, error) of each failed point (see `run_safe`)
+    params : list of str
+        parameters of the sweep
+
+    Returns
+    -------
+    pandas.DataFrame
+        one row per failed point with its parameters, error, traceback and secs
+    """
+    rows = []
+    for point, error in errors:
+        row = OrderedDict((k, point.get(k)) for k in params)
+        row.update(error)
+        rows.append(row)
+    return pd.DataFrame(rows, columns=list(params)+['error', 'traceback', 'secs'])
+
+def point_key(point):
+    """File name safe key of a grid point
+    """
+    items = [[k, point[k]] for k in sorted(point.keys())]
+    return hashlib.sha256(json.dumps(items, default=_to_json).encode()).hexdigest()[0:16]
+
+def sweep_tag(exo, inst, mode):
+    """Hash of the inputs of a sweep that are the same for every point
+    """
+    tag = json.dumps([exo, inst, mode], sort_keys=True, default=_to_json)
+    return hashlib.sha256(tag.encode()).hexdigest()
+
+def summarize(result):
+    """Small in memory summary of a pandexo output
+
+    Keeps the timing and warnings and the median 1 sigma error of the final
+    spectrum (JWST) or of the binned planet spectrum (HST)
+
+    Parameters
+    ----------
+    result : dict
+        output of pandexo
+
+    Returns
+    -------
+    dict
+    """
+    summary = {}
+    for key in ['timing', 'warning']:
+        if key in result:
+            summary[key] = result[key]
+    if 'FinalSpectrum' in result:
+        summary['median_error'] = float(np.median(result['FinalSpectrum']['error_w_floor']))
+    elif 'planet_spec' in result:
+        summary['median_error'] = float(np.median(result['planet_spec']['error']))
+    return summary
+
+class PointStore():
+    """On disk store of a sweep, one pickle per point
+
+    Each completed point is written as soon as it arrives (by the worker that
+    computed it) and recorded in an append only index (index.jsonl) together with
+    its coordinates and summary. Only the summaries are kept in memory. Points
+    already in the index are skipped when the sweep is run again, so an
+    interrupted sweep resumes where it stopped.
+
+    Parameters
+    ----------
+    path : str
+        directory of the store, created if it does not exist
+    tag : str
+        (Optional) hash of the sweep inputs. A store can only be resumed by the
+        sweep that created it
+
+    Methods
+    -------
+    write
+        saves the output of one point (called in the workers)
+    add
+        records a saved point in the index
+    done
+        summaries of all points in the index
+    load
+        full output of one point
+
+    Examples
+    --------
+
+    >>> res = run_grid(exo, {"star+mag": np.linspace(6, 12, 500)}, inst="NIRSpec G395M",
+                       store="mag_sweep")
+    >>> res.store.load({"star+mag": 6.0})['FinalSpectrum']
+    """
+    def __init__(self, path, tag=None):
+        self.path = path
+        if not os.path.isdir(path):
+            try:
+                os.makedirs(path)
+            except OSError:
+                if not os.path.isdir(path):
+                    raise
+        if tag is not None:
+            meta = os.path.join(path, 'meta.json')
+            if os.path.isfile(meta):
+                with open(meta) as f:
+                    if json.load(f)['tag'] != tag:
+                        raise Exception('Store ' + path + ' belongs to a different sweep. '
+                                        'Pick a new directory or delete it')
+            else:
+                with open(meta, 'w') as f:
+                    json.dump({'tag': tag}, f)
+        self.index = os.path.join(path, 'index.jsonl')
+
+    def _file(self, key):
+        return os.path.join(self.path, key + '.p')
+
+    def write(self, point, result):
+        """Saves the output of a point
+
+        Parameters
+        ----------
+        point : dict
+            {param: value}
+        result : dict
+            output of pandexo
+        """
+        fname = self._file(point_key(point))
+        tmp = fname + '.' + str(os.getpid()) + '.tmp'
+        with open(tmp, 'wb') as f:
+            pickle.dump(result, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.rename(tmp, fname)
+
+    def add(self, point, summary):
+        """Records a written point in the index (only called by the parent process)
+        """
+        line = json.dumps({'key': point_key(point), 'point': [[k, v] for k, v in point.items()],
+                           'summary': summary}, default=_to_json)
+        with open(self.index, 'a') as f:
+            f.write(line + '\n')
+            f.flush()
+
+    def done(self):
+        """Summaries of all the points in the store
+
+        Returns
+        -------
+        dict
+            {key: summary}. Points whose file is missing are left out
+        """
+        done = {}
+        if not os.path.isfile(self.index):
+            return done
+        with open(self.index) as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    #last line of an interrupted write
+                    continue
+                if os.path.isfile(self._file(entry['key'])):
+                    done[entry['key']] = entry['summary']
+        return done
+
+    def load(self, point):
+        """Full output of a point
+
+        Parameters
+        ----------
+        point : dict
+            {param: value} for every parameter of the sweep
+
+        Returns
+        -------
+        dict
+            output of pandexo
+        """
+        fname = self._file(point_key(point))
+        if not os.path.isfile(fname):
+            raise Exception('Point %s is not in store %s' % (dict(point), self.path))
+        with open(fname, 'rb') as f:
+            return pickle.load(f)
+
+class GridResult():
+    """Labeled N dimensional result of a grid sweep
+
+    Works like a minimal xarray.DataArray of pandexo outputs: `values` is an object
+    array with one axis per dimension and `coords` holds the labels of each axis.
+
+    Parameters
+    ----------
+    dims : list of str
+        name of each axis
+    coords : OrderedDict
+        {name: values}. Every dim has an entry; zip grids also have one entry per
+        parameter along the "point" axis
+    values : array of object
+        pandexo output of each point, shape = length of each dim
+    store : PointStore
+        (Optional) if the outputs were streamed to disk, values holds the
+        summaries and `load` reads the full outputs
+    errors : pandas.DataFrame
+        (Optional) failed points (see `error_table`). Their values are None
+
+    Methods
+    -------
+    sel
+        selects by coordinate value
+    isel
+        selects by index
+    apply
+        applies a function to every point
+    to_dataframe
+        flat table of the coordinates and outputs
+    load
+        full output of a point from the store
+
+    Examples
+    --------
+
+    >>> res = run_grid(exo, {'inst': ['NIRSpec G395M', 'MIRI LRS'], 'star+mag': [8, 10]})
+    >>> res.dims
+    ['inst', 'star+mag']
+    >>> res.sel({'inst': 'MIRI LRS', 'star+mag': 10})['FinalSpectrum']
+    >>> res.apply(lambda r: np.mean(r['FinalSpectrum']['error_w_floor']))
+    """
+    def __init__(self, dims, coords, values, store=None, errors=None):
+        self.dims = list(dims)
+        self.coords = OrderedDict(coords)
+        self.values = values
+        self.store = store
+        self.errors = errors
+
+    @property
+    def shape(self):
+        return self.values.shape
+
+    def __getitem__(self, item):
+        return self.values[item]
+
+    def __repr__(self):
+        lines = ['<GridResult %s>' % ', '.join('%s: %d' % (d, n) for d, n in zip(self.dims, self.shape))]
+        for k, v in self.coords.items():
+            lines.append('  %s: %s' % (k, v))
+        return '\n'.join(lines)
+
+    def _index(self, dim, value):
+        labels = self.coords[dim]
+        for i, label in enumerate(labels):
+            if np.all(label == value):
+                return i
+        raise Exception('%s is not a value of %s' % (value, dim))
+
+    def isel(self, indexers=None, **kwargs):
+        """Selects points by index along each dimension
+
+        Parameters
+        ----------
+        indexers : dict
+            {dim: int or slice}. Keyword arguments can be used for names without "+"
+
+        Returns
+        -------
+        dict or GridResult
+            single output if every dimension is given an int, otherwise a GridResult
+        """
+        indexers = dict(indexers or {}, **kwargs)
+        for d in indexers:
+            if d not in self.dims:
+                raise Exception(d + ' is not a dimension of this grid')
+        item = tuple(indexers.get(d, slice(None)) for d in self.dims)
+        values = self.values[item]
+        if not isinstance(values, np.ndarray):
+            return values
+        dims = [d for d, i in zip(self.dims, item) if not isinstance(i, (int, np.integer))]
+        coords = OrderedDict()
+        for d, i in zip(self.dims, item):
+            if d in dims:
+                coords[d] = list(np.array(self.coords[d], dtype=object)[i])
+        #zip grids carry the parameter values along the point axis
+        if ('point' in self.coords) and ('point' in self.dims):
+            i = item[self.dims.index('point')]
+            for k, v in self.coords.items():
+                if k not in self.dims:
+                    sub = np.array(v, dtype=object)[i]
+                    coords[k] = list(sub) if 'point' in dims else sub
+        return GridResult(dims, coords, values, store=self.store, errors=self.errors)
+
+    def sel(self, indexers=None, **kwargs):
+        """Selects points by coordinate value
+
+        Parameters
+        ----------
+        indexers : dict
+            {dim: value}. Keyword arguments can be used for names without "+"
+            (e.g. inst="MIRI LRS")
+
+        Returns
+        -------
+        dict or GridResult
+            single output if every dimension is given, otherwise a GridResult
+        """
+        indexers = dict(indexers or {}, **kwargs)
+        return self.isel({d: self._index(d, v) for d, v in indexers.items()})
+
+    def apply(self, func, dtype=float):
+        """Applies func to the output of every point
+
+        Parameters
+        ----------
+        func : function
+            takes one pandexo output and returns a value. Failed points give nan
+        dtype : type
+            (Optional) dtype of the result, use object for arrays. Default = float
+
+        Returns
+        -------
+        array
+            array with the shape of the grid
+        """
+        out = np.empty(self.shape, dtype=dtype)
+        for i in np.ndindex(*self.shape):
+            value = self.values[i]
+            #failed points
+            out[i] = np.nan if value is None else func(value)
+        return out
+
+    def _labels(self, i):
+        """All coordinates of the point at index i
+        """
+        row = OrderedDict()
+        for d, j in zip(self.dims, i):
+            row[d] = self.coords[d][j]
+        if 'point' in self.dims:
+            j = i[self.dims.index('point')]
+            for k, v in self.coords.items():
+                if k not in self.dims:
+                    row[k] = v[j]
+        return row
+
+    def load(self, indexers=None, **kwargs):
+        """Reads the full output of one point from the store
+
+        Parameters
+        ----------
+        indexers : dict
+            {dim: value} for every dimension (see `sel`)
+
+        Returns
+        -------
+        dict
+            output of pandexo
+        """
+        if self.store is None:
+            raise Exception('Grid was not run with a store, use sel')
+        indexers = dict(indexers or {}, **kwargs)
+        i = tuple(self._index(d, indexers[d]) for d in self.dims)
+        point = self._labels(i)
+        point.pop('point', None)
+        return self.store.load(point)
+
+    def to_dataframe(self, func=None, name='result'):
+        """One row per point with a column for each coordinate
+
+        Parameters
+        ----------
+        func : function
+            (Optional) applied to every output first (see `apply`), e.g. to keep a
+            single number per point. Default keeps the full output
+        name : str
+            (Optional) column name of the outputs. Default = "result"
+
+        Returns
+        -------
+        pandas.DataFrame
+        """
+        rows = []
+        for i in np.ndindex(*self.shape):
+            row = self._labels(i)
+            value = self.values[i]
+            row[name] = value if (func is None) or (value is None) else func(value)
+            rows.append(row)
+        return pd.DataFrame(rows)
@@ -0,0 +1,57 @@
+import warnings
+warnings.filterwarnings('ignore')
+import os
+import time
+import numpy as np
+import pysynphot as psyn
+from pandexo.engine import create_input as create
+
+#Per call cost of normalizing a phoenix star to a J, H and K magnitude: pysynphot
+#(FileBandpass + renorm, what outTrans used to do) versus the preloaded
+#bandpass arrays and renorm_vegamag used by outTrans with PANDEXO_NORM=arrays. Both use the trapezoid
+#rule on the merged wavelength grid, so they should agree to within tolerance
+ncalls = 20
+mag = 8.0
+filters = ['J', 'H', 'K']
+tolerance = 1e-3
+
+sp = psyn.Icat("phoenix", 5500, 0.0, 4.0)
+sp.convert('angstroms')
+sp.convert('jy')
+wave = np.array(sp.wave)
+flux_jy = np.array(sp.flux)
+
+def pysynphot_norm(filt):
+    bp_path = os.path.join(os.environ.get("pandeia_refdata"), "normalization", "bandpass", create.all_bps[filt])
+    bp = psyn.FileBandpass(bp_path)
+    bp.convert('angstroms')
+    rn_sp = sp.renorm(mag, 'vegamag', bp)
+    rn_sp.convert("microns")
+    rn_sp.convert("mjy")
+    return rn_sp.flux
+
+def array_norm(filt):
+    return create.renorm_vegamag(wave, flux_jy, mag, filt)*1e3
+
+worst = 0.0
+for filt in filters:
+    print(filt + ' band')
+    #first call loads the bandpass and Vega
+    start = time.time()
+    fast = array_norm(filt)
+    print('First call (loads bandpass): %.4f secs' % (time.time()-start))
+
+    for name, func in [('pysynphot', pysynphot_norm), ('renorm_vegamag', array_norm)]:
+        start = time.time()
+        for i in range(ncalls):
+            func(filt)
+        print(name + ': %.4f secs per call' % ((time.time()-start)/ncalls))
+
+    slow = pysynphot_norm(filt)
+    #phoenix spectra are zero at some wavelengths
+    good = slow > 0
+    diff = np.max(np.abs(fast[good]-slow[good])/slow[good])
+    print('Max fractional difference: %.2e' % diff)
+    worst = max(worst, diff)
+
+assert worst < tolerance, 'renorm_vegamag differs from pysynphot by %.2e (tolerance %.0e)' % (worst, tolerance)
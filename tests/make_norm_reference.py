@@ -0,0 +1,51 @@
+"""Writes tests/data/norm_reference.npz, the pysynphot normalization of several
+stellar SEDs in J, H and K, used by test_normalization.py
+
+Needs pysynphot with PYSYN_CDBS (phoenix grid and Vega) and pandeia_refdata.
+"""
+import os
+import warnings
+warnings.filterwarnings('ignore')
+import numpy as np
+import pysynphot as psyn
+
+#bandpasses used by create_input.outTrans
+all_bps = {"H": 'bessell_h_004_syn.fits',
+           "J": 'bessell_j_003_syn.fits',
+           "K": 'bessell_k_003_syn.fits'}
+mag = 8.0
+
+def phoenix(temp, metal, logg):
+    sp = psyn.Icat("phoenix", temp, metal, logg)
+    sp.convert('angstroms')
+    sp.convert('jy')
+    return np.array(sp.wave), np.array(sp.flux)
+
+def blackbody(temp):
+    sp = psyn.BlackBody(temp)
+    sp.convert('angstroms')
+    sp.convert('jy')
+    return np.array(sp.wave), np.array(sp.flux)
+
+seds = {'phoenix_3500': phoenix(3500, 0.0, 5.0),
+        'phoenix_5500': phoenix(5500, 0.0, 4.0),
+        'phoenix_7000': phoenix(7000, 0.3, 4.5),
+        'blackbody_3000': blackbody(3000)}
+
+reference = {}
+for name, (wave, flux) in seds.items():
+    reference[name + '_wave'] = wave
+    reference[name + '_flux'] = flux
+    for filt, fname in all_bps.items():
+        bp = psyn.FileBandpass(os.path.join(os.environ.get("pandeia_refdata"), "normalization",
+                                            "bandpass", fname))
+        bp.convert('angstroms')
+        sp = psyn.ArraySpectrum(wave, flux, waveunits='angstrom', fluxunits='jy')
+        rn_sp = sp.renorm(mag, 'vegamag', bp)
+        rn_sp.convert('angstroms')
+        rn_sp.convert('jy')
+        reference[name + '_' + filt] = np.array(rn_sp.flux)
+
+path = os.path.join(os.path.dirname(__file__), 'data', 'norm_reference.npz')
+np.savez_compressed(path, mag=mag, **reference)
+print('Wrote ' + path)
@@ -0,0 +1,25 @@
+import numpy as np
+import pytest
+
+bintools = pytest.importorskip('pandexo.engine.bintools')
+
+#two groups of points with nothing in between, so the middle bin is empty
+x = np.concatenate([np.linspace(1.0, 1.5, 10), np.linspace(3.5, 4.0, 10)])
+y = np.zeros(20) + 10.0
+newx = np.array([1.25, 2.5, 3.75])
+
+def test_empty_bins_dropped_by_default():
+    with pytest.warns(UserWarning):
+        bin_x, bin_y, bin_dy, bin_n = bintools.uniform_tophat_mean(newx, x, y, dy=1.0)
+    assert np.allclose(bin_x, [1.25, 3.75])
+    assert np.allclose(bin_y, [10.0, 10.0])
+    assert np.allclose(bin_n, [10, 10])
+
+def test_empty_bins_kept_with_nan():
+    #nan=True used to be ignored (~True is -2, so nans were always dropped)
+    with pytest.warns(UserWarning):
+        bin_x, bin_y, bin_dy, bin_n = bintools.uniform_tophat_mean(newx, x, y, dy=1.0, nan=True)
+    assert np.allclose(bin_x, newx)
+    assert np.allclose(bin_y[[0, 2]], [10.0, 10.0])
+    assert np.isnan(bin_y[1])
+    assert np.isnan(bin_n[1])
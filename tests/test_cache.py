@@ -0,0 +1,36 @@
+import os
+import pickle
+import numpy as np
+
+from pandexo.engine import cache
+
+def test_stale_pickle_is_a_miss(tmpdir):
+    store = cache.ResultCache(str(tmpdir))
+    #a result pickled by a module that no longer exists
+    with open(store._file('stale'), 'wb') as f:
+        f.write(b'\x80\x02cpandexo_removed\nOld\nq\x00)\x81q\x01.')
+    assert store.get('stale') is None
+    #and a class that is no longer in its module
+    with open(store._file('moved'), 'wb') as f:
+        f.write(b'\x80\x02cpandexo.engine.cache\nRemovedClass\nq\x00)\x81q\x01.')
+    assert store.get('moved') is None
+
+def test_put_get(tmpdir):
+    store = cache.ResultCache(str(tmpdir))
+    store.put('a', {'x': np.arange(3)})
+    assert np.all(store.get('a')['x'] == np.arange(3))
+    assert store.get('b') is None
+
+def test_evict_least_recently_used(tmpdir):
+    cache._root_sizes.pop(str(tmpdir), None)
+    #room for about three results
+    store = cache.ResultCache(str(tmpdir), max_size=3.5*8200/1024.0**2)
+    for i, key in enumerate(['a', 'b', 'c']):
+        store.put(key, np.zeros(1000))
+        os.utime(store._file(key), (i, i))
+    store.get('a')
+    store.put('d', np.zeros(1000))
+    assert store.get('b') is None
+    for key in ['a', 'c', 'd']:
+        assert store.get(key) is not None
+    assert cache._root_sizes[str(tmpdir)] <= store.max_size
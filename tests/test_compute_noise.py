@@ -0,0 +1,48 @@
+import warnings
+from types import SimpleNamespace
+import numpy as np
+import pytest
+
+from pandexo.engine.compute_noise import ExtractSpec
+
+timing = {"APT: Num Groups per Integration": 10, "Num Integrations Out of Transit": 20,
+          "Num Integrations In Transit": 10, "Seconds per Frame": 0.9}
+
+def fake_report(rate, bkg, rn):
+    """Minimal stand in for the parts of a pandeia report used by extract_region
+    """
+    signal = SimpleNamespace(rate=rate, rate_plus_bg=rate + bkg)
+    noise = SimpleNamespace(var_pix=rate + bkg + rn, stdev_pix=np.sqrt(rate + bkg + rn),
+                            var_rn_pix=rn)
+    return SimpleNamespace(signals=[signal], noise=noise)
+
+def random_profiles(seed, rows=40, cols=60):
+    rng = np.random.RandomState(seed)
+    y = np.arange(rows)[:, None]
+    cen = rows//2 + rng.randint(-3, 4)
+    width = rng.uniform(0.5, 6.0, cols)[None, :]
+    amp = rng.uniform(0.0, 1e3, cols)[None, :]
+    rate = amp*np.exp(-0.5*((y - cen)/width)**2) + rng.uniform(0, 1, (rows, cols))
+    #columns without signal and with a flat one
+    rate[:, 0] = 0.0
+    rate[:, 1] = 5.0
+    rate[cen, 2] = 1e4
+    bkg = rng.uniform(0, 5, (rows, cols))
+    bkg[:, 0] = 0.0
+    rn = rng.uniform(0.1, 2.0, (rows, cols))
+    rn[:, 0] = 0.0
+    return rate, bkg, rn
+
+@pytest.mark.parametrize('seed', range(5))
+def test_vector_matches_loop(seed):
+    rate, bkg, rn = random_profiles(seed)
+    out = fake_report(rate, bkg, rn)
+    inn = fake_report(0.99*rate, bkg, rn)
+    spec = ExtractSpec(inn, out, 10.0, 6, timing)
+    with warnings.catch_warnings():
+        #empty columns give 0/0
+        warnings.simplefilter('ignore', RuntimeWarning)
+        vector = spec.extract_region(method='vector')['bounds']
+        loop = spec.extract_region(method='loop')['bounds']
+    for key in ['LBout', 'UBout', 'LBin', 'UBin']:
+        assert np.array_equal(np.asarray(vector[key]), np.asarray(loop[key])), key
@@ -0,0 +1,20 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+fortgrid = pytest.importorskip('pandexo.engine.fortgrid')
+
+def test_duplicate_header_rows_use_the_first(tmpdir, monkeypatch):
+    monkeypatch.delenv('PANDEXO_CACHE', raising=False)
+    path = str(tmpdir.join('fortney.db'))
+    db = fortgrid.create_engine('sqlite:///' + path)
+    header = pd.DataFrame({'name': ['first', 'second'], 'temp': [1000.0, 1000.0],
+                           'noTiO': [True, True], 'ray': [0.0, 0.0], 'flat': [0.0, 0.0],
+                           'gravity': [25.0, 25.0]})
+    header.to_sql('header', db, index=False)
+    for i, name in enumerate(['first', 'second']):
+        pd.DataFrame({'wavelength': [1.0, 2.0], 'radius': [float(i), float(i)]}).to_sql(name, db, index=False)
+    db.dispose()
+
+    wave, radius = fortgrid.FortneyGrid(path).get(1000, True, 0, 0)
+    assert np.allclose(radius, 0.0)
@@ -0,0 +1,31 @@
+import os
+import numpy as np
+import pytest
+
+create = pytest.importorskip('pandexo.engine.create_input')
+
+#renorm_vegamag has to agree with pysynphot to within this before it can be the default
+tolerance = 1e-3
+
+reference_file = os.path.join(os.path.dirname(__file__), 'data', 'norm_reference.npz')
+
+@pytest.fixture(scope='module')
+def reference():
+    if not os.path.isfile(reference_file):
+        pytest.skip('No pysynphot reference values, run tests/make_norm_reference.py')
+    if os.environ.get('pandeia_refdata') is None:
+        pytest.skip('pandeia_refdata is not set')
+    with np.load(reference_file) as f:
+        return {k: f[k] for k in f.files}
+
+@pytest.mark.parametrize('filt', ['J', 'H', 'K'])
+@pytest.mark.parametrize('sed', ['phoenix_3500', 'phoenix_5500', 'phoenix_7000', 'blackbody_3000'])
+def test_renorm_vegamag_matches_pysynphot(reference, sed, filt):
+    wave = reference[sed + '_wave']
+    flux = reference[sed + '_flux']
+    expected = reference[sed + '_' + filt]
+    flux_norm = create.renorm_vegamag(wave, flux, float(reference['mag']), filt)
+    #phoenix spectra are zero at some wavelengths
+    good = expected > 0
+    diff = np.max(np.abs(flux_norm[good] - expected[good])/expected[good])
+    assert diff < tolerance
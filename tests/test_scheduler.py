@@ -0,0 +1,60 @@
+import time
+import pytest
+from concurrent.futures import Future
+
+from pandexo.engine.scheduler import FairScheduler, QueueFull
+
+class HeldExecutor():
+    """Executor that only records the order jobs are handed to it
+    """
+    def __init__(self):
+        self.started = []
+        self.futures = []
+
+    def submit(self, func, *args):
+        self.started.append(args[0])
+        future = Future()
+        self.futures.append(future)
+        return future
+
+    def finish_one(self):
+        self.futures.pop(0).set_result(None)
+
+def test_hst_first():
+    executor = HeldExecutor()
+    scheduler = FairScheduler(executor, 1)
+    scheduler.submit('a', 'jwst', print, 'busy')
+    scheduler.submit('a', 'jwst', print, 'jwst')
+    scheduler.submit('b', 'hst', print, 'hst')
+    executor.finish_one()
+    assert executor.started == ['busy', 'hst']
+
+def test_jwst_not_starved():
+    executor = HeldExecutor()
+    scheduler = FairScheduler(executor, 1, aging=0.1)
+    scheduler.submit('a', 'hst', print, 'busy')
+    scheduler.submit('a', 'jwst', print, 'jwst')
+    time.sleep(0.2)
+    scheduler.submit('b', 'hst', print, 'hst')
+    executor.finish_one()
+    assert executor.started == ['busy', 'jwst']
+
+def test_round_robin_users():
+    executor = HeldExecutor()
+    scheduler = FairScheduler(executor, 1)
+    scheduler.submit('a', 'jwst', print, 'busy')
+    scheduler.submit('a', 'jwst', print, 'a1')
+    scheduler.submit('a', 'jwst', print, 'a2')
+    scheduler.submit('b', 'jwst', print, 'b1')
+    for i in range(3):
+        executor.finish_one()
+    assert executor.started == ['busy', 'a1', 'b1', 'a2']
+
+def test_queue_full():
+    executor = HeldExecutor()
+    scheduler = FairScheduler(executor, 1, max_queue=1)
+    scheduler.submit('a', 'jwst', print, 'busy')
+    scheduler.submit('a', 'jwst', print, 'queued')
+    with pytest.raises(QueueFull) as e:
+        scheduler.submit('a', 'jwst', print, 'refused')
+    assert e.value.wait > 0
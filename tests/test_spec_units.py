@@ -0,0 +1,27 @@
+import numpy as np
+import pytest
+
+from pandexo.engine import spec_units
+
+def test_hz_to_micron():
+    #planet files in Hz used to come out in nm (3e17/nu), they should be in microns
+    nu = spec_units.c_micron/np.array([1.0, 2.0, 5.0])
+    wave = spec_units.wave_to_micron(nu, 'Hz')
+    assert np.allclose(wave, [1.0, 2.0, 5.0])
+
+@pytest.mark.parametrize('unit, factor', [('um', 1.0), ('nm', 1e-3), ('Angs', 1e-4), ('cm', 1e4)])
+def test_wave_to_micron(unit, factor):
+    wave = np.array([1.0, 2.0, 3.0])
+    assert np.allclose(spec_units.wave_to_micron(wave, unit), wave*factor)
+    #copy by default
+    assert np.allclose(wave, [1.0, 2.0, 3.0])
+
+def test_bad_unit():
+    with pytest.raises(Exception):
+        spec_units.wave_to_micron(np.array([1.0]), 'furlong')
+
+def test_sort_wave_after_hz():
+    nu = spec_units.c_micron/np.array([1.0, 2.0, 5.0])
+    wave, flux = spec_units.sort_wave(spec_units.wave_to_micron(nu, 'Hz'), np.array([1.0, 2.0, 3.0]))
+    assert np.allclose(wave, [1.0, 2.0, 5.0])
+    assert np.allclose(flux, [1.0, 2.0, 3.0])
@@ -0,0 +1,35 @@
+import threading
+import time
+import pytest
+
+from pandexo.engine import sweep
+
+def fail():
+    raise ValueError('bad point')
+
+def test_run_safe_raises_without_capture():
+    with pytest.raises(ValueError):
+        sweep.run_safe(fail, (), capture=False)
+
+def test_run_safe_captures():
+    result, error = sweep.run_safe(fail, ())
+    assert result is None
+    assert error['error'] == 'bad point'
+
+def test_run_safe_timeout():
+    result, error = sweep.run_safe(time.sleep, (2,), timeout=0.1)
+    assert result is None
+    assert error['secs'] < 1
+    with pytest.raises(Exception):
+        sweep.run_safe(time.sleep, (2,), timeout=0.1, capture=False)
+
+def test_run_safe_off_main_thread():
+    #no SIGALRM handler can be installed here, the call runs without the limit
+    out = []
+    def run():
+        with pytest.warns(UserWarning):
+            out.append(sweep.run_safe(sum, ([1, 2],), timeout=0.1))
+    t = threading.Thread(target=run)
+    t.start()
+    t.join()
+    assert out == [(3, None)]